@@ -1,8 +1,12 @@
 """Database configuration and session management."""
 
 from collections.abc import Generator
+from functools import lru_cache
 from os import getenv
 
+from app.utils.deadline import instrument_deadline
+from app.utils.metrics import instrument_engine
+from app.utils.query_profiler import instrument_queries
 from app.utils.test_database import get_test_engine, get_test_session
 from dotenv import load_dotenv
 from sqlmodel import Session, create_engine
@@ -31,7 +35,8 @@ def get_engine():
     Get the SQLModel engine.
 
     In test environments, returns the test engine if available.
-    Otherwise, creates a new engine using the database URL.
+    Otherwise, returns the process-wide engine for the database URL
+    (created on first use so that its connection pool is shared).
 
     Returns:
         Engine: The SQLModel engine instance
@@ -41,7 +46,17 @@ def get_engine():
     if test_engine is not None:
         return test_engine
 
-    return create_engine(get_database_url(), future=True)
+    return _create_engine(get_database_url())
+
+
+@lru_cache(maxsize=1)
+def _create_engine(database_url: str):
+    # 接続プールを共有するため、プロセスごとに1つだけ作る
+    engine = create_engine(database_url, future=True)
+    instrument_engine(engine)
+    instrument_queries(engine)
+    instrument_deadline(engine)
+    return engine
 
 
 def get_session() -> Generator[Session, None, None]:
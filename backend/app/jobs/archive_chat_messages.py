@@ -0,0 +1,53 @@
+"""保持期間を過ぎたチャットメッセージをアーカイブテーブルへ移すジョブ
+
+CHAT_RETENTION_DAYS 日より古いメッセージを chat_messages から
+chat_messages_archive へ CHAT_ARCHIVE_BATCH_SIZE 件ずつ移動します。
+CHAT_RETENTION_DAYS が 0（既定）の場合は何もしません。
+
+使い方:
+    uv run python -m app.jobs.archive_chat_messages
+"""
+
+import logging
+import os
+import sys
+from datetime import datetime, timedelta
+
+from app.repositories.chat_archive import archive_messages_batch
+from app.utils.database_utils import get_db_session
+from sqlmodel import Session
+
+logging.basicConfig(level=logging.INFO, stream=sys.stdout)
+logger = logging.getLogger(__name__)
+
+RETENTION_DAYS = int(os.getenv("CHAT_RETENTION_DAYS", "0"))
+BATCH_SIZE = int(os.getenv("CHAT_ARCHIVE_BATCH_SIZE", "1000"))
+
+
+def archive_old_messages(
+    session: Session,
+    retention_days: int = RETENTION_DAYS,
+    batch_size: int = BATCH_SIZE,
+) -> int:
+    """保持期間を過ぎたメッセージを全てアーカイブし、移動した件数を返す。"""
+    if retention_days <= 0:
+        return 0
+    cutoff = (datetime.now() - timedelta(days=retention_days)).timestamp()
+    total = 0
+    while moved := archive_messages_batch(session, cutoff, batch_size):
+        total += moved
+        logger.info("Archived %d chat messages (total %d)", moved, total)
+    return total
+
+
+def main() -> None:
+    if RETENTION_DAYS <= 0:
+        logger.info("CHAT_RETENTION_DAYS is not set; nothing to archive")
+        return
+    with get_db_session() as session:
+        total = archive_old_messages(session)
+    logger.info("Archived %d chat messages older than %d days", total, RETENTION_DAYS)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+"""チャットのメッセージ件数（ユーザ別・会話スレッド別）のずれを修正するジョブ
+
+使い方:
+    uv run python -m app.jobs.reconcile_chat_counters
+"""
+
+import logging
+import sys
+
+from app.repositories.chat_stats import reconcile_message_counts
+from app.utils.database_utils import get_db_session
+
+logging.basicConfig(level=logging.INFO, stream=sys.stdout)
+logger = logging.getLogger(__name__)
+
+
+def main() -> None:
+    with get_db_session() as session:
+        fixed = reconcile_message_counts(session)
+    logger.info("Reconciled chat message counters: %d rows fixed", fixed)
+
+
+if __name__ == "__main__":
+    main()
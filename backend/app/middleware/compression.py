@@ -0,0 +1,205 @@
+"""レスポンス圧縮ミドルウェア（gzip / brotli）
+
+- Accept-Encoding に応じて br → gzip の順で選ぶ
+- COMPRESSION_CONTENT_TYPES に含まれる Content-Type のみ圧縮する
+- 一括で返すレスポンスは COMPRESSION_MIN_SIZE バイト未満なら圧縮しない
+- StreamingResponse はチャンクごとに圧縮して即座に flush するため、
+  クライアントは受信しながら展開でき、送出が遅れることはない
+- text/event-stream（SSE）と既に Content-Encoding を持つレスポンスはそのまま通す
+- /api/chat/export?gzip=true は application/gzip で返るため、許可リスト外として
+  そのまま通す（二重圧縮しない）
+"""
+
+import os
+import zlib
+
+import brotli
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_CONTENT_TYPES = tuple(
+    t.strip()
+    for t in os.getenv(
+        "COMPRESSION_CONTENT_TYPES",
+        "application/json,application/x-ndjson,text/plain,text/html,text/csv",
+    ).split(",")
+    if t.strip()
+)
+GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+
+# 遅延なく逐次送出する必要があるため、常に圧縮対象外とする Content-Type
+NEVER_COMPRESS = ("text/event-stream",)
+
+
+def _accepted_encodings(accept_encoding: str) -> set[str]:
+    """Accept-Encoding から q=0 で拒否されていないエンコーディングを返す。"""
+    accepted = set()
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name and q > 0:
+            accepted.add(name)
+    return accepted
+
+
+def choose_encoding(accept_encoding: str) -> str | None:
+    accepted = _accepted_encodings(accept_encoding)
+    if "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+class _StreamCompressor:
+    """チャンクごとに圧縮し、都度 flush して出力する。"""
+
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._br = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._gz = zlib.compressobj(gzip_level, wbits=31)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._br.process(data) + self._br.flush()
+        return self._gz.compress(data) + self._gz.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._br.finish()
+        return self._gz.flush()
+
+
+def compress_body(
+    encoding: str, body: bytes, gzip_level: int, brotli_quality: int
+) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=brotli_quality)
+    compressor = zlib.compressobj(gzip_level, wbits=31)
+    return compressor.compress(body) + compressor.flush()
+
+
+class CompressionMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = COMPRESSION_MIN_SIZE,
+        content_types: tuple[str, ...] = COMPRESSION_CONTENT_TYPES,
+        gzip_level: int = GZIP_LEVEL,
+        brotli_quality: int = BROTLI_QUALITY,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.content_types = content_types
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = _CompressionResponder(self, encoding, send)
+        await self.app(scope, receive, responder.send)
+
+    def is_compressible(self, headers: Headers) -> bool:
+        if "content-encoding" in headers:
+            return False
+        content_type = headers.get("content-type", "").split(";")[0].strip().lower()
+        if content_type in NEVER_COMPRESS:
+            return False
+        return content_type in self.content_types
+
+
+class _CompressionResponder:
+    """1レスポンス分の送信を仲介し、必要に応じて本文を圧縮する。"""
+
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send: Send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self._send = send
+        self.start_message: Message | None = None
+        self.passthrough = False
+        self.compressor: _StreamCompressor | None = None
+
+    async def send(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            if self.middleware.is_compressible(headers):
+                # 本文の最初のチャンクを見るまで送出を保留する
+                self.start_message = message
+            else:
+                self.passthrough = True
+                await self._send(message)
+            return
+
+        if (
+            self.passthrough
+            or message["type"] != "http.response.body"
+            or self.start_message is None
+        ):
+            await self._send(message)
+            return
+
+        if self.compressor is None:
+            await self._send_first(message)
+        else:
+            await self._send_chunk(message)
+
+    async def _send_first(self, message: Message) -> None:
+        start = self.start_message
+        headers = MutableHeaders(raw=start["headers"])
+        headers.add_vary_header("Accept-Encoding")
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        middleware = self.middleware
+
+        if not more_body:
+            # 一括で返すレスポンス: 閾値未満ならそのまま返す
+            self.passthrough = True
+            if len(body) >= middleware.minimum_size:
+                body = compress_body(
+                    self.encoding,
+                    body,
+                    middleware.gzip_level,
+                    middleware.brotli_quality,
+                )
+                headers["Content-Encoding"] = self.encoding
+                headers["Content-Length"] = str(len(body))
+                message = {**message, "body": body}
+            await self._send(start)
+            await self._send(message)
+            return
+
+        # ストリーミング: 長さは事前に分からないため Content-Length を外す
+        headers["Content-Encoding"] = self.encoding
+        if "content-length" in headers:
+            del headers["Content-Length"]
+        self.compressor = _StreamCompressor(
+            self.encoding, middleware.gzip_level, middleware.brotli_quality
+        )
+        await self._send(start)
+        await self._send_chunk(message)
+
+    async def _send_chunk(self, message: Message) -> None:
+        more_body = message.get("more_body", False)
+        chunk = self.compressor.compress(message.get("body", b""))
+        if not more_body:
+            chunk += self.compressor.finish()
+        await self._send(
+            {"type": "http.response.body", "body": chunk, "more_body": more_body}
+        )
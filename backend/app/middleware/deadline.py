@@ -0,0 +1,116 @@
+"""リクエストの期限とクライアント切断でのキャンセル
+
+X-Request-Timeout ヘッダ（秒。なければ REQUEST_TIMEOUT_SECONDS）からリクエストの
+期限を決め、アプリの処理を別タスクで実行します。
+
+- 応答の送信を始める前に期限を過ぎた場合は、処理をキャンセルして 504 を返す
+- 応答の送信を始めた時点で期限を外す（StreamingResponse の生成中に行う DB の
+  クエリ・LLM の呼び出しは期限で中断しない）
+- 応答を送り終える前にクライアントが切断した場合は、処理をキャンセルする
+
+履歴のインポート（POST /api/chat/imports/{id}）は本文の受信に時間がかかるため
+期限を設けません（切断はアップロードの読み込みで検知され、ジョブは failed になる）。
+
+キャンセルで止まるのはイベントループ上の待ちです。スレッドプールで実行中の
+同期処理は止められないため、DB のクエリと LLM の呼び出しには期限までの残り時間を
+タイムアウトとして渡しています（app.utils.deadline）。
+"""
+
+import asyncio
+import time
+from contextlib import suppress
+
+from app.utils.deadline import (
+    REQUEST_TIMEOUT_HEADER,
+    clear_deadline,
+    deadline_after,
+    is_deadline_error,
+    parse_timeout,
+)
+from app.utils.responses import FastJSONResponse
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# 期限を設けないリクエスト（メソッド, パスの接頭辞）
+_NO_DEADLINE = (("POST", "/api/chat/imports/"),)
+
+
+def has_deadline(scope: Scope) -> bool:
+    path, method = scope.get("path", ""), scope.get("method")
+    return not any(
+        method == rule_method and path.startswith(prefix)
+        for rule_method, prefix in _NO_DEADLINE
+    )
+
+
+class DeadlineMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not has_deadline(scope):
+            await self.app(scope, receive, send)
+            return
+
+        timeout = parse_timeout(Headers(scope=scope).get(REQUEST_TIMEOUT_HEADER))
+        response_started = False
+        response_complete = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal response_started, response_complete
+            if message["type"] == "http.response.start":
+                response_started = True
+                # 送信しているタスク（以降に本文を生成する）のコンテキストから期限を外す
+                clear_deadline()
+            elif message["type"] == "http.response.body":
+                response_complete = not message.get("more_body", False)
+            await send(message)
+
+        # 受信はこのミドルウェアが行い、アプリへはキューで渡す（切断を検知するため）
+        messages: asyncio.Queue[Message] = asyncio.Queue(maxsize=1)
+
+        with deadline_after(timeout) as deadline:
+            # 作成時の contextvar（期限）がタスクへ引き継がれる
+            app_task = asyncio.create_task(self.app(scope, messages.get, send_wrapper))
+
+        async def read_until_disconnect() -> None:
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    if not response_complete:
+                        app_task.cancel()
+                    return
+                await messages.put(message)
+
+        reader = asyncio.create_task(read_until_disconnect())
+        expired = False
+        try:
+            done, _ = await asyncio.wait({app_task}, timeout=timeout)
+            if not done and not response_started:
+                expired = True
+                app_task.cancel()
+            try:
+                await app_task
+            except asyncio.CancelledError:
+                # 期限切れ・切断によるキャンセル（サーバの停止によるものは伝える）
+                if asyncio.current_task().cancelling():
+                    raise
+            except Exception as exc:
+                # 期限切れで中断したクエリなどのエラーだけを 504 にする（他のエラーは伝える）
+                if (
+                    response_started
+                    or time.monotonic() < deadline
+                    or not is_deadline_error(exc)
+                ):
+                    raise
+                expired = True
+        finally:
+            reader.cancel()
+            with suppress(asyncio.CancelledError):
+                await reader
+
+        if expired and not response_started:
+            response = FastJSONResponse(
+                {"detail": "Deadline exceeded"}, status_code=504
+            )
+            await response(scope, receive, send)
@@ -0,0 +1,183 @@
+"""同時処理数の上限と負荷遮断（load shedding）のミドルウェア
+
+ワーカーごとに処理中のリクエスト数を LOAD_SHED_MAX_IN_FLIGHT までに抑えます。
+DB や LLM が遅くなって処理中のリクエストが溜まった場合でも、上限を超えた分は
+処理を始める前に 503 と Retry-After で断るため、受け付けたリクエストの
+レイテンシは保たれます。
+
+リクエストはパスで優先度に分け、優先度ごとに使える枠の割合と待てる時間を変えます。
+
+- critical（/api/health, /metrics）: 上限の対象外（監視が負荷で失敗しないように）
+- high（/api/auth, /api/admin）: 上限まで使える。空きを最大 LOAD_SHED_QUEUE_TIMEOUT_MS 待つ
+- normal（その他）: 上限の 80% まで。空きを最大 LOAD_SHED_QUEUE_TIMEOUT_MS 待つ
+- low（チャット送信・インポート・エクスポート）: 上限の 50% まで。待たずに断る
+
+枠が空くと優先度の高い順に待っているリクエストへ渡します。待ち時間は
+http_request_queue_seconds、断った件数は http_requests_shed_total に記録します。
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+
+from app.utils.metrics import (
+    HTTP_ADMISSION,
+    HTTP_QUEUE_WAIT,
+    HTTP_SHED,
+    Snapshot,
+    registry,
+)
+from app.utils.responses import FastJSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+LOAD_SHED_MAX_IN_FLIGHT = int(os.getenv("LOAD_SHED_MAX_IN_FLIGHT", "64"))
+LOAD_SHED_MAX_QUEUE = int(os.getenv("LOAD_SHED_MAX_QUEUE", "128"))
+LOAD_SHED_QUEUE_TIMEOUT_MS = float(os.getenv("LOAD_SHED_QUEUE_TIMEOUT_MS", "500"))
+LOAD_SHED_RETRY_AFTER = int(os.getenv("LOAD_SHED_RETRY_AFTER", "2"))
+
+CRITICAL, HIGH, NORMAL, LOW = "critical", "high", "normal", "low"
+PRIORITIES = (HIGH, NORMAL, LOW)  # 枠を渡す順
+SHARES = {HIGH: 1.0, NORMAL: 0.8, LOW: 0.5}
+QUEUE_TIMEOUTS = {
+    HIGH: LOAD_SHED_QUEUE_TIMEOUT_MS / 1000,
+    NORMAL: LOAD_SHED_QUEUE_TIMEOUT_MS / 1000,
+    LOW: 0.0,
+}
+
+# (メソッド（None なら全て）, パスの接頭辞, 優先度)。先に一致したものを使う
+_RULES = (
+    (None, "/api/health", CRITICAL),
+    (None, "/metrics", CRITICAL),
+    (None, "/api/auth/", HIGH),
+    (None, "/api/admin/", HIGH),
+    ("POST", "/api/chat/imports", LOW),
+    (None, "/api/chat/export", LOW),
+)
+
+
+def priority_of(scope: Scope) -> str:
+    path, method = scope["path"], scope["method"]
+    if method == "POST" and path == "/api/chat":
+        return LOW
+    for rule_method, prefix, priority in _RULES:
+        if (rule_method is None or rule_method == method) and path.startswith(prefix):
+            return priority
+    return NORMAL
+
+
+class LoadShedder:
+    """優先度付きの同時処理数の上限。イベントループのスレッドからのみ使う。"""
+
+    def __init__(
+        self,
+        max_in_flight: int = LOAD_SHED_MAX_IN_FLIGHT,
+        max_queue: int = LOAD_SHED_MAX_QUEUE,
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self._waiters: dict[str, deque[asyncio.Future]] = {
+            p: deque() for p in PRIORITIES
+        }
+
+    @property
+    def queued(self) -> int:
+        return sum(len(waiters) for waiters in self._waiters.values())
+
+    def _limit(self, priority: str) -> int:
+        return max(1, int(self.max_in_flight * SHARES[priority]))
+
+    def _has_waiters(self, priority: str) -> bool:
+        # 同じか高い優先度で待っているリクエストを追い越さない
+        for p in PRIORITIES:
+            if self._waiters[p]:
+                return True
+            if p == priority:
+                return False
+        return False
+
+    async def acquire(self, priority: str, timeout: float) -> bool:
+        """枠を1つ取る。timeout 秒以内に取れなければ False を返す。"""
+        if self.in_flight < self._limit(priority) and not self._has_waiters(priority):
+            self.in_flight += 1
+            return True
+        if timeout <= 0 or self.queued >= self.max_queue:
+            return False
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[priority].append(future)
+        try:
+            await asyncio.wait({future}, timeout=timeout)
+        except asyncio.CancelledError:
+            # 待っている間にクライアントが切断した
+            if future.done():
+                self.release()
+            else:
+                self._give_up(priority, future)
+            raise
+        if future.done():
+            return True
+        self._give_up(priority, future)
+        return False
+
+    def _give_up(self, priority: str, future: asyncio.Future) -> None:
+        future.cancel()
+        self._waiters[priority].remove(future)
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        for priority in PRIORITIES:
+            waiters = self._waiters[priority]
+            while waiters and self.in_flight < self._limit(priority):
+                future = waiters.popleft()
+                if not future.done():
+                    self.in_flight += 1
+                    future.set_result(None)
+
+
+shedder = LoadShedder()
+
+
+def _collect_admission() -> Snapshot:
+    return {
+        HTTP_ADMISSION.name: [
+            (("in_flight",), float(shedder.in_flight)),
+            (("queued",), float(shedder.queued)),
+        ]
+    }
+
+
+registry.add_collector(_collect_admission)
+
+
+class LoadSheddingMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or shedder.max_in_flight <= 0:
+            await self.app(scope, receive, send)
+            return
+        priority = priority_of(scope)
+        if priority == CRITICAL:
+            await self.app(scope, receive, send)
+            return
+
+        current = shedder
+        started = time.perf_counter()
+        admitted = await current.acquire(priority, QUEUE_TIMEOUTS[priority])
+        HTTP_QUEUE_WAIT.observe(time.perf_counter() - started, priority)
+        if not admitted:
+            HTTP_SHED.inc(priority)
+            response = FastJSONResponse(
+                {"detail": "Server is overloaded"},
+                status_code=503,
+                headers={"Retry-After": str(LOAD_SHED_RETRY_AFTER)},
+            )
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current.release()
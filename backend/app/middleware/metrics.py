@@ -0,0 +1,87 @@
+"""リクエストのメトリクス記録ミドルウェア
+
+ルート単位（/api/chat/imports/{job_id} のようなパス定義）でリクエスト数・
+レイテンシ・処理中の件数を記録します。実際のパスをラベルにすると
+系列数が際限なく増えるため、ルーティング後に Starlette が scope["route"]
+へ設定するルートのパス定義を使い、どのルートにも一致しないリクエストは
+"<unmatched>" にまとめます。
+
+処理中の件数は、処理中のリクエストの scope を保持しておき /metrics の
+出力時に数えます。ルーティング後に scope へ設定される値を使うため、
+ルート解決のためにリクエストごとにルート表を走査する必要がありません。
+"""
+
+import re
+import time
+from collections import Counter
+
+from app.utils.metrics import (
+    HTTP_IN_FLIGHT,
+    HTTP_LATENCY,
+    HTTP_REQUESTS,
+    Snapshot,
+    registry,
+)
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+UNMATCHED_ROUTE = "<unmatched>"
+_CONVERTER = re.compile(r":[^{}]*}")
+
+# id(scope) -> scope。イベントループのスレッドからのみ書き換える
+_active: dict[int, Scope] = {}
+
+
+def route_label(scope: Scope) -> str:
+    """ルーティング済みの scope から、ルートのパス定義を返す。
+
+    {path:path} のような変換指定は {path} にそろえる。
+    """
+    route = scope.get("route")
+    if route is None:
+        return UNMATCHED_ROUTE
+    # ルーターを遅延で組み込む FastAPI では scope["route"] が include_router の
+    # 接頭辞を含まないため、組み込み後のパス定義があればそちらを使う
+    context = scope.get("fastapi", {}).get("effective_route_context")
+    path = getattr(context, "path", None) or getattr(route, "path", None)
+    if not path:
+        return UNMATCHED_ROUTE
+    return _CONVERTER.sub("}", path)
+
+
+def _collect_in_flight() -> Snapshot:
+    counts = Counter(
+        (scope["method"], route_label(scope)) for scope in _active.copy().values()
+    )
+    return {HTTP_IN_FLIGHT.name: [(labels, float(n)) for labels, n in counts.items()]}
+
+
+registry.add_collector(_collect_in_flight)
+
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        key = id(scope)
+        _active[key] = scope
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            del _active[key]
+            method, route = scope["method"], route_label(scope)
+            HTTP_LATENCY.observe(time.perf_counter() - started, method, route)
+            HTTP_REQUESTS.inc(method, route, str(status_code))
@@ -0,0 +1,48 @@
+"""オンデマンドのサンプリングプロファイラ
+
+次のリクエストをプロファイルし、レスポンスに X-Profile-Id を付けます。
+結果は /api/admin/profiles/{id} で取得します。
+
+- X-Profile ヘッダに ADMIN_TOKEN を指定したリクエスト
+- PROFILER_SAMPLE_RATE（0〜1）の割合で無作為に選んだリクエスト
+"""
+
+import random
+import threading
+
+from app.services.auth import is_admin_token
+from app.utils import profiler
+from app.utils.profiler import sampler
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+PROFILE_HEADER = "x-profile"
+
+
+def _should_profile(scope: Scope) -> bool:
+    if is_admin_token(Headers(scope=scope).get(PROFILE_HEADER)):
+        return True
+    rate = profiler.PROFILER_SAMPLE_RATE
+    return rate > 0 and random.random() < rate
+
+
+class ProfilerMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not _should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = sampler.start(scope["method"], scope["path"], threading.get_ident())
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append("X-Profile-Id", str(profile.id))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.stop(profile)
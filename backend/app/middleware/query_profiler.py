@@ -0,0 +1,45 @@
+"""リクエストごとの SQL プロファイルを取るミドルウェア
+
+DEBUG=true のときは、レスポンスに Server-Timing ヘッダ（クエリ件数と合計時間）を
+付け、遅い順のクエリをログ（DEBUG レベル）へ出力します。ヘッダはレスポンスの
+送信開始時点の値のため、StreamingResponse の送信中に実行されたクエリは含みません。
+"""
+
+import logging
+
+from app.utils import query_profiler
+from app.utils.query_profiler import profile_queries
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+
+class QueryProfilerMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with profile_queries() as profile:
+
+            async def send_wrapper(message: Message) -> None:
+                if message["type"] == "http.response.start" and query_profiler.DEBUG:
+                    headers = MutableHeaders(scope=message)
+                    headers.append("Server-Timing", profile.server_timing())
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
+
+        if query_profiler.DEBUG and profile.count:
+            logger.debug(
+                "%s %s: %d queries in %.1f ms; slowest: %s",
+                scope["method"],
+                scope["path"],
+                profile.count,
+                profile.total_seconds * 1000,
+                [(round(s * 1000, 1), sql) for s, sql in profile.slowest],
+            )
@@ -0,0 +1,47 @@
+"""add chat message search index
+
+Revision ID: 157ce9ed9315
+Revises: 7c2a4b5bf1a1
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "157ce9ed9315"
+down_revision: Union[str, None] = "7c2a4b5bf1a1"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == "postgresql":
+        op.execute("ALTER TABLE chat_messages ADD COLUMN search_vector tsvector")
+        op.execute(
+            "UPDATE chat_messages SET search_vector = to_tsvector('simple', content)"
+        )
+        op.execute(
+            "CREATE INDEX ix_chat_messages_search_vector "
+            "ON chat_messages USING gin (search_vector)"
+        )
+    elif dialect == "sqlite":
+        op.execute(
+            "CREATE VIRTUAL TABLE chat_messages_fts USING fts5(content, owner)"
+        )
+        op.execute(
+            "INSERT INTO chat_messages_fts (rowid, content, owner) "
+            "SELECT id, content, 'u' || user_id FROM chat_messages"
+        )
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == "postgresql":
+        op.execute("DROP INDEX IF EXISTS ix_chat_messages_search_vector")
+        op.execute("ALTER TABLE chat_messages DROP COLUMN search_vector")
+    elif dialect == "sqlite":
+        op.execute("DROP TABLE IF EXISTS chat_messages_fts")
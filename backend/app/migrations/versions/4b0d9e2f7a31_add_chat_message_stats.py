@@ -0,0 +1,36 @@
+"""add chat message stats
+
+Revision ID: 4b0d9e2f7a31
+Revises: e3ea5605cbec
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "4b0d9e2f7a31"
+down_revision: Union[str, None] = "e3ea5605cbec"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "chat_message_stats",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("message_count", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"], ),
+        sa.PrimaryKeyConstraint("user_id"),
+    )
+    op.execute(
+        "INSERT INTO chat_message_stats (user_id, message_count) "
+        "SELECT user_id, COUNT(*) FROM chat_messages GROUP BY user_id"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("chat_message_stats")
@@ -0,0 +1,35 @@
+"""add chat message stats archived count
+
+Revision ID: 5c9e2a7f4d18
+Revises: 8a3f5d1c7b92
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "5c9e2a7f4d18"
+down_revision: Union[str, None] = "8a3f5d1c7b92"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "chat_message_stats",
+        sa.Column("archived_count", sa.Integer(), nullable=False, server_default="0"),
+    )
+    op.execute(
+        "UPDATE chat_message_stats SET archived_count = ("
+        "SELECT count(*) FROM chat_messages_archive a "
+        "WHERE a.user_id = chat_message_stats.user_id)"
+    )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("chat_message_stats") as batch_op:
+        batch_op.drop_column("archived_count")
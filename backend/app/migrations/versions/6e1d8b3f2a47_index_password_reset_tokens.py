@@ -0,0 +1,50 @@
+"""index password reset tokens
+
+Revision ID: 6e1d8b3f2a47
+Revises: b3f7c2a9d5e4
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "6e1d8b3f2a47"
+down_revision: Union[str, None] = "b3f7c2a9d5e4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.drop_index(
+        op.f("ix_password_reset_tokens_token_hash"), table_name="password_reset_tokens"
+    )
+    op.create_index(
+        op.f("ix_password_reset_tokens_token_hash"),
+        "password_reset_tokens",
+        ["token_hash"],
+        unique=True,
+    )
+    op.create_index(
+        "ix_password_reset_tokens_expires_at_id",
+        "password_reset_tokens",
+        ["expires_at", "id"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        "ix_password_reset_tokens_expires_at_id", table_name="password_reset_tokens"
+    )
+    op.drop_index(
+        op.f("ix_password_reset_tokens_token_hash"), table_name="password_reset_tokens"
+    )
+    op.create_index(
+        op.f("ix_password_reset_tokens_token_hash"),
+        "password_reset_tokens",
+        ["token_hash"],
+        unique=False,
+    )
@@ -0,0 +1,48 @@
+"""chat messages sqlite autoincrement
+
+Revision ID: 8a3f5d1c7b92
+Revises: 6e1d8b3f2a47
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "8a3f5d1c7b92"
+down_revision: Union[str, None] = "6e1d8b3f2a47"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # PostgreSQL のシーケンスは ID を再利用しないため、SQLite のみ変更する
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    with op.batch_alter_table(
+        "chat_messages",
+        recreate="always",
+        table_kwargs={"sqlite_autoincrement": True},
+    ):
+        pass
+    # アーカイブへ移したものを含め、これまでに使った最大の ID から採番を続ける
+    op.execute("DELETE FROM sqlite_sequence WHERE name = 'chat_messages'")
+    op.execute(
+        "INSERT INTO sqlite_sequence (name, seq) SELECT 'chat_messages', max(id) "
+        "FROM (SELECT max(id) AS id FROM chat_messages "
+        "UNION ALL SELECT max(id) FROM chat_messages_archive) "
+        "HAVING max(id) IS NOT NULL"
+    )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    with op.batch_alter_table(
+        "chat_messages",
+        recreate="always",
+        table_kwargs={"sqlite_autoincrement": False},
+    ):
+        pass
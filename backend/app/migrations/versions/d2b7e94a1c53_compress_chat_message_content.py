@@ -0,0 +1,151 @@
+"""compress chat message content
+
+Revision ID: d2b7e94a1c53
+Revises: c84e1f6b9a20
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+from app.utils.compression import compress_text, decompress_text
+
+# revision identifiers, used by Alembic.
+revision: str = "d2b7e94a1c53"
+down_revision: Union[str, None] = "c84e1f6b9a20"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ("chat_messages", "chat_messages_archive")
+BATCH_SIZE = 1000
+# 列の入れ替えで ACCESS EXCLUSIVE ロックを待つ上限（長いクエリの後ろで全体を止めない）
+SWAP_LOCK_TIMEOUT = "5s"
+
+
+def _rewrite(table: str, where: str, convert) -> None:
+    """where に該当する行の content を id 順にバッチで書き換える。"""
+    bind = op.get_bind()
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.text(
+                f"SELECT id, content FROM {table} "
+                f"WHERE id > :last_id AND {where} ORDER BY id LIMIT :limit"
+            ),
+            {"last_id": last_id, "limit": BATCH_SIZE},
+        ).all()
+        if not rows:
+            return
+        bind.execute(
+            sa.text(f"UPDATE {table} SET content = :content WHERE id = :id"),
+            [{"id": r.id, "content": convert(r.content)} for r in rows],
+        )
+        last_id = rows[-1].id
+
+
+def _add_shadow_column(table: str) -> None:
+    """bytea の content_z 列を追加し、以降の書き込みをトリガーで反映する。
+
+    列の追加・NOT VALID の制約・トリガーの作成はいずれも表を書き換えないため、
+    ロックは一瞬で済みます。トリガーは無圧縮タグ付きの値を書き込みます。
+    """
+    op.execute(f"ALTER TABLE {table} ADD COLUMN content_z bytea")
+    op.execute(
+        f"ALTER TABLE {table} ADD CONSTRAINT {table}_content_z_not_null "
+        "CHECK (content_z IS NOT NULL) NOT VALID"
+    )
+    op.execute(
+        f"CREATE FUNCTION {table}_content_z_sync() RETURNS trigger AS $$ "
+        "BEGIN NEW.content_z := '\\x00'::bytea || convert_to(NEW.content, 'UTF8'); "
+        "RETURN NEW; END $$ LANGUAGE plpgsql"
+    )
+    op.execute(
+        f"CREATE TRIGGER {table}_content_z_sync "
+        f"BEFORE INSERT OR UPDATE OF content ON {table} "
+        f"FOR EACH ROW EXECUTE FUNCTION {table}_content_z_sync()"
+    )
+
+
+def _backfill(table: str) -> None:
+    """content_z が未設定の行を id 順に圧縮して埋める（autocommit でバッチごとに確定）。"""
+    bind = op.get_bind()
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.text(
+                f"SELECT id, content FROM {table} "
+                "WHERE id > :last_id AND content_z IS NULL ORDER BY id LIMIT :limit"
+            ),
+            {"last_id": last_id, "limit": BATCH_SIZE},
+        ).all()
+        if not rows:
+            return
+        # 読んだ後に更新された行はトリガーが設定済みのため上書きしない
+        bind.execute(
+            sa.text(
+                f"UPDATE {table} SET content_z = :content "
+                "WHERE id = :id AND content_z IS NULL"
+            ),
+            [{"id": r.id, "content": compress_text(r.content)} for r in rows],
+        )
+        last_id = rows[-1].id
+
+
+def _swap_columns(table: str) -> None:
+    """content_z を content に入れ替える。
+
+    検証済みの CHECK 制約があるため SET NOT NULL は表を走査せず、
+    カタログの更新だけで終わります。
+    """
+    op.execute(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}'")
+    op.execute(f"DROP TRIGGER {table}_content_z_sync ON {table}")
+    op.execute(f"DROP FUNCTION {table}_content_z_sync()")
+    op.execute(f"ALTER TABLE {table} DROP COLUMN content")
+    op.execute(f"ALTER TABLE {table} RENAME COLUMN content_z TO content")
+    op.execute(f"ALTER TABLE {table} ALTER COLUMN content SET NOT NULL")
+    op.execute(f"ALTER TABLE {table} DROP CONSTRAINT {table}_content_z_not_null")
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        # SQLite は列の型を変えずに値だけ BLOB へ置き換える
+        for table in TABLES:
+            _rewrite(
+                table,
+                "typeof(content) = 'text'",
+                lambda v: compress_text(decompress_text(v)),
+            )
+        return
+
+    # ALTER COLUMN ... TYPE は表全体を ACCESS EXCLUSIVE ロック下で書き換えるため、
+    # 新しい列を追加してバッチで埋め、最後に短いトランザクションで入れ替える
+    for table in TABLES:
+        _add_shadow_column(table)
+    with op.get_context().autocommit_block():
+        for table in TABLES:
+            _backfill(table)
+            op.execute(
+                f"ALTER TABLE {table} VALIDATE CONSTRAINT {table}_content_z_not_null"
+            )
+    for table in TABLES:
+        _swap_columns(table)
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    for table in TABLES:
+        if dialect == "postgresql":
+            # 切り戻し用のため、表の書き換えを伴う ALTER COLUMN ... TYPE で戻す
+            _rewrite(
+                table,
+                "substring(content from 1 for 1) <> '\\x00'::bytea",
+                lambda v: b"\x00" + decompress_text(v).encode(),
+            )
+            op.execute(
+                f"ALTER TABLE {table} ALTER COLUMN content TYPE varchar "
+                "USING convert_from(substring(content from 2), 'UTF8')"
+            )
+        else:
+            _rewrite(table, "typeof(content) = 'blob'", decompress_text)
@@ -0,0 +1,59 @@
+"""add conversations
+
+Revision ID: e3ea5605cbec
+Revises: 157ce9ed9315
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+import sqlmodel
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "e3ea5605cbec"
+down_revision: Union[str, None] = "157ce9ed9315"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "conversations",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.Float(), nullable=False),
+        sa.Column("title", sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+        sa.Column("last_message_at", sa.Float(), nullable=False),
+        sa.Column("message_count", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"], ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_conversations_user_id_last_message_at", "conversations", ["user_id", "last_message_at"], unique=False)
+
+    with op.batch_alter_table("chat_messages") as batch_op:
+        batch_op.add_column(sa.Column("conversation_id", sa.Integer(), nullable=True))
+        batch_op.create_foreign_key("fk_chat_messages_conversation_id", "conversations", ["conversation_id"], ["id"])
+    op.create_index("ix_chat_messages_conversation_id_created_at", "chat_messages", ["conversation_id", "created_at"], unique=False)
+
+    # 既存の履歴はユーザごとに1つの会話スレッドへまとめる
+    op.execute(
+        "INSERT INTO conversations (user_id, created_at, last_message_at, message_count) "
+        "SELECT user_id, MIN(created_at), MAX(created_at), COUNT(*) "
+        "FROM chat_messages GROUP BY user_id"
+    )
+    op.execute(
+        "UPDATE chat_messages SET conversation_id = ("
+        "SELECT c.id FROM conversations c WHERE c.user_id = chat_messages.user_id)"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_chat_messages_conversation_id_created_at", table_name="chat_messages")
+    with op.batch_alter_table("chat_messages") as batch_op:
+        batch_op.drop_constraint("fk_chat_messages_conversation_id", type_="foreignkey")
+        batch_op.drop_column("conversation_id")
+    op.drop_index("ix_conversations_user_id_last_message_at", table_name="conversations")
+    op.drop_table("conversations")
@@ -0,0 +1,34 @@
+"""add version markers for etags
+
+Revision ID: f4a8c3e51b72
+Revises: d2b7e94a1c53
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "f4a8c3e51b72"
+down_revision: Union[str, None] = "d2b7e94a1c53"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "users",
+        sa.Column("version", sa.Integer(), nullable=False, server_default="1"),
+    )
+    op.add_column(
+        "chat_message_stats",
+        sa.Column("version", sa.Integer(), nullable=False, server_default="0"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("chat_message_stats", "version")
+    op.drop_column("users", "version")
@@ -1,14 +1,17 @@
 from datetime import datetime
+from typing import Literal
 
 from pydantic import BaseModel
 
 
 class ChatRequestModel(BaseModel):
     prompt: str
+    conversation_id: int | None = None
 
 
 class ChatResponseModel(BaseModel):
     response: str
+    conversation_id: int | None = None
 
 
 class ChatMessageModel(BaseModel):
@@ -25,3 +28,56 @@ class ChatMessageModel(BaseModel):
 class ChatHistoryResponseModel(BaseModel):
     total: int
     messages: list[ChatMessageModel]
+    next_cursor: str | None = None
+
+
+class ChatSearchHitModel(BaseModel):
+    id: int
+    role: str
+    snippet: str
+    created_at: float
+    rank: float
+
+
+class ChatSearchResponseModel(BaseModel):
+    hits: list[ChatSearchHitModel]
+    next_cursor: str | None = None
+
+
+class ConversationCreateModel(BaseModel):
+    title: str | None = None
+
+
+class ConversationModel(BaseModel):
+    id: int
+    title: str | None = None
+    created_at: float
+    last_message_at: float
+    message_count: int
+
+
+class ConversationListResponseModel(BaseModel):
+    conversations: list[ConversationModel]
+
+
+class ChatImportLineModel(BaseModel):
+    """インポートする NDJSON の1行"""
+
+    role: Literal["user", "assistant"]
+    content: str
+    created_at: float | None = None
+
+
+class ChatImportCreateModel(BaseModel):
+    conversation_id: int | None = None
+
+
+class ChatImportJobModel(BaseModel):
+    id: int
+    status: str
+    conversation_id: int
+    lines_committed: int
+    messages_imported: int
+    error: str | None = None
+    created_at: float
+    updated_at: float
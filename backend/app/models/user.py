@@ -5,7 +5,8 @@ from pydantic import BaseModel
 
 class UserModel(BaseModel):
     uuid: UUID
-    email: str
+    # Clerk のユーザは主メールアドレスを持たない場合がある（users.email は NULL 可）
+    email: str | None = None
     name: str | None = None
 
 
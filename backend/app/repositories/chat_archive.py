@@ -0,0 +1,116 @@
+from collections import Counter
+
+from app.repositories.chat_search import delete_index_entries
+from app.repositories.chat_stats import increment_archived_count
+from app.schema import ChatMessage, ChatMessageArchive, User
+from sqlalchemy import Row, and_, delete, insert, or_
+from sqlmodel import Session, select
+
+ARCHIVE_COLUMNS = ["id", "created_at", "role", "content", "user_id", "conversation_id"]
+
+
+def before_cursor(model, before: tuple[float, int]):
+    """(created_at, id) が before より前の行に絞る条件を返す。
+
+    ページは (created_at, id) 順に並ぶため、カーソルも同じキーで比較する。
+    インポートした過去のメッセージのように id と created_at の大小が
+    一致しない行があっても、取りこぼさずに遡れます。
+    """
+    created_at, message_id = before
+    return or_(
+        model.created_at < created_at,
+        and_(model.created_at == created_at, model.id < message_id),
+    )
+
+
+def archive_messages_batch(session: Session, cutoff: float, batch_size: int) -> int:
+    """cutoff より古いメッセージを最大 batch_size 件アーカイブへ移し、件数を返す。
+
+    1バッチを1トランザクションで処理するため、長時間のロックを避けつつ
+    途中で中断しても再実行で続きから処理できます。
+    """
+    rows = session.exec(
+        select(ChatMessage.id, ChatMessage.user_id)
+        .where(ChatMessage.created_at < cutoff)
+        .order_by(ChatMessage.id)
+        .limit(batch_size)
+    ).all()
+    if not rows:
+        return 0
+    ids = [row.id for row in rows]
+
+    columns = [getattr(ChatMessage, c) for c in ARCHIVE_COLUMNS]
+    session.execute(
+        insert(ChatMessageArchive).from_select(
+            ARCHIVE_COLUMNS, select(*columns).where(ChatMessage.id.in_(ids))
+        )
+    )
+    delete_index_entries(session, ids)
+    session.execute(
+        delete(ChatMessage)
+        .where(ChatMessage.id.in_(ids))
+        .execution_options(synchronize_session=False)
+    )
+    for user_id, count in sorted(Counter(row.user_id for row in rows).items()):
+        increment_archived_count(session, user_id, count)
+    session.commit()
+    return len(ids)
+
+
+def get_archived_messages(
+    session: Session,
+    user: User,
+    limit: int,
+    before: tuple[float, int] | None = None,
+    conversation_id: int | None = None,
+) -> list[Row]:
+    """アーカイブ済みのメッセージを新しい順で limit 件取得し、古い順で返します。
+
+    各行は chat_history.MESSAGE_COLUMNS と同じ id, role, content, created_at です。
+    before は (created_at, id) のカーソルで、それより前の行だけを返します。
+    """
+    stmt = select(
+        ChatMessageArchive.id,
+        ChatMessageArchive.role,
+        ChatMessageArchive.content,
+        ChatMessageArchive.created_at,
+    ).where(ChatMessageArchive.user_id == user.id)
+    if before is not None:
+        stmt = stmt.where(before_cursor(ChatMessageArchive, before))
+    if conversation_id is not None:
+        stmt = stmt.where(ChatMessageArchive.conversation_id == conversation_id)
+    stmt = stmt.order_by(
+        ChatMessageArchive.created_at.desc(), ChatMessageArchive.id.desc()
+    ).limit(limit)
+    rows = session.exec(stmt).all()
+    return list(reversed(rows))
+
+
+def get_archived_messages_by_ids(
+    session: Session,
+    user: User,
+    message_ids: list[int],
+    conversation_id: int | None = None,
+) -> list[Row]:
+    """指定IDのアーカイブ済みメッセージ（本人のもののみ）を返す。"""
+    if not message_ids:
+        return []
+    stmt = select(
+        ChatMessageArchive.id,
+        ChatMessageArchive.role,
+        ChatMessageArchive.content,
+        ChatMessageArchive.created_at,
+    ).where(
+        ChatMessageArchive.user_id == user.id,
+        ChatMessageArchive.id.in_(message_ids),
+    )
+    if conversation_id is not None:
+        stmt = stmt.where(ChatMessageArchive.conversation_id == conversation_id)
+    return list(session.exec(stmt).all())
+
+
+def delete_archived_messages(session: Session, user: User) -> None:
+    """ユーザのアーカイブ済みメッセージを削除する（commit は呼び出し側）。"""
+    session.execute(
+        delete(ChatMessageArchive).where(ChatMessageArchive.user_id == user.id)
+    )
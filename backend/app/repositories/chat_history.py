@@ -1,33 +1,288 @@
-from app.schema import ChatMessage, User
+import heapq
+import io
+from collections import Counter, defaultdict
+from collections.abc import Iterator, Sequence
+from itertools import batched
+
+from app.repositories.chat_archive import (
+    before_cursor,
+    delete_archived_messages,
+    get_archived_messages_by_ids,
+)
+from app.repositories.chat_import import delete_import_jobs
+from app.repositories.chat_search import (
+    TS_CONFIG,
+    delete_user_index,
+    index_message,
+    index_messages_bulk,
+)
+from app.repositories.chat_stats import increment_message_count, reset_message_count
+from app.repositories.conversation import (
+    add_to_conversation,
+    delete_conversations,
+    touch_conversation,
+)
+from app.schema import ChatMessage, ChatMessageArchive, Conversation, User
+from app.utils.compression import compress_text
+from sqlalchemy import Row, insert
 from sqlmodel import Session, select
 
+# PostgreSQL でこの件数以上をまとめて保存する場合は COPY を使う
+COPY_MIN_ROWS = 100
+
+# 履歴の読み出しで返す列（API レスポンスの ChatMessageModel と同じ並び）
+MESSAGE_COLUMNS = (
+    ChatMessage.id,
+    ChatMessage.role,
+    ChatMessage.content,
+    ChatMessage.created_at,
+)
+
 
-def add_message(session: Session, user: User, role: str, content: str) -> ChatMessage:
-    """チャットメッセージを保存します。"""
-    message = ChatMessage(user_id=user.id, role=role, content=content)
+def add_message(
+    session: Session,
+    user: User,
+    role: str,
+    content: str,
+    conversation: Conversation | None = None,
+) -> ChatMessage:
+    """チャットメッセージを保存します。
+
+    ユーザ別の件数と、conversation を指定した場合は会話スレッドの集計列
+    （件数・最終更新日時・タイトル）も同じトランザクションで更新します。
+    """
+    message = ChatMessage(
+        user_id=user.id,
+        role=role,
+        content=content,
+        conversation_id=conversation.id if conversation else None,
+    )
     session.add(message)
+    session.flush()
+    index_message(session, message)
+    increment_message_count(session, user.id)
+    if conversation is not None:
+        touch_conversation(session, message)
     session.commit()
     session.refresh(message)
     return message
 
 
-def get_last_messages(session: Session, user: User, limit: int) -> list[ChatMessage]:
-    """直近のメッセージを新しい順で limit 件取得し、古い順に並べ替えて返します。"""
-    stmt = (
-        select(ChatMessage)
-        .where(ChatMessage.user_id == user.id)
-        .order_by(ChatMessage.created_at.desc())
-        .limit(limit)
+def bulk_add_messages(session: Session, rows: list[dict]) -> list[int]:
+    """メッセージをまとめて保存し、採番された ID を入力順で返す（commit は呼び出し側）。
+
+    rows は user_id, conversation_id, role, content, created_at を持つ辞書の
+    リストで、複数ユーザ・複数会話スレッドが混在して構いません。
+    PostgreSQL で COPY_MIN_ROWS 件以上なら COPY、それ以外は1文の複数行 INSERT
+    で挿入し、全文検索インデックス・件数・会話スレッドの集計列も同じ
+    トランザクションで更新します。
+    """
+    if not rows:
+        return []
+    if session.get_bind().dialect.name == "postgresql" and len(rows) >= COPY_MIN_ROWS:
+        # search_vector は COPY 後の INSERT ... SELECT で計算済み
+        ids = _copy_messages(session, rows)
+    else:
+        stmt = insert(ChatMessage.__table__).returning(
+            ChatMessage.__table__.c.id, sort_by_parameter_order=True
+        )
+        ids = list(session.execute(stmt, rows).scalars())
+        index_messages_bulk(
+            session,
+            ids,
+            [r["user_id"] for r in rows],
+            [r["content"] for r in rows],
+        )
+
+    for user_id, count in Counter(r["user_id"] for r in rows).items():
+        increment_message_count(session, user_id, count)
+
+    by_conversation: dict[int, list[dict]] = defaultdict(list)
+    for r in rows:
+        if r["conversation_id"] is not None:
+            by_conversation[r["conversation_id"]].append(r)
+    for conversation_id, group in by_conversation.items():
+        first_prompt = next((r["content"] for r in group if r["role"] == "user"), None)
+        add_to_conversation(
+            session,
+            conversation_id,
+            len(group),
+            max(r["created_at"] for r in group),
+            first_prompt,
+        )
+    return ids
+
+
+def _copy_escape(value: str) -> str:
+    return (
+        value.replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def _copy_messages(session: Session, rows: list[dict]) -> list[int]:
+    """COPY で一時テーブルへ流し込み、INSERT ... SELECT で本テーブルへ移す。
+
+    COPY で直接 chat_messages へ入れると ID の取得と search_vector の計算が
+    できないため、一時テーブルを経由します。content には圧縮済みの保存形式を、
+    plain には search_vector 計算用の平文を入れます。
+    """
+    connection = session.connection()
+    connection.exec_driver_sql(
+        "CREATE TEMP TABLE IF NOT EXISTS chat_messages_staging "
+        "(ord integer, created_at double precision, role text, content bytea, "
+        "plain text, user_id integer, conversation_id integer) "
+        "ON COMMIT DELETE ROWS"
+    )
+    buffer = io.StringIO()
+    for i, r in enumerate(rows):
+        conversation_id = r["conversation_id"]
+        if conversation_id is None:
+            conversation_id = "\\N"  # COPY の NULL 表現
+        # bytea は16進表記（\x...）で渡す。COPY ではバックスラッシュを重ねる
+        stored = "\\\\x" + compress_text(r["content"]).hex()
+        buffer.write(
+            f"{i}\t{r['created_at']!r}\t{_copy_escape(r['role'])}\t{stored}\t"
+            f"{_copy_escape(r['content'])}\t{r['user_id']}\t{conversation_id}\n"
+        )
+    buffer.seek(0)
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert("COPY chat_messages_staging FROM STDIN", buffer)
+    finally:
+        cursor.close()
+
+    result = connection.exec_driver_sql(
+        "INSERT INTO chat_messages "
+        "(created_at, role, content, user_id, conversation_id, search_vector) "
+        "SELECT created_at, role, content, user_id, conversation_id, "
+        f"to_tsvector('{TS_CONFIG}', plain) "
+        "FROM chat_messages_staging ORDER BY ord RETURNING id"
+    )
+    ids = [row[0] for row in result]
+    connection.exec_driver_sql("TRUNCATE chat_messages_staging")
+    return ids
+
+
+def get_last_messages(
+    session: Session,
+    user: User,
+    limit: int,
+    conversation_id: int | None = None,
+    before: tuple[float, int] | None = None,
+) -> list[Row]:
+    """直近のメッセージを新しい順で limit 件取得し、古い順に並べ替えて返します。
+
+    conversation_id を指定した場合はその会話スレッド内に限定し、before
+    （(created_at, id) のカーソル）を指定した場合はそれより前のメッセージを
+    返します。読み取り専用のため ORM インスタンスは作らず、MESSAGE_COLUMNS
+    だけを持つ Row で返します。
+    """
+    stmt = select(*MESSAGE_COLUMNS).where(ChatMessage.user_id == user.id)
+    if before is not None:
+        stmt = stmt.where(before_cursor(ChatMessage, before))
+    if conversation_id is not None:
+        stmt = stmt.where(ChatMessage.conversation_id == conversation_id)
+    stmt = stmt.order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc()).limit(
+        limit
     )
     rows = session.exec(stmt).all()
     return list(reversed(rows))
 
 
+def get_message_created_at(
+    session: Session, user: User, message_id: int
+) -> float | None:
+    """メッセージ（アーカイブ済みを含む）の created_at を返す。無ければ None。"""
+    for model in (ChatMessage, ChatMessageArchive):
+        created_at = session.exec(
+            select(model.created_at).where(
+                model.user_id == user.id, model.id == message_id
+            )
+        ).first()
+        if created_at is not None:
+            return created_at
+    return None
+
+
+def get_messages_by_ids(
+    session: Session,
+    user: User,
+    message_ids: list[int],
+    conversation_id: int | None = None,
+) -> list[Row]:
+    """指定IDのメッセージ（本人のもののみ）を古い順で返します。
+
+    ベクトルインデックスはアーカイブ後もIDを保持しているため、
+    chat_messages に無いIDはアーカイブから読み込みます。
+    """
+    if not message_ids:
+        return []
+    stmt = select(*MESSAGE_COLUMNS).where(
+        ChatMessage.user_id == user.id, ChatMessage.id.in_(message_ids)
+    )
+    if conversation_id is not None:
+        stmt = stmt.where(ChatMessage.conversation_id == conversation_id)
+    rows = list(session.exec(stmt).all())
+    found = {row.id for row in rows}
+    missing = [i for i in message_ids if i not in found]
+    if missing:
+        rows += get_archived_messages_by_ids(session, user, missing, conversation_id)
+    rows.sort(key=lambda row: (row.created_at, row.id))
+    return rows
+
+
+def iter_all_messages(
+    session: Session, user_id: int, fetch_size: int
+) -> Iterator[Sequence[Row]]:
+    """アーカイブを含む全メッセージを古い順に fetch_size 件ずつ返します。
+
+    ORM オブジェクトを作らずに列だけを読み、サーバーサイドカーソル
+    （PostgreSQL では名前付きカーソル）から逐次取得するため、件数に
+    関わらずメモリ使用量は fetch_size 件分で一定です。
+    インポートした行は ID が新しくても created_at が古く、アーカイブの行より
+    前に来ることがあるため、両方を (created_at, id) 順に読みながら併合します。
+    """
+
+    def rows(model) -> Iterator[Row]:
+        stmt = (
+            select(
+                model.id,
+                model.conversation_id,
+                model.role,
+                model.content,
+                model.created_at,
+            )
+            .where(model.user_id == user_id)
+            .order_by(model.created_at, model.id)
+        )
+        result = session.execute(stmt, execution_options={"yield_per": fetch_size})
+        for partition in result.partitions():
+            yield from partition
+
+    merged = heapq.merge(
+        rows(ChatMessageArchive),
+        rows(ChatMessage),
+        key=lambda r: (r.created_at, r.id),
+    )
+    yield from batched(merged, fetch_size)
+
+
 def clear_messages(session: Session, user: User) -> int:
-    """ユーザの全メッセージを削除して件数を返す。"""
+    """ユーザの全メッセージ（アーカイブ・会話スレッドを含む）を削除する。
+
+    戻り値はアーカイブ前の chat_messages から削除した件数です。
+    """
     stmt = select(ChatMessage).where(ChatMessage.user_id == user.id)
     rows = session.exec(stmt).all()
     for m in rows:
         session.delete(m)
+    delete_user_index(session, user)
+    delete_archived_messages(session, user)
+    delete_import_jobs(session, user)
+    delete_conversations(session, user)
+    reset_message_count(session, user)
     session.commit()
     return len(rows)
@@ -0,0 +1,87 @@
+from datetime import datetime
+
+from app.schema import ChatImportJob, User
+from sqlalchemy import and_, delete, or_, update
+from sqlmodel import Session, select
+
+
+def create_import_job(
+    session: Session, user: User, conversation_id: int
+) -> ChatImportJob:
+    """インポートジョブを作成します。"""
+    job = ChatImportJob(user_id=user.id, conversation_id=conversation_id)
+    session.add(job)
+    session.commit()
+    session.refresh(job)
+    return job
+
+
+def get_import_job(session: Session, user: User, job_id: int) -> ChatImportJob | None:
+    """本人のインポートジョブを ID で取得します。"""
+    stmt = select(ChatImportJob).where(
+        ChatImportJob.id == job_id, ChatImportJob.user_id == user.id
+    )
+    return session.exec(stmt).first()
+
+
+def claim_import_job(session: Session, job: ChatImportJob, stale_before: float) -> bool:
+    """ジョブを "running" にして取得する。他のリクエストが処理中なら False。
+
+    pending / failed のジョブと、updated_at が stale_before より古い running の
+    ジョブ（処理中にプロセスが落ちたもの）だけを条件付き UPDATE で取得するため、
+    同じジョブへの同時アップロードのうち1つだけが成功します。
+    """
+    result = session.execute(
+        update(ChatImportJob)
+        .where(
+            ChatImportJob.id == job.id,
+            or_(
+                ChatImportJob.status.in_(["pending", "failed"]),
+                and_(
+                    ChatImportJob.status == "running",
+                    ChatImportJob.updated_at < stale_before,
+                ),
+            ),
+        )
+        .values(status="running", error=None, updated_at=datetime.now().timestamp())
+    )
+    session.commit()
+    session.refresh(job)
+    return result.rowcount == 1
+
+
+def update_import_progress(
+    session: Session,
+    job: ChatImportJob,
+    lines_committed: int,
+    messages_imported: int,
+    status: str,
+    error: str | None = None,
+) -> bool:
+    """進捗を更新する（commit は呼び出し側）。
+
+    メッセージの挿入と同じトランザクションで更新することで、
+    lines_committed を再開位置として信頼できるようにします。読み込んだ時点から
+    lines_committed が変わっていた（＝別のリクエストが先に進めた）場合は
+    更新せずに False を返すので、呼び出し側はロールバックしてください。
+    """
+    result = session.execute(
+        update(ChatImportJob)
+        .where(
+            ChatImportJob.id == job.id,
+            ChatImportJob.lines_committed == job.lines_committed,
+        )
+        .values(
+            lines_committed=lines_committed,
+            messages_imported=messages_imported,
+            status=status,
+            error=error,
+            updated_at=datetime.now().timestamp(),
+        )
+    )
+    return result.rowcount == 1
+
+
+def delete_import_jobs(session: Session, user: User) -> None:
+    """ユーザのインポートジョブを全て削除する（commit は呼び出し側）。"""
+    session.execute(delete(ChatImportJob).where(ChatImportJob.user_id == user.id))
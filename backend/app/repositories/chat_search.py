@@ -0,0 +1,220 @@
+"""チャット履歴の全文検索インデックス
+
+- PostgreSQL: ``chat_messages.search_vector``（tsvector）+ GIN インデックス
+- SQLite: FTS5 仮想テーブル ``chat_messages_fts``（テスト・ローカル用）
+
+インデックスはメッセージ保存/削除と同じトランザクション内で更新します。
+アーカイブ（chat_messages_archive）へ移したメッセージは検索対象外です。
+"""
+
+import re
+from typing import NamedTuple
+
+from app.schema import ChatMessage, User
+from app.utils.compression import CompressedText
+from sqlalchemy import bindparam, text
+from sqlmodel import Session
+
+FTS_TABLE = "chat_messages_fts"
+TS_CONFIG = "simple"
+SNIPPET_START = "<mark>"
+SNIPPET_END = "</mark>"
+
+_TERM_RE = re.compile(r"\w+")
+
+
+def _dialect(session: Session) -> str:
+    return session.get_bind().dialect.name
+
+
+def _owner_token(user_id: int) -> str:
+    return f"u{user_id}"
+
+
+def _fts5_query(user_id: int, query: str) -> str | None:
+    """ユーザ入力を FTS5 の MATCH 式に変換する（各語をフレーズとして AND 結合）。"""
+    terms = _TERM_RE.findall(query)
+    if not terms:
+        return None
+    phrases = " ".join('"' + t.replace('"', '""') + '"' for t in terms)
+    return f'owner:"{_owner_token(user_id)}" AND content:({phrases})'
+
+
+def index_message(session: Session, message: ChatMessage) -> None:
+    """メッセージを全文検索インデックスへ登録する（commit は呼び出し側）。"""
+    dialect = _dialect(session)
+    if dialect == "postgresql":
+        session.execute(
+            text(
+                "UPDATE chat_messages "
+                f"SET search_vector = to_tsvector('{TS_CONFIG}', :content) "
+                "WHERE id = :id"
+            ),
+            {"content": message.content, "id": message.id},
+        )
+    elif dialect == "sqlite":
+        session.execute(
+            text(
+                f"INSERT INTO {FTS_TABLE} (rowid, content, owner) "
+                "VALUES (:id, :content, :owner)"
+            ),
+            {
+                "id": message.id,
+                "content": message.content,
+                "owner": _owner_token(message.user_id),
+            },
+        )
+
+
+def index_messages_bulk(
+    session: Session,
+    message_ids: list[int],
+    user_ids: list[int],
+    contents: list[str],
+) -> None:
+    """複数メッセージをまとめてインデックスへ登録する（commit は呼び出し側）。"""
+    if not message_ids:
+        return
+    dialect = _dialect(session)
+    if dialect == "postgresql":
+        session.execute(
+            text(
+                "UPDATE chat_messages AS m "
+                f"SET search_vector = to_tsvector('{TS_CONFIG}', d.content) "
+                "FROM unnest(CAST(:ids AS integer[]), CAST(:contents AS text[])) "
+                "AS d(id, content) WHERE m.id = d.id"
+            ),
+            {"ids": message_ids, "contents": contents},
+        )
+    elif dialect == "sqlite":
+        session.execute(
+            text(
+                f"INSERT INTO {FTS_TABLE} (rowid, content, owner) "
+                "VALUES (:id, :content, :owner)"
+            ),
+            [
+                {"id": i, "content": c, "owner": _owner_token(u)}
+                for i, u, c in zip(message_ids, user_ids, contents, strict=True)
+            ],
+        )
+
+
+def delete_user_index(session: Session, user: User) -> None:
+    """ユーザの全メッセージをインデックスから削除する（commit は呼び出し側）。
+
+    PostgreSQL では行と一緒に tsvector も消えるため何もしません。
+    """
+    if _dialect(session) == "sqlite":
+        session.execute(
+            text(
+                f"DELETE FROM {FTS_TABLE} WHERE rowid IN "
+                f"(SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match)"
+            ),
+            {"match": f'owner:"{_owner_token(user.id)}"'},
+        )
+
+
+def delete_index_entries(session: Session, message_ids: list[int]) -> None:
+    """指定メッセージをインデックスから削除する（commit は呼び出し側）。"""
+    if message_ids and _dialect(session) == "sqlite":
+        session.execute(
+            text(f"DELETE FROM {FTS_TABLE} WHERE rowid IN :ids").bindparams(
+                bindparam("ids", expanding=True)
+            ),
+            {"ids": message_ids},
+        )
+
+
+class SearchHit(NamedTuple):
+    id: int
+    role: str
+    created_at: float
+    snippet: str
+    rank: float
+
+
+def search_messages(
+    session: Session,
+    user: User,
+    query: str,
+    limit: int,
+    after: tuple[float, int] | None = None,
+) -> list[SearchHit]:
+    """関連度の高い順（同順位は新しい順）に検索結果を返す。
+
+    after には前ページ最後のヒットの (rank, id) を渡すと、その続きから
+    取得します（keyset pagination）。
+    """
+    dialect = _dialect(session)
+    params: dict = {"limit": limit}
+    if after is not None:
+        keyset = "WHERE rank < :after_rank OR (rank = :after_rank AND id < :after_id)"
+        params.update(after_rank=after[0], after_id=after[1])
+    else:
+        keyset = ""
+
+    if dialect == "postgresql":
+        # content は圧縮して保存しているため、ページ分だけ展開してから
+        # ts_headline でスニペットを作る
+        inner = (
+            "SELECT m.id, m.role, m.created_at, m.content, "
+            "ts_rank_cd(m.search_vector, q) AS rank "
+            f"FROM chat_messages m, plainto_tsquery('{TS_CONFIG}', :query) q "
+            "WHERE m.user_id = :user_id AND m.search_vector @@ q"
+        )
+        params.update(query=query, user_id=user.id)
+        stmt = text(
+            f"SELECT id, role, created_at, content, rank FROM ({inner}) AS hits "
+            f"{keyset} ORDER BY rank DESC, id DESC LIMIT :limit"
+        ).columns(content=CompressedText())
+        rows = session.execute(stmt, params).all()
+        snippets = _pg_headlines(session, query, [r.content for r in rows])
+        return [
+            SearchHit(r.id, r.role, r.created_at, snippet, r.rank)
+            for r, snippet in zip(rows, snippets, strict=True)
+        ]
+
+    if dialect == "sqlite":
+        match = _fts5_query(user.id, query)
+        if match is None:
+            return []
+        inner = (
+            "SELECT m.id, m.role, m.created_at, "
+            f"snippet({FTS_TABLE}, 0, :start, :end, '…', 12) AS snippet, "
+            # bm25 は小さいほど関連度が高いため符号を反転し、owner 列は重み 0
+            f"-bm25({FTS_TABLE}, 1.0, 0.0) AS rank "
+            f"FROM {FTS_TABLE} JOIN chat_messages m ON m.id = {FTS_TABLE}.rowid "
+            f"WHERE {FTS_TABLE} MATCH :match"
+        )
+        params.update(match=match, start=SNIPPET_START, end=SNIPPET_END)
+        stmt = text(
+            f"SELECT id, role, created_at, snippet, rank FROM ({inner}) AS hits "
+            f"{keyset} ORDER BY rank DESC, id DESC LIMIT :limit"
+        )
+        return [SearchHit(*r) for r in session.execute(stmt, params)]
+
+    raise NotImplementedError(f"Full-text search is not supported on {dialect}")
+
+
+def _pg_headlines(session: Session, query: str, contents: list[str]) -> list[str]:
+    if not contents:
+        return []
+    stmt = text(
+        f"SELECT ts_headline('{TS_CONFIG}', d.content, "
+        f"plainto_tsquery('{TS_CONFIG}', :query), :opts) "
+        "FROM unnest(CAST(:contents AS text[])) WITH ORDINALITY AS d(content, ord) "
+        "ORDER BY d.ord"
+    )
+    return list(
+        session.execute(
+            stmt,
+            {
+                "query": query,
+                "contents": contents,
+                "opts": (
+                    f"StartSel={SNIPPET_START}, StopSel={SNIPPET_END}, "
+                    "MaxWords=24, MinWords=8"
+                ),
+            },
+        ).scalars()
+    )
@@ -0,0 +1,184 @@
+from collections import Counter
+
+from app.schema import (
+    ChatMessage,
+    ChatMessageArchive,
+    ChatMessageStats,
+    Conversation,
+    User,
+)
+from sqlalchemy import func, literal, union_all, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import Session, select
+
+
+def _upsert(session: Session):
+    if session.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(ChatMessageStats)
+    return sqlite.insert(ChatMessageStats)
+
+
+def increment_message_count(session: Session, user_id: int, delta: int = 1) -> None:
+    """メッセージ件数を加算する（commit は呼び出し側）。
+
+    行が無ければ作成し、あれば UPDATE 文で加算するため同時書き込みでも
+    件数が失われません。履歴の version も同時に増やします。
+    """
+    stmt = _upsert(session).values(user_id=user_id, message_count=delta, version=1)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ChatMessageStats.user_id],
+        set_={
+            "message_count": ChatMessageStats.message_count + delta,
+            "version": ChatMessageStats.version + 1,
+        },
+    )
+    session.execute(stmt)
+
+
+def reset_message_count(session: Session, user: User) -> None:
+    """メッセージ件数を 0 にする（commit は呼び出し側）。"""
+    session.execute(
+        update(ChatMessageStats)
+        .where(ChatMessageStats.user_id == user.id)
+        .values(message_count=0, archived_count=0, version=ChatMessageStats.version + 1)
+    )
+
+
+def increment_archived_count(session: Session, user_id: int, delta: int) -> None:
+    """アーカイブ済みの件数を加算する（commit は呼び出し側）。"""
+    session.execute(
+        update(ChatMessageStats)
+        .where(ChatMessageStats.user_id == user_id)
+        .values(archived_count=ChatMessageStats.archived_count + delta)
+    )
+
+
+def get_message_count(session: Session, user: User) -> int:
+    """メッセージ件数を主キー参照で返す（O(1)）。"""
+    stats = session.get(ChatMessageStats, user.id)
+    return stats.message_count if stats else 0
+
+
+def get_archived_count(session: Session, user: User) -> int:
+    """アーカイブ済みのメッセージ件数を主キー参照で返す。"""
+    stats = session.get(ChatMessageStats, user.id)
+    return stats.archived_count if stats else 0
+
+
+def get_history_version(session: Session, user: User) -> tuple[int, int]:
+    """(メッセージ件数, 履歴の version) を主キー参照で返す。"""
+    stats = session.get(ChatMessageStats, user.id)
+    return (stats.message_count, stats.version) if stats else (0, 0)
+
+
+def reconcile_message_counts(session: Session, batch_size: int = 500) -> int:
+    """実際の件数と集計値のずれを修正し、修正した行数を返す。
+
+    ユーザを batch_size 件ずつ、それぞれ1トランザクションで処理します。
+    集計行（ユーザ別・会話スレッド別）を SELECT ... FOR UPDATE でロックしてから
+    数えるため、並行する加算やアーカイブの移動が上書きで失われることは
+    ありません（加算はロックの解放を待ってから、修正後の値に対して行われる）。
+    SQLite では最初の INSERT でデータベースの書き込みロックを取ります。
+    件数の COUNT(*) を伴うため、書き込みの少ない時間帯の定期ジョブから
+    呼び出してください。
+    """
+    fixed = 0
+    last_id = 0
+    while True:
+        user_ids = list(
+            session.exec(
+                select(User.id)
+                .where(User.id > last_id)
+                .order_by(User.id)
+                .limit(batch_size)
+            ).all()
+        )
+        if not user_ids:
+            break
+        fixed += _reconcile_users(session, user_ids)
+        session.commit()
+        last_id = user_ids[-1]
+    return fixed
+
+
+def _reconcile_users(session: Session, user_ids: list[int]) -> int:
+    # 集計行が無ければ作っておき、加算と同じ行をロックできるようにする
+    session.execute(
+        _upsert(session)
+        .values([{"user_id": i, "message_count": 0, "version": 1} for i in user_ids])
+        .on_conflict_do_nothing(index_elements=[ChatMessageStats.user_id])
+    )
+    stored = {
+        user_id: (message_count, archived_count)
+        for user_id, message_count, archived_count in session.exec(
+            select(
+                ChatMessageStats.user_id,
+                ChatMessageStats.message_count,
+                ChatMessageStats.archived_count,
+            )
+            .where(ChatMessageStats.user_id.in_(user_ids))
+            .order_by(ChatMessageStats.user_id)
+            .with_for_update()
+        ).all()
+    }
+    conversations = dict(
+        session.exec(
+            select(Conversation.id, Conversation.message_count)
+            .where(Conversation.user_id.in_(user_ids))
+            .order_by(Conversation.id)
+            .with_for_update()
+        ).all()
+    )
+
+    # ロック取得後に1文で数える（アーカイブへの移動途中の状態を見ないように）
+    # アーカイブ済みのメッセージも履歴の一部として数える
+    messages = union_all(
+        *(
+            select(
+                model.user_id,
+                model.conversation_id,
+                literal(model is ChatMessageArchive).label("archived"),
+            ).where(model.user_id.in_(user_ids))
+            for model in (ChatMessage, ChatMessageArchive)
+        )
+    ).subquery()
+    by_user: Counter[int] = Counter()
+    archived_by_user: Counter[int] = Counter()
+    by_conversation: Counter[int] = Counter()
+    for user_id, conversation_id, archived, count in session.execute(
+        select(
+            messages.c.user_id,
+            messages.c.conversation_id,
+            messages.c.archived,
+            func.count(),
+        ).group_by(messages.c.user_id, messages.c.conversation_id, messages.c.archived)
+    ):
+        by_user[user_id] += count
+        if archived:
+            archived_by_user[user_id] += count
+        if conversation_id is not None:
+            by_conversation[conversation_id] += count
+
+    fixed = 0
+    for user_id, counts in stored.items():
+        actual = (by_user[user_id], archived_by_user[user_id])
+        if actual != counts:
+            session.execute(
+                update(ChatMessageStats)
+                .where(ChatMessageStats.user_id == user_id)
+                .values(
+                    message_count=actual[0],
+                    archived_count=actual[1],
+                    version=ChatMessageStats.version + 1,
+                )
+            )
+            fixed += 1
+    for conversation_id, count in conversations.items():
+        if by_conversation[conversation_id] != count:
+            session.execute(
+                update(Conversation)
+                .where(Conversation.id == conversation_id)
+                .values(message_count=by_conversation[conversation_id])
+            )
+            fixed += 1
+    return fixed
@@ -0,0 +1,100 @@
+from app.schema import ChatMessage, Conversation, User
+from sqlalchemy import case, delete, func, update
+from sqlmodel import Session, select
+
+TITLE_MAX_LENGTH = 80
+
+
+def create_conversation(
+    session: Session, user: User, title: str | None = None
+) -> Conversation:
+    """会話スレッドを作成します。"""
+    conversation = Conversation(user_id=user.id, title=title)
+    session.add(conversation)
+    session.commit()
+    session.refresh(conversation)
+    return conversation
+
+
+def get_conversation(
+    session: Session, user: User, conversation_id: int
+) -> Conversation | None:
+    """本人の会話スレッドを ID で取得します。"""
+    stmt = select(Conversation).where(
+        Conversation.id == conversation_id, Conversation.user_id == user.id
+    )
+    return session.exec(stmt).first()
+
+
+def get_latest_conversation(session: Session, user: User) -> Conversation | None:
+    """最後に更新された会話スレッドを取得します。"""
+    stmt = (
+        select(Conversation)
+        .where(Conversation.user_id == user.id)
+        .order_by(Conversation.last_message_at.desc())
+        .limit(1)
+    )
+    return session.exec(stmt).first()
+
+
+def list_conversations(session: Session, user: User, limit: int) -> list[Conversation]:
+    """会話スレッドを新しい順で返します（user_id, last_message_at の索引のみで完結）。"""
+    stmt = (
+        select(Conversation)
+        .where(Conversation.user_id == user.id)
+        .order_by(Conversation.last_message_at.desc())
+        .limit(limit)
+    )
+    return list(session.exec(stmt).all())
+
+
+def touch_conversation(session: Session, message: ChatMessage) -> None:
+    """メッセージ追加に合わせて集計列を更新する（commit は呼び出し側）。
+
+    同時書き込みで更新が失われないよう、読み出さずに UPDATE 文で加算します。
+    """
+    values = {
+        "message_count": Conversation.message_count + 1,
+        "last_message_at": message.created_at,
+    }
+    if message.role == "user":
+        values["title"] = func.coalesce(
+            Conversation.title, message.content[:TITLE_MAX_LENGTH]
+        )
+    session.execute(
+        update(Conversation)
+        .where(Conversation.id == message.conversation_id)
+        .values(**values)
+    )
+
+
+def add_to_conversation(
+    session: Session,
+    conversation_id: int,
+    count: int,
+    last_message_at: float,
+    first_prompt: str | None = None,
+) -> None:
+    """まとめて追加したメッセージ分の集計列を更新する（commit は呼び出し側）。
+
+    first_prompt はタイトル未設定の場合にタイトルとして使います。
+    """
+    values = {
+        "message_count": Conversation.message_count + count,
+        "last_message_at": case(
+            (Conversation.last_message_at < last_message_at, last_message_at),
+            else_=Conversation.last_message_at,
+        ),
+    }
+    if first_prompt is not None:
+        values["title"] = func.coalesce(
+            Conversation.title, first_prompt[:TITLE_MAX_LENGTH]
+        )
+    session.execute(
+        update(Conversation).where(Conversation.id == conversation_id).values(**values)
+    )
+
+
+def delete_conversations(session: Session, user: User) -> None:
+    """ユーザの会話スレッドを全て削除する（commit は呼び出し側）。"""
+    session.execute(delete(Conversation).where(Conversation.user_id == user.id))
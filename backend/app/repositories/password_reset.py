@@ -1,6 +1,7 @@
 from datetime import datetime
 
 from app.schema import PasswordResetToken
+from sqlalchemy import delete
 from sqlmodel import Session, select
 
 
@@ -30,3 +31,27 @@ def get_active_token_by_hash(
         PasswordResetToken.expires_at >= datetime.now().timestamp(),
     )
     return session.exec(stmt).first()
+
+
+def get_live_token_hashes(session: Session, since: float) -> list[tuple[str, float]]:
+    """有効期限が since 以降のトークンを (token_hash, expires_at) で返す。"""
+    stmt = select(PasswordResetToken.token_hash, PasswordResetToken.expires_at).where(
+        PasswordResetToken.expires_at >= since
+    )
+    return [(row.token_hash, row.expires_at) for row in session.execute(stmt)]
+
+
+def delete_expired_tokens(session: Session, now: float, limit: int) -> int:
+    """有効期限を過ぎたトークンを古い順に最大 limit 件削除し、削除した件数を返す。"""
+    stmt = (
+        select(PasswordResetToken.id)
+        .where(PasswordResetToken.expires_at < now)
+        .order_by(PasswordResetToken.expires_at, PasswordResetToken.id)
+        .limit(limit)
+    )
+    ids = session.exec(stmt).all()
+    if not ids:
+        return 0
+    session.execute(delete(PasswordResetToken).where(PasswordResetToken.id.in_(ids)))
+    session.commit()
+    return len(ids)
@@ -0,0 +1,24 @@
+from app.schema import RevokedToken
+from sqlalchemy import delete, select
+from sqlmodel import Session
+
+
+def add_revoked_token(
+    session: Session, jti: str, user_id: int | None, expires_at: float
+) -> None:
+    session.add(RevokedToken(jti=jti, user_id=user_id, expires_at=expires_at))
+    session.commit()
+
+
+def get_live_revoked_tokens(session: Session, now: float) -> list[tuple[str, float]]:
+    """有効期限内の失効トークンを (jti, expires_at) で返す。"""
+    stmt = select(RevokedToken.jti, RevokedToken.expires_at).where(
+        RevokedToken.expires_at > now
+    )
+    return [(row.jti, row.expires_at) for row in session.execute(stmt)]
+
+
+def delete_expired_revoked_tokens(session: Session, now: float) -> int:
+    result = session.execute(delete(RevokedToken).where(RevokedToken.expires_at <= now))
+    session.commit()
+    return result.rowcount
@@ -1,17 +1,69 @@
+from uuid import UUID
+
 from app.schema import User
 from sqlalchemy import select
 from sqlmodel import Session
 
 
+class UserRecord:
+    """読み取り専用のユーザ情報。ORM インスタンスを作らずに済ませるための軽量な行。"""
+
+    __slots__ = ("email", "id", "name", "uuid", "version")
+
+    def __init__(
+        self,
+        id: int,
+        uuid: UUID,
+        email: str | None,
+        name: str | None,
+        version: int,
+    ):
+        self.id = id
+        self.uuid = uuid
+        self.email = email
+        self.name = name
+        self.version = version
+
+    def to_response(self) -> dict:
+        """UserModel と同じ形の辞書を返す。"""
+        return {"uuid": str(self.uuid), "email": self.email, "name": self.name}
+
+
 def get_user_br_column(session: Session, sub: str, column_name: str) -> User | None:
     stmt = select(User).where(getattr(User, column_name) == sub)
     return session.exec(stmt).scalar_one_or_none()
 
 
+def get_user_record(session: Session, sub: str, column_name: str) -> UserRecord | None:
+    """get_user_br_column の読み取り専用版。必要な列だけを取得する。"""
+    stmt = select(User.id, User.uuid, User.email, User.name, User.version).where(
+        getattr(User, column_name) == sub
+    )
+    row = session.execute(stmt).first()
+    return UserRecord(*row) if row is not None else None
+
+
+def get_user_record_by_id(session: Session, user_id: int) -> UserRecord | None:
+    stmt = select(User.id, User.uuid, User.email, User.name, User.version).where(
+        User.id == user_id
+    )
+    row = session.execute(stmt).first()
+    return UserRecord(*row) if row is not None else None
+
+
+def get_user_versions(session: Session, user_id: int) -> tuple[int, int] | None:
+    """アクセストークンの検証用に (token_version, version) だけを主キーで取得する。"""
+    stmt = select(User.token_version, User.version).where(User.id == user_id)
+    row = session.execute(stmt).first()
+    return (row[0], row[1]) if row is not None else None
+
+
 def update_user(session: Session, user: User, data: dict) -> User:
     for field, value in data.items():
         if hasattr(user, field) and value is not None:
             setattr(user, field, value)
+    # 同時更新でも取りこぼさないよう、DB 側で加算する
+    user.version = User.version + 1
     session.commit()
     session.refresh(user)
     return user
@@ -0,0 +1,36 @@
+from app.services.auth import require_admin
+from app.utils.profiler import sampler
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import PlainTextResponse
+
+router = APIRouter(
+    prefix="/admin", dependencies=[Depends(require_admin)], include_in_schema=False
+)
+
+
+@router.get("/profiles")
+async def list_profiles():
+    return {
+        "profiles": [
+            {
+                "id": profile.id,
+                "method": profile.method,
+                "path": profile.path,
+                "started_at": profile.started_at,
+                "duration_ms": round(profile.duration * 1000, 1),
+                "samples": profile.samples.total(),
+            }
+            for profile in sampler.recent()
+        ]
+    }
+
+
+@router.get("/profiles/{profile_id}", response_class=PlainTextResponse)
+async def get_profile(profile_id: int):
+    """collapsed stack 形式（flamegraph.pl / speedscope にそのまま渡せる）で返す。"""
+    profile = sampler.get(profile_id)
+    if profile is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found"
+        )
+    return PlainTextResponse(profile.collapsed())
@@ -1,3 +1,5 @@
+from datetime import timedelta
+
 from app.database import get_session
 from app.models.auth import UserCreateModel, UserSignInModel, UserTokenModel
 from app.models.password import (
@@ -12,12 +14,17 @@ from app.services.password_reset import (
     request_password_reset,
     reset_password,
 )
+from app.services.rate_limit import check_rate_limit, client_ip, limit_by_ip
+from app.services.token_revocation import revoke_access_token
 from app.utils.auth.email_password import (
     ACCESS_TOKEN_EXPIRE_MINUTES,
     authenticate_user,
+    create_access_token,
     create_new_user,
+    create_sub,
+    get_auth_claims,
 )
-from fastapi import APIRouter, Depends, Form, HTTPException, status
+from fastapi import APIRouter, Depends, Form, HTTPException, Request, status
 from sqlmodel import Session
 
 router = APIRouter(prefix="/auth")
@@ -42,17 +49,26 @@ async def create_user(
     }
 
 
-@router.post("/signin", response_model=UserTokenModel)
+@router.post(
+    "/signin",
+    response_model=UserTokenModel,
+    dependencies=[Depends(limit_by_ip("signin_ip"))],
+)
 async def sign_in(
+    request: Request,
     data: UserSignInModel = Form(...),
     session: Session = Depends(get_session),
 ):
+    rate_key = f"{str(data.email).lower()}:{client_ip(request)}"
+    check_rate_limit("signin_email", rate_key, count=False)
     access_token = authenticate_user(
         email=str(data.email),
         password=data.password,
         session=session,
     )
     if not access_token:
+        # 失敗したときだけ数える
+        check_rate_limit("signin_email", rate_key)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -65,16 +81,33 @@ async def sign_in(
     }
 
 
-@router.post("/forgot-password")
-async def forgot_password(
-    data: PasswordResetRequestModel,
+@router.post("/logout")
+async def logout(
+    claims: dict | None = Depends(get_auth_claims),
     session: Session = Depends(get_session),
 ):
-    request_password_reset(data.email, session)
+    """このアクセストークンを失効させる（他の端末のトークンはそのまま）。"""
+    if claims is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+        )
+    revoke_access_token(session, claims)
+    return {"message": "Logged out"}
+
+
+@router.post(
+    "/forgot-password", dependencies=[Depends(limit_by_ip("forgot_password_ip"))]
+)
+async def forgot_password(data: PasswordResetRequestModel):
+    check_rate_limit("forgot_password_email", str(data.email).lower())
+    request_password_reset(data.email)
     return {"message": "If the email exists, a reset link was sent."}
 
 
-@router.post("/reset-password")
+@router.post(
+    "/reset-password", dependencies=[Depends(limit_by_ip("reset_password_ip"))]
+)
 async def reset_password_endpoint(
     data: PasswordResetModel,
     session: Session = Depends(get_session),
@@ -91,4 +124,14 @@ async def change_password_endpoint(
 ):
     user = session.merge(user)
     change_password(user, data.current_password, data.new_password, session)
-    return {"message": "Password changed successfully"}
+    # 変更前に発行したトークンは失効するため、呼び出し元には新しいトークンを返す
+    access_token = create_access_token(
+        data=create_sub(user),
+        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES),
+    )
+    return {
+        "message": "Password changed successfully",
+        "access_token": access_token,
+        "token_type": "bearer",
+        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    }
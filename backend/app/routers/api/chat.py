@@ -1,50 +1,182 @@
 from app.database import get_session
 from app.models.chat import (
     ChatHistoryResponseModel,
-    ChatMessageModel,
+    ChatImportCreateModel,
+    ChatImportJobModel,
     ChatRequestModel,
     ChatResponseModel,
+    ChatSearchResponseModel,
+    ConversationCreateModel,
+    ConversationListResponseModel,
+    ConversationModel,
 )
-from app.repositories.chat_history import clear_messages, get_last_messages
+from app.repositories.chat_stats import get_history_version
+from app.repositories.conversation import create_conversation, list_conversations
+from app.repositories.user import UserRecord
 from app.schema import User
-from app.services.auth import auth_user
-from app.services.chat import send_chat
-from fastapi import APIRouter, Depends, Query, status
+from app.services.auth import auth_user, auth_user_record
+from app.services.chat import (
+    clear_chat_history,
+    export_history,
+    get_history_page,
+    get_user_conversation,
+    search_history,
+    send_chat,
+)
+from app.services.chat_import import get_user_import_job, import_history, start_import
+from app.services.rate_limit import limit_by_user
+from app.utils.responses import (
+    FastJSONResponse,
+    etag_digest,
+    etag_headers,
+    etag_matches,
+    not_modified,
+    weak_etag,
+)
+from fastapi import APIRouter, Depends, Query, Request, status
+from fastapi.responses import StreamingResponse
 from sqlmodel import Session
 
 router = APIRouter(prefix="/chat")
 
 
-@router.post("", response_model=ChatResponseModel)
+@router.post(
+    "",
+    response_model=ChatResponseModel,
+    dependencies=[Depends(limit_by_user("chat_user"))],
+)
 async def chat(
     data: ChatRequestModel,
     user: User = Depends(auth_user),
     session: Session = Depends(get_session),
     limit: int | None = Query(None, description="履歴に含める最大件数"),
 ):
-    response = await send_chat(data.prompt, user=user, session=session, limit=limit)
-    return {"response": response}
+    response, conversation_id = await send_chat(
+        data.prompt,
+        user=user,
+        session=session,
+        limit=limit,
+        conversation_id=data.conversation_id,
+    )
+    return {"response": response, "conversation_id": conversation_id}
 
 
 @router.get("/history", response_model=ChatHistoryResponseModel)
 def get_history(
+    request: Request,
     limit: int = Query(30, ge=1, le=200, description="取得する履歴件数"),
+    conversation_id: int | None = Query(None, description="会話スレッドID"),
+    before: str | None = Query(None, description="前ページの next_cursor"),
+    before_id: int | None = Query(
+        None, deprecated=True, description="このIDより前の履歴を取得。before を推奨"
+    ),
+    user: UserRecord = Depends(auth_user_record),
+    session: Session = Depends(get_session),
+):
+    count, version = get_history_version(session, user)
+    if conversation_id is not None:
+        total = get_user_conversation(session, user, conversation_id).message_count
+    else:
+        total = count
+    # 履歴の version はメッセージの追加・削除のたびに増えるため、一致すれば
+    # ページの読み込みと直列化を省いて 304 を返す。ページごとに内容が違うため、
+    # ETag だけでキャッシュしても取り違えないようクエリパラメータも含める
+    page = etag_digest(limit, conversation_id, before, before_id)
+    etag = weak_etag("h", user.id, count, version, page)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    rows, next_cursor = get_history_page(
+        session, user, limit, conversation_id, before, before_id
+    )
+    # 行は ChatMessageModel と同じ列だけを持つため、モデルを経由せずに直列化する
+    return FastJSONResponse(
+        {
+            "total": total,
+            "messages": [row._asdict() for row in rows],
+            "next_cursor": next_cursor,
+        },
+        headers=etag_headers(etag),
+    )
+
+
+@router.get("/export", response_class=StreamingResponse)
+def export(
+    compress: bool = Query(False, alias="gzip", description="gzip 圧縮して返す"),
+    user: UserRecord = Depends(auth_user_record),
+):
+    filename = f"chat-history-{user.uuid}.ndjson"
+    if compress:
+        filename += ".gz"
+    return StreamingResponse(
+        export_history(user.id, compress=compress),
+        media_type="application/gzip" if compress else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.post("/imports", response_model=ChatImportJobModel)
+def create_import(
+    data: ChatImportCreateModel,
+    user: User = Depends(auth_user),
+    session: Session = Depends(get_session),
+):
+    return start_import(session, user, data.conversation_id)
+
+
+@router.post("/imports/{job_id}", response_model=ChatImportJobModel)
+async def upload_import(
+    job_id: int,
+    request: Request,
+    user: User = Depends(auth_user),
+    session: Session = Depends(get_session),
+):
+    """NDJSON 本文を受信してインポートする。中断後は同じ本文を送り直せば再開する。"""
+    job = get_user_import_job(session, user, job_id)
+    return await import_history(session, job, request.stream())
+
+
+@router.get("/imports/{job_id}", response_model=ChatImportJobModel)
+def get_import(
+    job_id: int,
+    user: UserRecord = Depends(auth_user_record),
+    session: Session = Depends(get_session),
+):
+    return get_user_import_job(session, user, job_id)
+
+
+@router.get("/conversations", response_model=ConversationListResponseModel)
+def get_conversations(
+    limit: int = Query(50, ge=1, le=200, description="取得する件数"),
+    user: UserRecord = Depends(auth_user_record),
+    session: Session = Depends(get_session),
+):
+    return {"conversations": list_conversations(session, user, limit)}
+
+
+@router.post("/conversations", response_model=ConversationModel)
+def new_conversation(
+    data: ConversationCreateModel,
     user: User = Depends(auth_user),
     session: Session = Depends(get_session),
 ):
-    rows = get_last_messages(session, user, limit)
-    messages: list[ChatMessageModel] = [
-        ChatMessageModel(
-            id=m.id, role=m.role, content=m.content, created_at=m.created_at
-        )
-        for m in rows
-    ]
-    return {"total": len(messages), "messages": messages}
+    return create_conversation(session, user, data.title)
+
+
+@router.get("/search", response_model=ChatSearchResponseModel)
+def search(
+    q: str = Query(..., min_length=1, max_length=256, description="検索語"),
+    limit: int = Query(20, ge=1, le=100, description="取得する件数"),
+    cursor: str | None = Query(None, description="前ページの next_cursor"),
+    user: UserRecord = Depends(auth_user_record),
+    session: Session = Depends(get_session),
+):
+    # サービス層で ChatSearchResponseModel と同じ形に組み立て済み
+    return FastJSONResponse(search_history(session, user, q, limit, cursor))
 
 
 @router.delete("/history", status_code=status.HTTP_204_NO_CONTENT)
 def clear_history(
     user: User = Depends(auth_user), session: Session = Depends(get_session)
 ):
-    clear_messages(session, user)
+    clear_chat_history(session, user)
     return
@@ -0,0 +1,18 @@
+from app.utils.metrics import METRICS_ENABLED, registry
+from fastapi import APIRouter, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
+
+router = APIRouter()
+
+# Prometheus のテキスト形式（exposition format 0.0.4）
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    # 複数ワーカー時はファイルを読むため、イベントループを塞がないようにする
+    body = await run_in_threadpool(registry.render)
+    return PlainTextResponse(body, media_type=CONTENT_TYPE)
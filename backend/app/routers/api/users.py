@@ -2,10 +2,23 @@ import os
 
 from app.database import get_session
 from app.models.user import UserModel, UserUpdateModel
-from app.repositories.user import update_user
+from app.repositories.user import UserRecord, update_user
 from app.schema import User
-from app.services.auth import add_new_user, auth_user, user_sub
-from fastapi import APIRouter, Depends, HTTPException, status
+from app.services.auth import (
+    add_new_user,
+    auth_user,
+    auth_user_record,
+    forget_auth_cache,
+    user_sub,
+)
+from app.utils.responses import (
+    FastJSONResponse,
+    etag_headers,
+    etag_matches,
+    not_modified,
+    weak_etag,
+)
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from sqlmodel import Session
 
 router = APIRouter(prefix="/users")
@@ -25,8 +38,14 @@ async def create_user(sub: str = Depends(user_sub)):
 
 
 @router.get("/me", response_model=UserModel)
-async def get_current_user(user: User = Depends(auth_user)):
-    return user
+async def get_current_user(
+    request: Request, user: UserRecord = Depends(auth_user_record)
+):
+    # ユーザID と version だけで ETag が決まるため、一致すれば直列化を省く
+    etag = weak_etag("u", user.id, user.version)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    return FastJSONResponse(user.to_response(), headers=etag_headers(etag))
 
 
 @router.put("/me", response_model=UserModel)
@@ -36,4 +55,6 @@ async def update_current_user(
     session: Session = Depends(get_session),
 ):
     user = session.merge(user)
-    return update_user(session, user, data.model_dump())
+    user = update_user(session, user, data.model_dump())
+    forget_auth_cache(user.id)
+    return user
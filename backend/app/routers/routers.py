@@ -1,6 +1,8 @@
+from app.routers.api.admin import router as admin_router
 from app.routers.api.auth import router as auth_router
 from app.routers.api.chat import router as chat_router
 from app.routers.api.health import router as health_router
+from app.routers.api.metrics import router as metrics_router
 from app.routers.api.users import router as users_router
 from fastapi import APIRouter
 
@@ -10,3 +12,6 @@ api_router.include_router(health_router, prefix="/api", tags=["health"])
 api_router.include_router(auth_router, prefix="/api", tags=["auth"])
 api_router.include_router(users_router, prefix="/api", tags=["users"])
 api_router.include_router(chat_router, prefix="/api", tags=["chat"])
+api_router.include_router(admin_router, prefix="/api", tags=["admin"])
+# Prometheus からスクレイプされるため /api の外に置く
+api_router.include_router(metrics_router, tags=["metrics"])
@@ -1,6 +1,8 @@
 from datetime import datetime
 from uuid import UUID, uuid4
 
+from app.utils.compression import CompressedText
+from sqlalchemy import DDL, Index, event
 from sqlmodel import Field, Relationship, SQLModel
 
 
@@ -15,6 +17,10 @@ class User(SQLModel, table=True):
     password: str | None = Field(nullable=True)
     name: str | None = Field(nullable=True)
     clerk_sub: str = Field(nullable=True, unique=True, index=True)
+    # プロフィール（GET /api/users/me の内容）を更新するたびに増やす。ETag に使う
+    version: int = Field(default=1)
+    # アクセストークンに埋め込む。パスワードの変更・再設定で増やし、古いトークンを失効させる
+    token_version: int = Field(default=0)
 
     password_reset_tokens: list["PasswordResetToken"] = Relationship(
         back_populates="user"
@@ -23,10 +29,14 @@ class User(SQLModel, table=True):
 
 class PasswordResetToken(SQLModel, table=True):
     __tablename__ = "password_reset_tokens"
-    __table_args__ = {"extend_existing": True}
+    __table_args__ = (
+        # 期限切れトークンの削除（古い順に一定件数ずつ）で使う
+        Index("ix_password_reset_tokens_expires_at_id", "expires_at", "id"),
+        {"extend_existing": True},
+    )
 
     id: int | None = Field(default=None, primary_key=True)
-    token_hash: str = Field(index=True)
+    token_hash: str = Field(unique=True, index=True)
     created_at: float = Field(default_factory=lambda: datetime.now().timestamp())
     expires_at: float
 
@@ -34,11 +44,59 @@ class PasswordResetToken(SQLModel, table=True):
     user: User = Relationship(back_populates="password_reset_tokens")
 
 
+class RevokedToken(SQLModel, table=True):
+    """ログアウトで失効させたアクセストークン（jti）。
+
+    各プロセスは定期的に読み込んでメモリ上の拒否リストへ反映する。
+    トークンの有効期限（expires_at）を過ぎた行は不要になるため削除する。
+    """
+
+    __tablename__ = "revoked_tokens"
+    __table_args__ = {"extend_existing": True}
+
+    id: int | None = Field(default=None, primary_key=True)
+    jti: str = Field(unique=True, index=True)
+    user_id: int | None = Field(default=None, foreign_key="users.id")
+    expires_at: float = Field(index=True)
+    created_at: float = Field(default_factory=lambda: datetime.now().timestamp())
+
+
+class Conversation(SQLModel, table=True):
+    """チャットのスレッド。一覧表示用の集計値はメッセージ保存時に更新する。"""
+
+    __tablename__ = "conversations"
+    __table_args__ = (
+        Index("ix_conversations_user_id_last_message_at", "user_id", "last_message_at"),
+        {"extend_existing": True},
+    )
+
+    id: int | None = Field(default=None, primary_key=True)
+    created_at: float = Field(default_factory=lambda: datetime.now().timestamp())
+
+    # 以下は chat_messages から導出できるが、一覧取得を1回のインデックス走査で
+    # 済ませるために非正規化して保持する
+    title: str | None = Field(default=None, nullable=True)
+    last_message_at: float = Field(default_factory=lambda: datetime.now().timestamp())
+    message_count: int = Field(default=0)
+
+    user_id: int = Field(foreign_key="users.id")
+    user: User | None = Relationship()
+
+
 class ChatMessage(SQLModel, table=True):
     """チャット履歴の1メッセージ（ユーザ/アシスタント両方）。"""
 
     __tablename__ = "chat_messages"
-    __table_args__ = {"extend_existing": True}
+    __table_args__ = (
+        Index(
+            "ix_chat_messages_conversation_id_created_at",
+            "conversation_id",
+            "created_at",
+        ),
+        # SQLite でもアーカイブへ移した ID を再利用しない（ベクトルインデックスと
+        # アーカイブは ID でメッセージを引くため）
+        {"extend_existing": True, "sqlite_autoincrement": True},
+    )
 
     id: int | None = Field(default=None, primary_key=True)
     created_at: float = Field(
@@ -46,10 +104,95 @@ class ChatMessage(SQLModel, table=True):
     )
 
     role: str = Field(index=True)  # "user" | "assistant"
-    content: str
+    # 閾値以上の本文は圧縮して保存する（app.utils.compression）
+    content: str = Field(sa_type=CompressedText, nullable=False)
 
     user_id: int = Field(foreign_key="users.id", index=True)
     user: User | None = Relationship()
 
+    conversation_id: int | None = Field(
+        default=None, foreign_key="conversations.id", nullable=True
+    )
+
+
+class ChatMessageArchive(SQLModel, table=True):
+    """保持期間を過ぎた chat_messages の退避先（コールドストレージ）。
+
+    ID は元の chat_messages.id をそのまま引き継ぎます。履歴を遡るときにしか
+    読まないため、インデックスは (user_id, created_at) のみに絞っています。
+    """
+
+    __tablename__ = "chat_messages_archive"
+    __table_args__ = (
+        Index("ix_chat_messages_archive_user_id_created_at", "user_id", "created_at"),
+        {"extend_existing": True},
+    )
+
+    id: int = Field(primary_key=True, sa_column_kwargs={"autoincrement": False})
+    created_at: float
+    role: str
+    content: str = Field(sa_type=CompressedText, nullable=False)
+    user_id: int
+    conversation_id: int | None = Field(default=None, nullable=True)
+
+
+class ChatImportJob(SQLModel, table=True):
+    """チャット履歴の一括インポート。コミット済みの行数を再開位置として保持する。"""
+
+    __tablename__ = "chat_import_jobs"
+    __table_args__ = {"extend_existing": True}
+
+    id: int | None = Field(default=None, primary_key=True)
+    created_at: float = Field(default_factory=lambda: datetime.now().timestamp())
+    updated_at: float = Field(default_factory=lambda: datetime.now().timestamp())
+
+    # "pending" | "running" | "completed" | "failed"
+    status: str = Field(default="pending")
+    lines_committed: int = Field(default=0)
+    messages_imported: int = Field(default=0)
+    error: str | None = Field(default=None, nullable=True)
+
+    user_id: int = Field(foreign_key="users.id", index=True)
+    conversation_id: int = Field(foreign_key="conversations.id")
+
+
+class ChatMessageStats(SQLModel, table=True):
+    """ユーザごとのメッセージ件数。COUNT(*) を避けるため書き込み時に更新する。"""
+
+    __tablename__ = "chat_message_stats"
+    __table_args__ = {"extend_existing": True}
+
+    user_id: int = Field(foreign_key="users.id", primary_key=True)
+    message_count: int = Field(default=0)
+    # message_count のうちアーカイブ済みの件数。0 なら履歴を遡ってもアーカイブを読まない
+    archived_count: int = Field(default=0)
+    # 履歴に追加・削除があるたびに増やす。履歴の ETag に使う
+    version: int = Field(default=0)
+
+
+# 全文検索インデックス（本番の PostgreSQL ではマイグレーションで作成）
+event.listen(
+    ChatMessage.__table__,
+    "after_create",
+    DDL(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS chat_messages_fts "
+        "USING fts5(content, owner)"
+    ).execute_if(dialect="sqlite"),
+)
+event.listen(
+    ChatMessage.__table__,
+    "before_drop",
+    DDL("DROP TABLE IF EXISTS chat_messages_fts").execute_if(dialect="sqlite"),
+)
+event.listen(
+    ChatMessage.__table__,
+    "after_create",
+    DDL(
+        "ALTER TABLE chat_messages ADD COLUMN IF NOT EXISTS search_vector tsvector; "
+        "CREATE INDEX IF NOT EXISTS ix_chat_messages_search_vector "
+        "ON chat_messages USING gin (search_vector)"
+    ).execute_if(dialect="postgresql"),
+)
+
 
 metadata = SQLModel.metadata
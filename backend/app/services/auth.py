@@ -1,17 +1,32 @@
+import hmac
 import os
 
+from app.repositories.user import UserRecord
 from app.schema import User
-from fastapi import Depends, HTTPException, status
+from app.utils.metrics import AUTH_LATENCY
+from fastapi import Depends, Header, HTTPException, status
 
 AUTH_SYSTEM = os.getenv("AUTH_SYSTEM")
+# 運用者向けエンドポイント（/api/admin）の認証に使うトークン。未設定なら無効
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
 
 if AUTH_SYSTEM == "clerk":
-    from app.utils.auth.clerk import create_new_user, get_auth_sub, get_authed_user
+    from app.utils.auth.clerk import (
+        create_new_user,
+        forget_user_versions,
+        get_auth_claims,
+        get_auth_sub,
+        get_authed_user,
+        get_authed_user_record,
+    )
 else:
     from app.utils.auth.email_password import (
         create_new_user,
+        forget_user_versions,
+        get_auth_claims,
         get_auth_sub,
         get_authed_user,
+        get_authed_user_record,
     )
 
 
@@ -24,14 +39,15 @@ async def user_sub(sub=Depends(get_auth_sub)) -> str | None:
     return sub
 
 
-async def auth_user(sub=Depends(get_auth_sub)) -> User:
-    if sub is None:
+async def auth_user(claims=Depends(get_auth_claims)) -> User:
+    if claims is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Not authenticated",
         )
 
-    user = await get_authed_user(sub)
+    with AUTH_LATENCY.time("load_user"):
+        user = await get_authed_user(claims)
 
     if user is None:
         raise HTTPException(
@@ -42,6 +58,52 @@ async def auth_user(sub=Depends(get_auth_sub)) -> User:
     return user
 
 
+async def auth_user_record(claims=Depends(get_auth_claims)) -> UserRecord:
+    """auth_user の読み取り専用版。更新を伴わないエンドポイントで使う。
+
+    email_password ではアクセストークンのクレームから組み立てるため、
+    ユーザの検索を省ける（version の確認のみ）。
+    """
+    if claims is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+        )
+
+    with AUTH_LATENCY.time("load_user_record"):
+        user = await get_authed_user_record(claims)
+
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="User not found",
+        )
+
+    return user
+
+
+def is_admin_token(token: str | None) -> bool:
+    if not ADMIN_TOKEN or not token:
+        return False
+    return hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+
+async def require_admin(x_admin_token: str | None = Header(default=None)) -> None:
+    if not ADMIN_TOKEN:
+        # 無効時はエンドポイントの存在自体を見せない
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin token required",
+        )
+
+
+def forget_auth_cache(user_id: int) -> None:
+    """プロフィール・パスワードの更新後に、このプロセスのトークン確認結果を捨てる。"""
+    forget_user_versions(user_id)
+
+
 def add_new_user(sub: str) -> User:
     user = create_new_user(sub)
     return user
@@ -1,37 +1,347 @@
+import base64
+import binascii
+import json
 import os
+import zlib
+from collections.abc import Iterator
+from datetime import datetime
 
+from anyio import to_thread
+from app.repositories.chat_archive import get_archived_messages
 from app.repositories.chat_history import (
     add_message,
+    clear_messages,
     get_last_messages,
+    get_message_created_at,
+    get_messages_by_ids,
+    iter_all_messages,
 )
-from app.schema import User
+from app.repositories.chat_search import search_messages
+from app.repositories.chat_stats import get_archived_count
+from app.repositories.conversation import (
+    create_conversation,
+    get_conversation,
+    get_latest_conversation,
+)
+from app.schema import ChatMessage, Conversation, User
+from app.services.chat_write_buffer import get_chat_write_buffer
+from app.utils.database_utils import get_db_session
+from app.utils.deadline import DeadlineExceeded, check_deadline
+from app.utils.embedding import get_embedder
 from app.utils.llm import generate_response
+from app.utils.vector_index import get_vector_index
+from fastapi import HTTPException, status
+from sqlalchemy import Row
 from sqlmodel import Session
 
 DEFAULT_HISTORY_LIMIT = int(os.getenv("CHAT_HISTORY_LIMIT", "30"))
 
+# コンテキストの組み立て方: "recent"（直近N件）| "retrieval"（関連メッセージ検索）
+CONTEXT_MODE = os.getenv("CHAT_CONTEXT_MODE", "recent")
+RETRIEVAL_TOP_K = int(os.getenv("CHAT_RETRIEVAL_TOP_K", "5"))
+RETRIEVAL_RECENT_LIMIT = int(os.getenv("CHAT_RETRIEVAL_RECENT_LIMIT", "6"))
+# 会話スレッドで絞り込む場合に top-k の何倍を検索するか（足りなければさらに倍へ）
+RETRIEVAL_OVERFETCH = int(os.getenv("CHAT_RETRIEVAL_OVERFETCH", "4"))
+RETRIEVAL_MAX_CANDIDATES = int(os.getenv("CHAT_RETRIEVAL_MAX_CANDIDATES", "1000"))
+
+# エクスポート時にサーバーサイドカーソルから一度に取得する件数
+EXPORT_FETCH_SIZE = int(os.getenv("CHAT_EXPORT_FETCH_SIZE", "500"))
+
+
+def get_user_conversation(
+    session: Session, user: User, conversation_id: int
+) -> Conversation:
+    """本人の会話スレッドを取得する。存在しなければ 404。"""
+    conversation = get_conversation(session, user, conversation_id)
+    if conversation is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Conversation not found",
+        )
+    return conversation
+
+
+async def build_context(
+    session: Session,
+    user: User,
+    prompt: str,
+    limit: int,
+    conversation_id: int | None = None,
+) -> list[Row]:
+    """LLM に渡す履歴を古い→新しい順で返す。
+
+    retrieval モードでは、直近の数件に加えて prompt と関連度の高い
+    過去メッセージを top-k 件だけ先頭に含めます。
+    """
+    if CONTEXT_MODE != "retrieval":
+        return get_last_messages(session, user, limit, conversation_id)
+
+    recent = get_last_messages(
+        session, user, min(limit, RETRIEVAL_RECENT_LIMIT), conversation_id
+    )
+    # 埋め込み（OpenAI なら HTTP の呼び出し）とインデックスの読み込みは
+    # イベントループを止めないようスレッドで行う
+    vectors = await to_thread.run_sync(
+        get_embedder().embed, [prompt], abandon_on_cancel=True
+    )
+    related = await to_thread.run_sync(
+        _search_related,
+        session,
+        user,
+        vectors[0],
+        [m.id for m in recent],
+        conversation_id,
+    )
+    return related + recent
+
+
+def _search_related(
+    session: Session,
+    user: User,
+    query,
+    exclude_ids: list[int],
+    conversation_id: int | None,
+) -> list[Row]:
+    """関連度の高いメッセージを top-k 件まで、古い→新しい順で返す。
+
+    ベクトルインデックスはユーザ単位のため、会話スレッドで絞り込む場合は
+    多めに検索し、スレッド内のメッセージが k 件に満たなければ検索件数を
+    増やして補充します。
+    """
+    index = get_vector_index()
+    fetch = RETRIEVAL_TOP_K
+    if conversation_id is not None:
+        fetch *= RETRIEVAL_OVERFETCH
+    while True:
+        ids = index.search(user.id, query, fetch, exclude_ids=exclude_ids)
+        rows = get_messages_by_ids(session, user, ids, conversation_id)
+        if (
+            len(rows) >= RETRIEVAL_TOP_K
+            or len(ids) < fetch
+            or fetch >= RETRIEVAL_MAX_CANDIDATES
+        ):
+            break
+        fetch = min(fetch * max(2, RETRIEVAL_OVERFETCH), RETRIEVAL_MAX_CANDIDATES)
+
+    rank = {message_id: i for i, message_id in enumerate(ids)}
+    top = sorted(rows, key=lambda row: rank[row.id])[:RETRIEVAL_TOP_K]
+    return sorted(top, key=lambda row: (row.created_at, row.id))
+
+
+def get_history_page(
+    session: Session,
+    user: User,
+    limit: int,
+    conversation_id: int | None = None,
+    cursor: str | None = None,
+    before_id: int | None = None,
+) -> tuple[list[Row], str | None]:
+    """履歴の1ページ分（古い→新しい順）と、さらに遡るためのカーソルを返す。
+
+    ページは (created_at, id) 順のため、カーソルも先頭行の (created_at, id) を
+    持ちます。before_id は互換のために残しており、そのメッセージの created_at を
+    引いて同じカーソルに変換します。chat_messages だけで limit 件に満たず
+    （＝ユーザが保持期間より前まで遡った場合）、アーカイブ済みのメッセージが
+    ある場合にのみ、続きをアーカイブから読み込みます。
+    """
+    before = None
+    if cursor:
+        before = _decode_cursor(cursor)
+    elif before_id is not None:
+        created_at = get_message_created_at(session, user, before_id)
+        if created_at is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor",
+            )
+        before = (created_at, before_id)
+
+    rows = get_last_messages(session, user, limit, conversation_id, before)
+    if len(rows) < limit and get_archived_count(session, user) > 0:
+        boundary = (rows[0].created_at, rows[0].id) if rows else before
+        archived = get_archived_messages(
+            session, user, limit - len(rows), boundary, conversation_id
+        )
+        rows = [*archived, *rows]
+    next_cursor = None
+    if rows and len(rows) == limit:
+        next_cursor = _encode_cursor(rows[0].created_at, rows[0].id)
+    return rows, next_cursor
+
+
+def index_messages(user: User, messages: list[ChatMessage]) -> None:
+    """retrieval モードの場合、保存したメッセージをベクトルインデックスへ追加。"""
+    index_message_vectors(
+        user.id, [m.id for m in messages], [m.content for m in messages]
+    )
+
+
+def index_message_vectors(
+    user_id: int, message_ids: list[int], contents: list[str]
+) -> None:
+    """retrieval モードの場合、ID と本文を指定してベクトルインデックスへ追加。"""
+    if CONTEXT_MODE != "retrieval" or not message_ids:
+        return
+    vectors = get_embedder().embed(contents)
+    get_vector_index().add(user_id, message_ids, vectors)
+
 
 async def send_chat(
-    prompt: str, user: User, session: Session, limit: int | None = None
-) -> str:
-    """履歴を含めて LLM に投げ、ユーザ/アシスタント両方を保存。"""
+    prompt: str,
+    user: User,
+    session: Session,
+    limit: int | None = None,
+    conversation_id: int | None = None,
+) -> tuple[str, int | None]:
+    """履歴を含めて LLM に投げ、ユーザ/アシスタント両方を保存。
+
+    conversation_id を省略した場合は最後に更新された会話スレッドを続けます
+    （まだ無ければ保存時に作成）。応答テキストと会話スレッドIDを返します。
+    """
     ctx_limit = limit or DEFAULT_HISTORY_LIMIT
 
-    # 直近メッセージを取得（古い→新しい順）
-    history = get_last_messages(session, user, ctx_limit)
+    if conversation_id is None:
+        conversation = get_latest_conversation(session, user)
+    else:
+        conversation = get_user_conversation(session, user, conversation_id)
+
+    # 履歴を取得（古い→新しい順）
+    history = (
+        await build_context(session, user, prompt, ctx_limit, conversation.id)
+        if conversation
+        else []
+    )
 
     messages = [{"role": m.role, "content": m.content} for m in history] + [
         {"role": "user", "content": prompt}
     ]
 
+    check_deadline()
     try:
-        response_text = generate_response(messages=messages)
+        # 期限切れ・切断でリクエストをキャンセルしたとき、LLM の応答を待たずに
+        # 戻れるようにする（スレッドは HTTP のタイムアウトで終わる）
+        response_text = await to_thread.run_sync(
+            generate_response, messages, abandon_on_cancel=True
+        )
+    except DeadlineExceeded:
+        raise
     except Exception as e:
         print(f"Error during response generation: {e}")
-        return "An error occurred while processing your request."
+        return (
+            "An error occurred while processing your request.",
+            conversation.id if conversation else None,
+        )
+
+    if conversation is None:
+        conversation = create_conversation(session, user)
 
     # 保存（ユーザの入力とアシスタントの応答）
-    add_message(session, user, role="user", content=prompt)
-    add_message(session, user, role="assistant", content=response_text)
+    write_buffer = get_chat_write_buffer()
+    if write_buffer is not None:
+        now = datetime.now().timestamp()
+        contents = [prompt, response_text]
+        ids = await write_buffer.submit(
+            [
+                {
+                    "user_id": user.id,
+                    "conversation_id": conversation.id,
+                    "role": role,
+                    "content": content,
+                    "created_at": now,
+                }
+                for role, content in zip(("user", "assistant"), contents, strict=True)
+            ]
+        )
+        await to_thread.run_sync(index_message_vectors, user.id, ids, contents)
+    else:
+        saved = [
+            add_message(session, user, "user", prompt, conversation),
+            add_message(session, user, "assistant", response_text, conversation),
+        ]
+        await to_thread.run_sync(index_messages, user, saved)
+
+    return response_text, conversation.id
+
+
+def clear_chat_history(session: Session, user: User) -> int:
+    """ユーザの履歴とベクトルインデックスを削除して件数を返す。"""
+    deleted = clear_messages(session, user)
+    if CONTEXT_MODE == "retrieval":
+        get_vector_index().drop(user.id)
+    return deleted
+
+
+def export_history(user_id: int, compress: bool = False) -> Iterator[bytes]:
+    """アーカイブを含む全履歴を NDJSON（1行1メッセージ）として逐次生成する。
+
+    StreamingResponse から呼ばれ、リクエストのセッションとは独立した
+    セッションで読み込みます。compress=True の場合は gzip 形式で返し、
+    バッチごとに flush するためクライアントは受信しながら展開できます。
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    # 最初の取得を待たずに応答を始める（gzip ならヘッダ、そうでなければ空のチャンク。
+    # 圧縮ミドルウェアは最初のチャンクを受け取った時点で応答を送り始める）
+    yield compressor.flush(zlib.Z_SYNC_FLUSH) if compressor is not None else b""
 
-    return response_text
+    with get_db_session() as session:
+        for rows in iter_all_messages(session, user_id, EXPORT_FETCH_SIZE):
+            chunk = "".join(
+                json.dumps(
+                    {
+                        "id": r.id,
+                        "conversation_id": r.conversation_id,
+                        "role": r.role,
+                        "content": r.content,
+                        "created_at": r.created_at,
+                    },
+                    ensure_ascii=False,
+                )
+                + "\n"
+                for r in rows
+            ).encode()
+            if compressor is not None:
+                chunk = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            yield chunk
+
+    if compressor is not None:
+        yield compressor.flush()
+
+
+def _encode_cursor(key: float, message_id: int) -> str:
+    raw = json.dumps([key, message_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def _decode_cursor(cursor: str) -> tuple[float, int]:
+    try:
+        key, message_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(key), int(message_id)
+    except (binascii.Error, ValueError, TypeError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor",
+        ) from e
+
+
+def search_history(
+    session: Session, user: User, query: str, limit: int, cursor: str | None = None
+) -> dict:
+    """履歴を全文検索し、ヒットと次ページ用のカーソルを返す。"""
+    after = _decode_cursor(cursor) if cursor else None
+    # 1件多く取得して次ページの有無を判定する
+    rows = search_messages(session, user, query, limit + 1, after)
+    hits = [
+        {
+            "id": r.id,
+            "role": r.role,
+            "snippet": r.snippet,
+            "created_at": r.created_at,
+            "rank": float(r.rank),
+        }
+        for r in rows[:limit]
+    ]
+    next_cursor = None
+    if len(rows) > limit:
+        last = hits[-1]
+        next_cursor = _encode_cursor(last["rank"], last["id"])
+    return {"hits": hits, "next_cursor": next_cursor}
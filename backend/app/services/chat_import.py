@@ -0,0 +1,200 @@
+import asyncio
+import os
+from collections.abc import AsyncIterator, Callable
+from datetime import datetime
+
+from app.models.chat import ChatImportLineModel
+from app.repositories.chat_history import bulk_add_messages
+from app.repositories.chat_import import (
+    claim_import_job,
+    create_import_job,
+    get_import_job,
+    update_import_progress,
+)
+from app.repositories.conversation import create_conversation
+from app.schema import ChatImportJob, User
+from app.services.chat import get_user_conversation, index_message_vectors
+from app.utils.deadline import DeadlineExceeded, clear_deadline
+from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+from sqlmodel import Session
+
+# 1トランザクションでコミットする行数
+IMPORT_BATCH_SIZE = int(os.getenv("CHAT_IMPORT_BATCH_SIZE", "1000"))
+
+# running のまま更新がこの秒数途絶えたジョブは、処理中のプロセスが
+# 落ちたものとみなして別のリクエストから再開できる
+IMPORT_CLAIM_TIMEOUT = float(os.getenv("CHAT_IMPORT_CLAIM_TIMEOUT", "600"))
+
+IMPORTED_CONVERSATION_TITLE = "Imported history"
+
+
+def start_import(
+    session: Session, user: User, conversation_id: int | None = None
+) -> ChatImportJob:
+    """インポートジョブを作成する。会話スレッド未指定なら新しく作成する。"""
+    if conversation_id is None:
+        conversation = create_conversation(session, user, IMPORTED_CONVERSATION_TITLE)
+    else:
+        conversation = get_user_conversation(session, user, conversation_id)
+    return create_import_job(session, user, conversation.id)
+
+
+def get_user_import_job(session: Session, user: User, job_id: int) -> ChatImportJob:
+    """本人のインポートジョブを取得する。存在しなければ 404。"""
+    job = get_import_job(session, user, job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Import job not found",
+        )
+    return job
+
+
+async def _iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """受信したチャンクを行単位に分割する（本文全体はメモリに載せない）。"""
+    pending = b""
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line
+    if pending:
+        yield pending
+
+
+def _commit_batch(
+    session: Session,
+    job: ChatImportJob,
+    rows: list[dict],
+    lines_committed: int,
+    job_status: str,
+) -> None:
+    ids = bulk_add_messages(session, rows)
+    if not update_import_progress(
+        session,
+        job,
+        lines_committed,
+        job.messages_imported + len(ids),
+        job_status,
+    ):
+        session.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Import is running in another request",
+        )
+    session.commit()
+    index_message_vectors(job.user_id, ids, [r["content"] for r in rows])
+
+
+def _fail(session: Session, job: ChatImportJob, error: str) -> None:
+    update_import_progress(
+        session, job, job.lines_committed, job.messages_imported, "failed", error
+    )
+    session.commit()
+
+
+async def _run_session[T](func: Callable[..., T], *args) -> T:
+    """セッションを使う処理をスレッドプールで実行する。
+
+    キャンセルされてもスレッドの処理は止まらないため、終わるのを待ってから
+    キャンセルを伝える（中断後の記録と同じセッションを同時に使わないように）。
+    """
+    future = asyncio.ensure_future(run_in_threadpool(func, *args))
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        await asyncio.wait({future})
+        raise
+
+
+def _interrupted(session: Session, job: ChatImportJob) -> None:
+    # 期限切れで中断した場合でも記録できるよう、期限を外して実行する
+    clear_deadline()
+    # 未コミットのバッチを捨ててから失敗として記録する
+    session.rollback()
+    session.refresh(job)
+    _fail(session, job, "Upload interrupted")
+
+
+async def import_history(
+    session: Session, job: ChatImportJob, chunks: AsyncIterator[bytes]
+) -> ChatImportJob:
+    """NDJSON（1行1メッセージ）を受信しながらバッチ単位で保存する。
+
+    各バッチは進捗の更新と同じトランザクションでコミットされるため、
+    途中で切断・失敗しても同じファイルを先頭から送り直せば、
+    コミット済みの行（lines_committed）を読み飛ばして続きから再開します。
+    受信を始める前にジョブを running として取得するため、同じジョブへの
+    2つ目の同時アップロードは 409 になります。
+    """
+    if job.status == "completed":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Import already completed",
+        )
+    stale_before = datetime.now().timestamp() - IMPORT_CLAIM_TIMEOUT
+    if not await _run_session(claim_import_job, session, job, stale_before):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Import is running in another request",
+        )
+    try:
+        return await _import_lines(session, job, chunks)
+    except HTTPException as e:
+        if isinstance(e, DeadlineExceeded):
+            await _run_session(_interrupted, session, job)
+        raise
+    except BaseException:
+        # 切断・キャンセルなどで中断した場合は、すぐに送り直せるよう failed にしておく
+        # （キャンセルされても記録は最後まで行う）
+        await _run_session(_interrupted, session, job)
+        raise
+
+
+async def _import_lines(
+    session: Session, job: ChatImportJob, chunks: AsyncIterator[bytes]
+) -> ChatImportJob:
+    skip = job.lines_committed
+    user_id, conversation_id = job.user_id, job.conversation_id
+    line_no = 0
+    rows: list[dict] = []
+    async for raw in _iter_lines(chunks):
+        line_no += 1
+        if line_no <= skip or not raw.strip():
+            continue
+        try:
+            item = ChatImportLineModel.model_validate_json(raw)
+        except ValidationError as e:
+            # 失敗行の直前までは保存してから打ち切る
+            if rows:
+                await _run_session(
+                    _commit_batch, session, job, rows, line_no - 1, "running"
+                )
+            error = f"Invalid line {line_no}"
+            await _run_session(_fail, session, job, error)
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail=error
+            ) from e
+        rows.append(
+            {
+                "user_id": user_id,
+                "conversation_id": conversation_id,
+                "role": item.role,
+                "content": item.content,
+                "created_at": (
+                    item.created_at
+                    if item.created_at is not None
+                    else datetime.now().timestamp()
+                ),
+            }
+        )
+        if len(rows) >= IMPORT_BATCH_SIZE:
+            await _run_session(_commit_batch, session, job, rows, line_no, "running")
+            rows = []
+
+    await _run_session(
+        _commit_batch, session, job, rows, max(line_no, skip), "completed"
+    )
+    return job
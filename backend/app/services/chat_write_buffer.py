@@ -0,0 +1,161 @@
+"""チャットメッセージの write-behind（グループコミット）
+
+同時に届いた複数リクエストのメッセージをキューに溜め、MAX_DELAY_MS ミリ秒
+経過するか MAX_ROWS 件に達した時点で1回の複数行 INSERT と1回のコミットで
+保存します。各リクエストは自分のメッセージを含むコミットの完了を待つため、
+応答を返した時点で保存済みである点は従来と変わりません。
+
+まとめた保存が失敗した場合は、リクエストごとに保存し直します。失敗の原因と
+なったリクエスト（例: 同時に削除された会話スレッドへのメッセージ）だけが
+エラーになり、同じバッチの他のリクエストには影響しません。
+"""
+
+import asyncio
+import logging
+import os
+from collections.abc import Callable
+from contextlib import AbstractContextManager, suppress
+
+from app.repositories.chat_history import bulk_add_messages
+from app.utils.database_utils import get_db_session
+from fastapi.concurrency import run_in_threadpool
+from sqlmodel import Session
+
+WRITE_BEHIND_ENABLED = os.getenv("CHAT_WRITE_BEHIND", "false").lower() == "true"
+MAX_DELAY_MS = float(os.getenv("CHAT_WRITE_BEHIND_MAX_DELAY_MS", "5"))
+MAX_ROWS = int(os.getenv("CHAT_WRITE_BEHIND_MAX_ROWS", "200"))
+
+logger = logging.getLogger(__name__)
+
+
+class ChatWriteBuffer:
+    """メッセージをまとめて保存するバッファ。イベントループ内で1つだけ動かす。"""
+
+    def __init__(
+        self,
+        max_delay: float = MAX_DELAY_MS / 1000,
+        max_rows: int = MAX_ROWS,
+        session_factory: Callable[[], AbstractContextManager[Session]] = get_db_session,
+    ):
+        self.max_delay = max_delay
+        self.max_rows = max_rows
+        self.session_factory = session_factory
+        self.flush_count = 0
+        self._pending: list[tuple[list[dict], asyncio.Future[list[int]]]] = []
+        self._pending_rows = 0
+        self._has_pending = asyncio.Event()
+        self._full = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._closing = False
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """受付済みのメッセージを全て保存してから停止する。"""
+        self._closing = True
+        self._has_pending.set()
+        self._full.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+
+    async def submit(self, rows: list[dict]) -> list[int]:
+        """メッセージを書き込み待ちに追加し、コミット後に採番された ID を返す。
+
+        rows の形式は bulk_add_messages と同じです。保存に失敗した場合は
+        その例外がそのまま送出されます。
+        """
+        if self._task is None or self._closing:
+            raise RuntimeError("ChatWriteBuffer is not running")
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((rows, future))
+        self._pending_rows += len(rows)
+        self._has_pending.set()
+        if self._pending_rows >= self.max_rows:
+            self._full.set()
+        return await future
+
+    async def _run(self) -> None:
+        while True:
+            await self._has_pending.wait()
+            if not self._closing:
+                # 最初のメッセージから max_delay だけ後続を待つ
+                with suppress(TimeoutError):
+                    await asyncio.wait_for(self._full.wait(), self.max_delay)
+            batch, self._pending = self._pending, []
+            self._pending_rows = 0
+            self._has_pending.clear()
+            self._full.clear()
+            if batch:
+                await self._flush(batch)
+            if self._closing and not self._pending:
+                return
+
+    async def _flush(
+        self, batch: list[tuple[list[dict], asyncio.Future[list[int]]]]
+    ) -> None:
+        rows = [row for entry, _ in batch for row in entry]
+        try:
+            ids = await run_in_threadpool(self._write, rows)
+        except Exception:
+            if len(batch) > 1:
+                logger.warning(
+                    "Group commit of %d requests failed; retrying one by one",
+                    len(batch),
+                    exc_info=True,
+                )
+            await self._flush_each(batch)
+            return
+        offset = 0
+        for entry, future in batch:
+            if not future.done():
+                future.set_result(ids[offset : offset + len(entry)])
+            offset += len(entry)
+
+    async def _flush_each(
+        self, batch: list[tuple[list[dict], asyncio.Future[list[int]]]]
+    ) -> None:
+        """バッチを1リクエストずつ保存し、失敗したリクエストにだけ例外を返す。"""
+        for entry, future in batch:
+            try:
+                ids = await run_in_threadpool(self._write, entry)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(ids)
+
+    def _write(self, rows: list[dict]) -> list[int]:
+        with self.session_factory() as session:
+            try:
+                ids = bulk_add_messages(session, rows)
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+        self.flush_count += 1
+        return ids
+
+
+_buffer: ChatWriteBuffer | None = None
+
+
+def get_chat_write_buffer() -> ChatWriteBuffer | None:
+    """起動中のバッファを返す。write-behind が無効なら None。"""
+    return _buffer
+
+
+async def start_chat_write_buffer() -> None:
+    global _buffer
+    if WRITE_BEHIND_ENABLED and _buffer is None:
+        _buffer = ChatWriteBuffer()
+        _buffer.start()
+
+
+async def stop_chat_write_buffer() -> None:
+    global _buffer
+    if _buffer is not None:
+        await _buffer.stop()
+        _buffer = None
@@ -0,0 +1,182 @@
+"""メールの送信キュー（outbox）
+
+リクエストの処理では submit() で送信を予約するだけで、SMTP との通信は待ちません。
+予約した処理はイベントループ上のワーカーがスレッドプールで実行します。
+
+- 本文の組み立て（DB の参照・トークンの発行など）は1回だけ実行する
+- 送信に失敗した場合は MAIL_RETRY_BASE_SECONDS から倍々に（±50% の揺らぎ付きで）
+  間隔を空け、最大 MAIL_MAX_ATTEMPTS 回まで送り直す。待っている間も他のメールの
+  送信は止めない
+- キューの長さは MAIL_OUTBOX_SIZE 件まで。満杯の場合は予約を捨ててログに残す
+
+キューはプロセス内のメモリにあるため、停止時に送信できなかったメールは失われます。
+停止時は MAIL_OUTBOX_DRAIN_SECONDS 秒まで送信の完了を待ちます。
+"""
+
+import asyncio
+import logging
+import os
+import random
+from collections.abc import Callable
+from contextlib import suppress
+from dataclasses import dataclass
+from email.message import EmailMessage
+
+from app.utils.mailer import Mailer, get_mailer
+from fastapi.concurrency import run_in_threadpool
+
+MAIL_OUTBOX_SIZE = int(os.getenv("MAIL_OUTBOX_SIZE", "1000"))
+MAIL_OUTBOX_WORKERS = int(os.getenv("MAIL_OUTBOX_WORKERS", "2"))
+MAIL_MAX_ATTEMPTS = int(os.getenv("MAIL_MAX_ATTEMPTS", "5"))
+MAIL_RETRY_BASE_SECONDS = float(os.getenv("MAIL_RETRY_BASE_SECONDS", "1"))
+MAIL_OUTBOX_DRAIN_SECONDS = float(os.getenv("MAIL_OUTBOX_DRAIN_SECONDS", "10"))
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Job:
+    compose: Callable[[], EmailMessage | None]
+    message: EmailMessage | None = None
+    attempts: int = 0
+
+
+class MailOutbox:
+    """予約されたメールを送信する。イベントループ内で1つだけ動かす。"""
+
+    def __init__(
+        self,
+        mailer: Mailer | None = None,
+        max_size: int = MAIL_OUTBOX_SIZE,
+        workers: int = MAIL_OUTBOX_WORKERS,
+        max_attempts: int = MAIL_MAX_ATTEMPTS,
+        retry_base: float = MAIL_RETRY_BASE_SECONDS,
+    ):
+        self.mailer = mailer or get_mailer()
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self._queue: asyncio.Queue[_Job] = asyncio.Queue(max_size)
+        self._tasks: list[asyncio.Task] = []
+        self._retries: set[asyncio.Task] = set()
+
+    def start(self) -> None:
+        self._tasks = [
+            asyncio.create_task(self._work()) for _ in range(max(1, self.workers))
+        ]
+
+    async def stop(self, timeout: float = MAIL_OUTBOX_DRAIN_SECONDS) -> None:
+        """予約済みのメールの送信を timeout 秒まで待ってから停止する。"""
+        with suppress(TimeoutError):
+            await asyncio.wait_for(self.join(), timeout)
+        remaining = self._queue.qsize() + len(self._retries)
+        if remaining:
+            logger.warning("Mail outbox stopped with %d unsent messages", remaining)
+        for task in [*self._tasks, *self._retries]:
+            task.cancel()
+        for task in [*self._tasks, *self._retries]:
+            with suppress(asyncio.CancelledError):
+                await task
+        self._tasks = []
+
+    async def join(self) -> None:
+        """予約済みのメール（再送待ちを含む）の処理が全て終わるまで待つ。"""
+        while True:
+            await self._queue.join()
+            if not self._retries:
+                return
+            await asyncio.wait(set(self._retries))
+
+    def submit(self, compose: Callable[[], EmailMessage | None]) -> bool:
+        """送信を予約する（待たない）。
+
+        compose はスレッドプールで1回だけ呼ばれ、送信するメールを返します
+        （None なら送信しない）。キューが満杯なら予約せずに False を返します。
+        """
+        if not self._tasks:
+            raise RuntimeError("MailOutbox is not running")
+        try:
+            self._queue.put_nowait(_Job(compose))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.error("Mail outbox is full; dropped a message")
+            return False
+        return True
+
+    async def _work(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._process(job)
+            except Exception:
+                logger.exception("Failed to process a mail job")
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, job: _Job) -> None:
+        if job.message is None:
+            # 本文の組み立てはトークンの発行などを含むため、失敗しても繰り返さない
+            job.message = await run_in_threadpool(job.compose)
+            if job.message is None:
+                return
+        try:
+            await run_in_threadpool(self.mailer.send, job.message)
+        except Exception:
+            job.attempts += 1
+            if job.attempts >= self.max_attempts:
+                self.failed += 1
+                logger.exception(
+                    "Giving up sending mail to %s after %d attempts",
+                    job.message["To"],
+                    job.attempts,
+                )
+                return
+            delay = self.retry_base * 2 ** (job.attempts - 1) * random.uniform(0.5, 1.5)
+            logger.warning(
+                "Failed to send mail to %s (attempt %d); retrying in %.1fs",
+                job.message["To"],
+                job.attempts,
+                delay,
+                exc_info=True,
+            )
+            task = asyncio.create_task(self._retry_later(job, delay))
+            self._retries.add(task)
+            task.add_done_callback(self._retries.discard)
+        else:
+            self.sent += 1
+
+    async def _retry_later(self, job: _Job, delay: float) -> None:
+        await asyncio.sleep(delay)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.error(
+                "Mail outbox is full; dropped a retry to %s", job.message["To"]
+            )
+
+
+_outbox: MailOutbox | None = None
+
+
+def get_mail_outbox() -> MailOutbox:
+    if _outbox is None:
+        raise RuntimeError("MailOutbox is not running")
+    return _outbox
+
+
+async def start_mail_outbox() -> None:
+    global _outbox
+    if _outbox is None:
+        _outbox = MailOutbox()
+        _outbox.start()
+
+
+async def stop_mail_outbox() -> None:
+    global _outbox
+    if _outbox is not None:
+        await _outbox.stop()
+        _outbox = None
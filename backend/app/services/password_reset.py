@@ -1,42 +1,147 @@
+"""パスワードのリセット・変更
+
+リセット用トークンは SHA-256 のハッシュだけを保存し、ハッシュの一意インデックスで
+検索します。
+
+- 有効なトークンのハッシュをプロセス内の集合に持ち、集合にないハッシュ（推測された
+  トークンなど）は DB を引かずに拒否する。集合は起動時に読み込み、発行・使用の
+  たびに更新する。他のワーカーで発行されたトークンは PASSWORD_RESET_SYNC_SECONDS 秒
+  ごとに追加分を読み込んで反映するため、最大この秒数だけ使えるようになるのが遅れる
+- PASSWORD_RESET_SYNC_SECONDS を 0 以下にすると集合を使わず、毎回 DB を引く。
+  集合は読み込みでしか他のワーカーの発行を知らないため、複数のワーカーで動かす
+  場合に読み込みだけを止める（他のワーカーのトークンを拒否する）設定にはしない
+- 期限切れのトークンは PASSWORD_RESET_SWEEP_SECONDS 秒ごとに
+  PASSWORD_RESET_SWEEP_BATCH 件ずつ削除する（1回のトランザクションを短く保つ）
+"""
+
+import asyncio
 import hashlib
+import logging
 import os
 import secrets
+import time
+from contextlib import suppress
 from datetime import datetime, timedelta
+from email.message import EmailMessage
+from functools import partial
 
 from app.repositories.password_reset import (
     create_token,
+    delete_expired_tokens,
     get_active_token_by_hash,
+    get_live_token_hashes,
 )
 from app.repositories.user import get_user_br_column
 from app.schema import User
-from app.utils.auth.email_password import get_password_hash, verify_password
+from app.services.mail_outbox import get_mail_outbox
+from app.utils.auth.email_password import (
+    forget_user_versions,
+    get_password_hash,
+    verify_password,
+)
+from app.utils.database_utils import get_db_session
+from app.utils.mailer import build_message
 from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from sqlmodel import Session
 
 TOKEN_EXPIRE_MINUTES = 1440
 FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:3000")
+# 0 以下なら集合での拒否を行わず、常に DB を引く
+SYNC_SECONDS = float(os.getenv("PASSWORD_RESET_SYNC_SECONDS", "5"))
+# 追加分の読み込みで前回と重ねて読む秒数（読み込み中にコミットされた行を取りこぼさない）
+SYNC_OVERLAP_SECONDS = 60
+SWEEP_INTERVAL_SECONDS = float(os.getenv("PASSWORD_RESET_SWEEP_SECONDS", "3600"))
+SWEEP_BATCH_SIZE = int(os.getenv("PASSWORD_RESET_SWEEP_BATCH", "1000"))
+
+logger = logging.getLogger(__name__)
+
+# 有効なトークンのハッシュ -> 有効期限
+_live_hashes: dict[str, float] = {}
+# 前回の読み込みを始めた時刻（未読み込みなら None）
+_last_sync: float | None = None
 
 
 def _hash_token(token: str) -> str:
     return hashlib.sha256(token.encode()).hexdigest()
 
 
-def request_password_reset(email: str, session: Session) -> None:
-    user = get_user_br_column(session, email, "email")
-    if not user:
-        return
-    plain_token = secrets.token_urlsafe(32)
-    token_hash = _hash_token(plain_token)
-    expires_at = datetime.now() + timedelta(minutes=TOKEN_EXPIRE_MINUTES)
-    create_token(session, user.id, token_hash, expires_at)
+def _load_live_hashes(since: float) -> list[tuple[str, float]]:
+    with get_db_session() as session:
+        return get_live_token_hashes(session, since)
+
+
+async def sync_live_hashes() -> None:
+    """DB の有効なトークンのハッシュを集合へ反映する。
+
+    初回は有効な全トークンを、以降は前回の読み込み以降に発行されたトークン
+    （有効期限が発行時刻 + TOKEN_EXPIRE_MINUTES 以降）だけを読み込みます。
+    """
+    global _last_sync
+    now = time.time()
+    since = now
+    if _last_sync is not None:
+        issued_after = _last_sync - SYNC_OVERLAP_SECONDS
+        since = max(now, issued_after + TOKEN_EXPIRE_MINUTES * 60)
+    entries = await run_in_threadpool(_load_live_hashes, since)
+    _live_hashes.update(entries)
+    _last_sync = now
+
+
+def _prune_live_hashes(now: float) -> None:
+    for token_hash, expires_at in list(_live_hashes.items()):
+        if expires_at < now:
+            _live_hashes.pop(token_hash, None)
+
+
+def _revoke_tokens(user: User) -> None:
+    # 発行済みのアクセストークンは tv が一致しなくなり、以降は拒否される
+    user.token_version = User.token_version + 1
+
+
+def compose_password_reset_email(email: str) -> EmailMessage | None:
+    """リセット用トークンを発行し、送信するメールを返す（ユーザがいなければ None）。"""
+    with get_db_session() as session:
+        user = get_user_br_column(session, email, "email")
+        if not user:
+            return None
+        plain_token = secrets.token_urlsafe(32)
+        token_hash = _hash_token(plain_token)
+        expires_at = datetime.now() + timedelta(minutes=TOKEN_EXPIRE_MINUTES)
+        token_entry = create_token(session, user.id, token_hash, expires_at)
+    _live_hashes[token_hash] = token_entry.expires_at
     reset_url = f"{FRONTEND_URL}/auth/reset-password?token={plain_token}"
-    print(f"Password reset URL for {email}: {reset_url}")
+    return build_message(
+        email,
+        "Reset your password",
+        "Use the link below to reset your password. "
+        f"The link expires in {TOKEN_EXPIRE_MINUTES // 60} hours.\n\n"
+        f"{reset_url}\n\n"
+        "If you did not request a password reset, you can ignore this email.\n",
+    )
+
+
+def request_password_reset(email: str) -> None:
+    """リセット用メールの送信を予約する。
+
+    ユーザの検索・トークンの発行・送信は送信キューで行うため、メールアドレスが
+    登録済みかどうかによらず同じ時間で戻ります（応答時間から登録の有無が分からない）。
+    """
+    get_mail_outbox().submit(partial(compose_password_reset_email, email))
 
 
 def reset_password(token: str, new_password: str, session: Session) -> None:
     token_hash = _hash_token(token)
-    token_entry = get_active_token_by_hash(session, token_hash)
+    # 集合にないハッシュは DB を引かずに拒否する（推測されたトークンで DB を引かせない）。
+    # 集合を同期しない設定では、他のワーカーの発行を知らないため常に DB を引く
+    token_entry = (
+        get_active_token_by_hash(session, token_hash)
+        if SYNC_SECONDS <= 0 or token_hash in _live_hashes
+        else None
+    )
     if not token_entry:
+        # 他のワーカーで使用済み・期限切れのハッシュも集合から除く
+        _live_hashes.pop(token_hash, None)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid token",
@@ -48,9 +153,13 @@ def reset_password(token: str, new_password: str, session: Session) -> None:
         )
     user = token_entry.user
     user.password = get_password_hash(new_password)
+    _revoke_tokens(user)
     session.add(user)
     session.delete(token_entry)
     session.commit()
+    # 使用済みのトークンは削除したので、以降の再送は DB を引かずに拒否する
+    _live_hashes.pop(token_hash, None)
+    forget_user_versions(user.id)
 
 
 def change_password(
@@ -72,5 +181,70 @@ def change_password(
         )
 
     user.password = get_password_hash(new_password)
+    _revoke_tokens(user)
     session.add(user)
     session.commit()
+    session.refresh(user)
+    forget_user_versions(user.id)
+
+
+def sweep_expired_tokens(now: float | None = None) -> int:
+    """期限切れのトークンを全て削除し、削除した件数を返す。"""
+    now = datetime.now().timestamp() if now is None else now
+    _prune_live_hashes(now)
+    total = 0
+    while True:
+        # バッチごとに別のトランザクションでコミットし、ロックを長く持たない
+        with get_db_session() as session:
+            deleted = delete_expired_tokens(session, now, SWEEP_BATCH_SIZE)
+        total += deleted
+        if deleted < SWEEP_BATCH_SIZE:
+            return total
+
+
+async def _sync_periodically() -> None:
+    while True:
+        await asyncio.sleep(SYNC_SECONDS)
+        try:
+            await sync_live_hashes()
+        except Exception:
+            logger.exception("Failed to load password reset tokens")
+
+
+async def _sweep_periodically() -> None:
+    while True:
+        await asyncio.sleep(SWEEP_INTERVAL_SECONDS)
+        try:
+            deleted = await run_in_threadpool(sweep_expired_tokens)
+            if deleted:
+                logger.info("Deleted %d expired password reset tokens", deleted)
+        except Exception:
+            logger.exception("Failed to delete expired password reset tokens")
+
+
+_sweeper: asyncio.Task | None = None
+_syncer: asyncio.Task | None = None
+
+
+async def start_reset_token_sweeper() -> None:
+    global _sweeper, _syncer
+    if SYNC_SECONDS > 0:
+        try:
+            await sync_live_hashes()
+        except Exception:
+            logger.exception("Failed to load password reset tokens")
+        if _syncer is None:
+            _syncer = asyncio.create_task(_sync_periodically())
+    if SWEEP_INTERVAL_SECONDS > 0 and _sweeper is None:
+        _sweeper = asyncio.create_task(_sweep_periodically())
+
+
+async def stop_reset_token_sweeper() -> None:
+    global _sweeper, _syncer
+    for task in (_syncer, _sweeper):
+        if task is not None:
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+    _sweeper = None
+    _syncer = None
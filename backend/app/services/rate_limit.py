@@ -0,0 +1,96 @@
+"""エンドポイントごとのレート制限
+
+制限はルールの名前で指定し、上限は環境変数 ``RATE_LIMIT_<名前>``（"件数/秒数"、
+例: RATE_LIMIT_SIGNIN_IP="20/60"）で変更できます。上限を 0 にするとそのルールは
+無効になります。超過したリクエストは 429 と Retry-After（秒）を返します。
+
+- IP 単位: limit_by_ip(名前) を依存関係に指定する
+- ユーザ単位: limit_by_user(名前)（未認証ならIP単位）
+- メールアドレスなど本文の値: エンドポイントの中で check_rate_limit を呼ぶ
+  （失敗だけを数える場合は、処理の前に count=False で確認し、失敗したときに数える）
+"""
+
+import math
+import os
+
+from app.services.auth import get_auth_claims
+from app.utils.metrics import RATE_LIMITED
+from app.utils.rate_limit import RateLimit, get_rate_limit_backend
+from fastapi import Depends, HTTPException, Request, status
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+# リバースプロキシの後ろで動かす場合は X-Forwarded-For の先頭をクライアントの IP とする
+RATE_LIMIT_TRUST_FORWARDED = (
+    os.getenv("RATE_LIMIT_TRUST_FORWARDED", "false").lower() == "true"
+)
+
+
+def _rule(name: str, default: str, algorithm: str = "sliding_window") -> RateLimit:
+    limit, window = os.getenv(f"RATE_LIMIT_{name.upper()}", default).split("/")
+    return RateLimit(name, int(limit), float(window), algorithm)
+
+
+RULES: dict[str, RateLimit] = {
+    rule.name: rule
+    for rule in (
+        # bcrypt の検証を伴うため、IP と（メールアドレス, IP）の組で制限する。
+        # メールアドレスだけで数えると、他人がそのユーザのログインを止められる。
+        # （メールアドレス, IP）の組は失敗だけを数える（本人の繰り返しのログインは止めない）
+        _rule("signin_ip", "20/60"),
+        _rule("signin_email", "10/300"),
+        _rule("forgot_password_ip", "5/300"),
+        _rule("forgot_password_email", "3/3600"),
+        _rule("reset_password_ip", "10/300"),
+        # LLM の呼び出しを伴う。短時間のまとまった送信は容量まで許す
+        _rule("chat_user", "30/60", "token_bucket"),
+    )
+}
+
+
+def client_ip(request: Request) -> str:
+    if RATE_LIMIT_TRUST_FORWARDED:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",", 1)[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def check_rate_limit(name: str, key: str, count: bool = True) -> None:
+    """ルール name でキー key を1件数え、上限を超えていれば 429 を送出する。
+
+    count=False の場合は数えずに、次の1件が上限を超えるかだけを確認する。
+    """
+    rule = RULES[name]
+    if not RATE_LIMIT_ENABLED or rule.limit <= 0:
+        return
+    backend = get_rate_limit_backend()
+    if count:
+        retry_after = backend.hit(f"{name}:{key}", rule)
+    else:
+        retry_after = backend.peek(f"{name}:{key}", rule)
+    if retry_after > 0:
+        RATE_LIMITED.inc(name)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+
+def limit_by_ip(name: str):
+    async def dependency(request: Request) -> None:
+        check_rate_limit(name, client_ip(request))
+
+    return dependency
+
+
+def limit_by_user(name: str):
+    async def dependency(
+        request: Request, claims: dict | None = Depends(get_auth_claims)
+    ) -> None:
+        if claims:
+            check_rate_limit(name, f"user:{claims['sub']}")
+        else:
+            check_rate_limit(name, f"ip:{client_ip(request)}")
+
+    return dependency
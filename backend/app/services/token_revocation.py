@@ -0,0 +1,97 @@
+"""アクセストークンの失効（ログアウト）
+
+失効させた jti は revoked_tokens テーブルへ保存し、同じプロセスの拒否リスト
+（app.utils.auth.denylist）へ即座に追加します。他のプロセスは
+AUTH_DENYLIST_SYNC_SECONDS 秒ごとにテーブルを読み込んで反映するため、
+他のワーカーでは最大この秒数だけ反映が遅れます。同じ周期で、有効期限を
+過ぎた行をテーブルから削除します。
+
+パスワードの変更・再設定による全トークンの失効は users.token_version で
+行います（こちらは遅れなく反映されます）。
+"""
+
+import asyncio
+import logging
+import os
+import time
+from contextlib import suppress
+
+from app.repositories.revoked_token import (
+    add_revoked_token,
+    delete_expired_revoked_tokens,
+    get_live_revoked_tokens,
+)
+from app.utils.auth.denylist import denylist
+from app.utils.database_utils import get_db_session
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session
+
+DENYLIST_SYNC_SECONDS = float(os.getenv("AUTH_DENYLIST_SYNC_SECONDS", "5"))
+
+logger = logging.getLogger(__name__)
+
+
+def revoke_access_token(session: Session, claims: dict) -> None:
+    jti = claims.get("jti")
+    if jti is None:
+        # jti を持たない旧形式のトークンは個別に失効できない（有効期限で切れる）
+        return
+    expires_at = float(claims["exp"])
+    try:
+        add_revoked_token(session, jti, claims.get("uid"), expires_at)
+    except IntegrityError:
+        # 他のワーカーで失効済み
+        session.rollback()
+    denylist.add(jti, expires_at)
+
+
+def _load_revocations(now: float) -> list[tuple[str, float]]:
+    with get_db_session() as session:
+        return get_live_revoked_tokens(session, now)
+
+
+def _delete_expired(now: float) -> int:
+    with get_db_session() as session:
+        return delete_expired_revoked_tokens(session, now)
+
+
+async def sync_denylist() -> None:
+    """テーブルの失効トークンを拒否リストへ反映し、期限切れのエントリを除く。"""
+    now = time.time()
+    entries = await run_in_threadpool(_load_revocations, now)
+    # 拒否リストの更新はイベントループのスレッドでのみ行う
+    denylist.update(entries)
+    denylist.prune(now)
+
+
+async def _sync_periodically() -> None:
+    while True:
+        await asyncio.sleep(DENYLIST_SYNC_SECONDS)
+        try:
+            await sync_denylist()
+            await run_in_threadpool(_delete_expired, time.time())
+        except Exception:
+            logger.exception("Failed to sync the token denylist")
+
+
+_task: asyncio.Task | None = None
+
+
+async def start_denylist_sync() -> None:
+    global _task
+    try:
+        await sync_denylist()
+    except Exception:
+        logger.exception("Failed to load the token denylist")
+    if DENYLIST_SYNC_SECONDS > 0 and _task is None:
+        _task = asyncio.create_task(_sync_periodically())
+
+
+async def stop_denylist_sync() -> None:
+    global _task
+    if _task is not None:
+        _task.cancel()
+        with suppress(asyncio.CancelledError):
+            await _task
+        _task = None
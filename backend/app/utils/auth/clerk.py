@@ -3,8 +3,9 @@ import os
 import sys
 
 import httpx
-from app.repositories.user import get_user_br_column
+from app.repositories.user import UserRecord, get_user_br_column, get_user_record
 from app.schema import User
+from app.utils.metrics import AUTH_LATENCY
 from clerk_backend_api import AuthenticateRequestOptions, Clerk
 from clerk_backend_api import User as ClerkUser
 from fastapi import Depends, Request
@@ -21,7 +22,9 @@ AUTHORIZED_PARTIES = [
 security = HTTPBearer()
 
 
-async def get_auth_sub(request: Request, credentials=Depends(security)) -> str | None:
+async def get_auth_claims(
+    request: Request, credentials=Depends(security)
+) -> dict | None:
     httpx_req = httpx.Request(
         method=request.method,
         url=str(request.url),
@@ -31,26 +34,44 @@ async def get_auth_sub(request: Request, credentials=Depends(security)) -> str |
     )
 
     sdk = Clerk(bearer_auth=CLERK_SECRET_KEY)
-    request_state = sdk.authenticate_request(
-        httpx_req,
-        AuthenticateRequestOptions(authorized_parties=AUTHORIZED_PARTIES),
-    )
+    with AUTH_LATENCY.time("decode_token"):
+        request_state = sdk.authenticate_request(
+            httpx_req,
+            AuthenticateRequestOptions(authorized_parties=AUTHORIZED_PARTIES),
+        )
 
     if request_state.is_signed_in:
-        return request_state.payload["sub"]
+        # Clerk が発行するトークンにはこのアプリのユーザID を含められないため、
+        # リクエストごとに clerk_sub で検索する
+        return {"sub": request_state.payload["sub"]}
     else:
         logger.error("Not authenticated: %s", request_state.reason)
         return None
 
 
-async def get_authed_user(sub: str) -> User | None:
+async def get_auth_sub(claims: dict | None = Depends(get_auth_claims)) -> str | None:
+    return claims["sub"] if claims is not None else None
+
+
+async def get_authed_user(claims: dict) -> User | None:
     from app.utils.database_utils import get_db_session
 
     with get_db_session() as session:
-        user = get_user_br_column(session, sub, "clerk_sub")
+        user = get_user_br_column(session, claims["sub"], "clerk_sub")
         return user
 
 
+async def get_authed_user_record(claims: dict) -> UserRecord | None:
+    from app.utils.database_utils import get_db_session
+
+    with get_db_session() as session:
+        return get_user_record(session, claims["sub"], "clerk_sub")
+
+
+def forget_user_versions(_user_id: int) -> None:
+    """Clerk ではトークンの確認結果を保持しないため何もしない。"""
+
+
 def create_new_user(sub: str) -> User:
     sdk = Clerk(bearer_auth=CLERK_SECRET_KEY)
     clerk_user: ClerkUser = sdk.users.get(user_id=sub)
@@ -0,0 +1,96 @@
+"""失効させたアクセストークン（jti）のプロセス内拒否リスト
+
+認証のたびに参照するため、DB へは問い合わせずにメモリ上で判定します。
+
+- Bloom filter: ほとんどのトークン（失効していないもの）は、ハッシュ計算と
+  ビットの参照だけで「含まれない」と確定する（偽陰性はない）
+- 完全一致の辞書（jti -> exp）: Bloom filter が「含まれるかもしれない」と
+  判定した場合だけ引き、偽陽性を除く
+
+エントリはトークンの有効期限（exp）を過ぎると不要になるため、prune() で
+辞書から除き、Bloom filter を作り直します（Bloom filter は削除できないため）。
+作り直した Bloom filter は参照を差し替えるだけなので、判定中のリクエストと
+競合しません。
+"""
+
+import hashlib
+import math
+import os
+import time
+
+DENYLIST_CAPACITY = int(os.getenv("AUTH_DENYLIST_CAPACITY", "100000"))
+DENYLIST_FALSE_POSITIVE_RATE = 0.01
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, false_positive_rate: float):
+        capacity = max(capacity, 1)
+        bits = -capacity * math.log(false_positive_rate) / math.log(2) ** 2
+        self.size = max(8, math.ceil(bits))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str) -> list[int]:
+        # 1回のハッシュから2つの値を取り出し、k 個の位置を作る（double hashing）
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        bits = self._bits
+        return all(
+            bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(key)
+        )
+
+
+class TokenDenylist:
+    def __init__(self, capacity: int = DENYLIST_CAPACITY):
+        self.capacity = capacity
+        self._expires: dict[str, float] = {}
+        self._bloom = BloomFilter(capacity, DENYLIST_FALSE_POSITIVE_RATE)
+
+    def __len__(self) -> int:
+        return len(self._expires)
+
+    def add(self, jti: str, expires_at: float) -> None:
+        if jti not in self._expires:
+            self._bloom.add(jti)
+        self._expires[jti] = expires_at
+        if len(self._expires) > self.capacity:
+            # 想定より多い場合は大きさを変えて作り直す（偽陽性率を保つ）
+            self.capacity *= 2
+            self.prune()
+
+    def update(self, entries: list[tuple[str, float]]) -> None:
+        """DB から読み込んだエントリを追加する（既存のエントリは残す）。"""
+        for jti, expires_at in entries:
+            self.add(jti, expires_at)
+
+    def contains(self, jti: str | None, now: float | None = None) -> bool:
+        if jti is None or jti not in self._bloom:
+            return False
+        expires_at = self._expires.get(jti)
+        if expires_at is None:
+            return False
+        # 期限切れのトークンは JWT の検証で拒否されるため、ここでは数えない
+        return expires_at > (time.time() if now is None else now)
+
+    def prune(self, now: float | None = None) -> int:
+        """期限切れのエントリを除き、Bloom filter を作り直す。除いた件数を返す。"""
+        now = time.time() if now is None else now
+        live = {jti: exp for jti, exp in self._expires.items() if exp > now}
+        bloom = BloomFilter(self.capacity, DENYLIST_FALSE_POSITIVE_RATE)
+        for jti in live:
+            bloom.add(jti)
+        removed = len(self._expires) - len(live)
+        self._bloom, self._expires = bloom, live
+        return removed
+
+
+denylist = TokenDenylist()
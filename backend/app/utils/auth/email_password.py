@@ -1,12 +1,22 @@
 import logging
 import os
 import sys
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
+from uuid import UUID, uuid4
 
 import jwt
 from app.models.auth import UserCreateModel
-from app.repositories.user import get_user_br_column
+from app.repositories.user import (
+    UserRecord,
+    get_user_br_column,
+    get_user_record_by_id,
+    get_user_versions,
+)
 from app.schema import User
+from app.utils.auth.denylist import denylist
+from app.utils.metrics import AUTH_LATENCY
 from fastapi import Depends
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
@@ -27,6 +37,10 @@ if not SECRET_KEY:
     )
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# トークンの version 確認結果をプロセス内で保持する秒数（0 なら毎回 DB を確認する）。
+# 他のワーカーでのパスワード変更・プロフィール更新は最大この秒数だけ反映が遅れる
+AUTH_VERSION_CACHE_SECONDS = float(os.getenv("AUTH_VERSION_CACHE_SECONDS", "5"))
+AUTH_VERSION_CACHE_SIZE = int(os.getenv("AUTH_VERSION_CACHE_SIZE", "10000"))
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/signin")
@@ -42,15 +56,27 @@ def get_password_hash(password: str) -> str:
 
 
 def create_sub(user: User) -> dict:
+    """アクセストークンのクレーム。
+
+    リクエストごとにユーザを検索せずに済むよう、ユーザの識別情報を持たせる。
+    tv（token_version）はパスワードの変更で、ver（version）はプロフィールの
+    更新で DB 側の値とずれるため、検証時に比較する。
+    """
     return {
         "sub": user.email,
+        "uid": user.id,
+        "uuid": str(user.uuid),
+        "name": user.name,
+        "ver": user.version,
+        "tv": user.token_version,
     }
 
 
 def create_access_token(data: dict, expires_delta: timedelta) -> str:
     to_encode = data.copy()
     expire = datetime.now() + expires_delta
-    to_encode.update({"exp": expire})
+    # jti はログアウト時にこのトークンだけを失効させるために使う
+    to_encode.update({"exp": expire, "jti": uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -70,29 +96,113 @@ def authenticate_user(email: str, password: str, session: Session) -> str | None
     return access_token
 
 
-async def get_auth_sub(token: str = Depends(oauth2_scheme)) -> str | None:
+async def get_auth_claims(token: str = Depends(oauth2_scheme)) -> dict | None:
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        sub = payload.get("sub")
+        with AUTH_LATENCY.time("decode_token"):
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
     except Exception as e:
         logger.error("JWT Error: %s", e)
         return None
 
-    if sub is None:
+    if payload.get("sub") is None:
         logger.error("Not authenticated: %s", payload)
         return None
 
-    return sub
+    if denylist.contains(payload.get("jti")):
+        logger.error("Token revoked: %s", payload["jti"])
+        return None
+
+    return payload
+
 
+async def get_auth_sub(claims: dict | None = Depends(get_auth_claims)) -> str | None:
+    return claims["sub"] if claims is not None else None
 
-async def get_authed_user(sub: str) -> User | None:
+
+# ユーザID -> (有効期限, (token_version, version))。古い順に AUTH_VERSION_CACHE_SIZE 件まで
+_version_cache: OrderedDict[int, tuple[float, tuple[int, int]]] = OrderedDict()
+
+
+def _get_versions(user_id: int) -> tuple[int, int] | None:
     from app.utils.database_utils import get_db_session
 
+    if AUTH_VERSION_CACHE_SECONDS > 0:
+        cached = _version_cache.get(user_id)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+
     with get_db_session() as session:
-        user = get_user_br_column(session, sub, "email")
+        versions = get_user_versions(session, user_id)
+    if versions is not None and AUTH_VERSION_CACHE_SECONDS > 0:
+        _version_cache[user_id] = (
+            time.monotonic() + AUTH_VERSION_CACHE_SECONDS,
+            versions,
+        )
+        _version_cache.move_to_end(user_id)
+        while len(_version_cache) > AUTH_VERSION_CACHE_SIZE:
+            _version_cache.popitem(last=False)
+    return versions
+
+
+def forget_user_versions(user_id: int) -> None:
+    """プロフィール・パスワードの更新後に、このプロセスの確認結果を捨てる。"""
+    _version_cache.pop(user_id, None)
+
+
+def clear_user_versions() -> None:
+    """このプロセスの確認結果を全て捨てる。"""
+    _version_cache.clear()
+
+
+def _has_identity(claims: dict) -> bool:
+    # ユーザID・token_version を持たない旧形式のトークンは、パスワード変更による
+    # 失効を確認できないため受け付けない（再サインインで新形式になる）
+    if "uid" in claims and "tv" in claims:
+        return True
+    logger.error("Token without identity claims: %s", claims.get("sub"))
+    return False
+
+
+async def get_authed_user(claims: dict) -> User | None:
+    from app.utils.database_utils import get_db_session
+
+    if not _has_identity(claims):
+        return None
+    with get_db_session() as session:
+        user = session.get(User, claims["uid"])
+        if user is None or user.token_version != claims["tv"]:
+            logger.error("Token revoked for user: %s", claims["uid"])
+            return None
         return user
 
 
+async def get_authed_user_record(claims: dict) -> UserRecord | None:
+    """クレームから読み取り専用のユーザ情報を作る。
+
+    DB へは (token_version, version) の主キー検索だけを行い、プロフィールが
+    トークン発行後に更新されている場合に限って DB から読み直す。
+    """
+    from app.utils.database_utils import get_db_session
+
+    if not _has_identity(claims):
+        return None
+
+    versions = _get_versions(claims["uid"])
+    if versions is None or versions[0] != claims["tv"]:
+        logger.error("Token revoked for user: %s", claims["uid"])
+        return None
+    if versions[1] != claims.get("ver"):
+        with get_db_session() as session:
+            return get_user_record_by_id(session, claims["uid"])
+    return UserRecord(
+        id=claims["uid"],
+        uuid=UUID(claims["uuid"]),
+        email=claims["sub"],
+        name=claims.get("name"),
+        version=versions[1],
+    )
+
+
 def create_new_user(data: UserCreateModel, session: Session) -> str | None:
     user = get_user_br_column(session, data.email, "email")
     if user:
@@ -0,0 +1,100 @@
+"""チャット本文の透過圧縮
+
+保存形式は先頭1バイトのフォーマットタグ + 本体です。
+
+- 0x00: 無圧縮の UTF-8
+- 0x01: zlib
+- 0x02: zstd（``zstandard`` パッケージが必要）
+
+COMPRESSION_MIN_BYTES 未満の本文や、圧縮しても小さくならない本文は
+無圧縮で保存します。読み出し時はタグを見て展開するため、閾値やコーデックを
+変更しても既存の行はそのまま読めます。
+"""
+
+import os
+import threading
+import zlib
+
+from sqlalchemy import LargeBinary
+from sqlalchemy.types import TypeDecorator
+
+COMPRESSION_CODEC = os.getenv("CHAT_COMPRESSION_CODEC", "zlib")  # "zlib" | "zstd"
+COMPRESSION_MIN_BYTES = int(os.getenv("CHAT_COMPRESSION_MIN_BYTES", "1024"))
+COMPRESSION_LEVEL = int(os.getenv("CHAT_COMPRESSION_LEVEL", "1"))
+
+TAG_RAW = b"\x00"
+TAG_ZLIB = b"\x01"
+TAG_ZSTD = b"\x02"
+
+
+# ZstdCompressor / ZstdDecompressor は複数スレッドから同時に使えないため、
+# スレッドプールのリクエスト処理や write-behind の保存スレッドごとに持つ
+_zstd_local = threading.local()
+
+
+def _zstd():
+    contexts = getattr(_zstd_local, "contexts", None)
+    if contexts is None:
+        try:
+            import zstandard
+        except ImportError as e:
+            raise RuntimeError(
+                "zstandard is required for CHAT_COMPRESSION_CODEC=zstd"
+            ) from e
+        contexts = (
+            zstandard.ZstdCompressor(level=COMPRESSION_LEVEL),
+            zstandard.ZstdDecompressor(),
+        )
+        _zstd_local.contexts = contexts
+    return contexts
+
+
+def compress_text(
+    text: str,
+    codec: str | None = None,
+    min_bytes: int | None = None,
+) -> bytes:
+    """本文を保存形式（タグ付きバイト列）へ変換する。"""
+    codec = codec or COMPRESSION_CODEC
+    min_bytes = COMPRESSION_MIN_BYTES if min_bytes is None else min_bytes
+    raw = text.encode()
+    if len(raw) >= min_bytes:
+        if codec == "zstd":
+            packed = TAG_ZSTD + _zstd()[0].compress(raw)
+        else:
+            packed = TAG_ZLIB + zlib.compress(raw, COMPRESSION_LEVEL)
+        if len(packed) < len(raw) + 1:
+            return packed
+    return TAG_RAW + raw
+
+
+def decompress_text(value: bytes | str) -> str:
+    """保存形式から本文を復元する。移行前の TEXT 値はそのまま返す。"""
+    if isinstance(value, str):
+        return value
+    value = bytes(value)
+    tag, body = value[:1], value[1:]
+    if tag == TAG_RAW:
+        return body.decode()
+    if tag == TAG_ZLIB:
+        return zlib.decompress(body).decode()
+    if tag == TAG_ZSTD:
+        return _zstd()[1].decompress(body).decode()
+    raise ValueError(f"Unknown compression tag: {tag!r}")
+
+
+class CompressedText(TypeDecorator):
+    """Python 側では str、DB 側ではタグ付きバイト列として扱う列型。"""
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, _dialect):
+        if value is None:
+            return None
+        return compress_text(value)
+
+    def process_result_value(self, value, _dialect):
+        if value is None:
+            return None
+        return decompress_text(value)
@@ -0,0 +1,154 @@
+"""リクエストの期限（deadline）
+
+DeadlineMiddleware がリクエストごとの期限を contextvar に設定し、期限までの
+残り時間を各処理の待ち時間の上限として使います。contextvar はスレッドプールにも
+引き継がれるため、同期エンドポイント・リポジトリからも参照できます。
+
+- DB: 期限を過ぎた後のクエリは発行しない。PostgreSQL は
+  ``SET LOCAL statement_timeout`` で残り時間を上限にし（前回の設定から
+  POSTGRES_TIMEOUT_REFRESH_SECONDS 秒以上経っていれば、クエリの前に設定し直す）、
+  SQLite は progress handler で実行中のクエリを中断する
+- LLM: 残り時間を HTTP のタイムアウトにする（app.utils.llm）
+
+期限を過ぎると DeadlineExceeded（504）を送出します。
+"""
+
+import math
+import os
+import time
+from collections.abc import Iterator
+from contextlib import closing, contextmanager
+from contextvars import ContextVar
+
+from fastapi import HTTPException, status
+from sqlalchemy import event
+from sqlalchemy.exc import DBAPIError, OperationalError
+
+REQUEST_TIMEOUT_HEADER = "x-request-timeout"
+# ヘッダがない場合の期限と、ヘッダで指定できる上限（秒）
+REQUEST_TIMEOUT_SECONDS = float(os.getenv("REQUEST_TIMEOUT_SECONDS", "60"))
+REQUEST_TIMEOUT_MAX_SECONDS = float(os.getenv("REQUEST_TIMEOUT_MAX_SECONDS", "120"))
+# SQLite の progress handler を呼ぶ間隔（仮想マシンの命令数）
+SQLITE_PROGRESS_INTERVAL = 10000
+# PostgreSQL の statement_timeout を設定し直す間隔（秒）。上限が期限を超えるのはこの秒数まで
+POSTGRES_TIMEOUT_REFRESH_SECONDS = 0.1
+
+# PostgreSQL の statement_timeout によるキャンセル（query_canceled）の SQLSTATE
+_QUERY_CANCELED = "57014"
+
+# time.monotonic() での期限。リクエスト外（ジョブなど）では None
+_deadline: ContextVar[float | None] = ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(HTTPException):
+    def __init__(self):
+        super().__init__(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail="Deadline exceeded",
+        )
+
+
+def parse_timeout(value: str | None) -> float:
+    """X-Request-Timeout（秒）から期限までの秒数を決める。"""
+    if value:
+        try:
+            timeout = float(value)
+        except ValueError:
+            timeout = math.nan
+        if math.isfinite(timeout) and timeout > 0:
+            return min(timeout, REQUEST_TIMEOUT_MAX_SECONDS)
+    return REQUEST_TIMEOUT_SECONDS
+
+
+@contextmanager
+def deadline_after(seconds: float) -> Iterator[float]:
+    """seconds 秒後を期限にする（既に期限があれば早い方）。"""
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    if current is not None:
+        deadline = min(deadline, current)
+    token = _deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _deadline.reset(token)
+
+
+def clear_deadline() -> None:
+    """現在のコンテキストの期限を外す。"""
+    _deadline.set(None)
+
+
+def remaining() -> float | None:
+    """期限までの残り秒数（期限がなければ None）。"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def check_deadline() -> None:
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded()
+
+
+def is_deadline_error(exc: BaseException) -> bool:
+    """期限切れによる中断で起きた例外かどうか。"""
+    if isinstance(exc, DeadlineExceeded | TimeoutError):
+        return True
+    if isinstance(exc, DBAPIError):
+        # psycopg2 は pgcode、psycopg（3）は sqlstate に SQLSTATE を持つ
+        sqlstate = getattr(exc.orig, "pgcode", None) or getattr(
+            exc.orig, "sqlstate", None
+        )
+        if sqlstate == _QUERY_CANCELED:
+            return True
+        # SQLite の progress handler による中断
+        return isinstance(exc, OperationalError) and "interrupted" in str(exc.orig)
+    return False
+
+
+def _before_cursor_execute(conn, _cursor, _statement, _parameters, _context, _many):
+    left = remaining()
+    if left is None:
+        return
+    if left <= 0:
+        raise DeadlineExceeded()
+    if conn.dialect.name == "postgresql":
+        # 設定した値は以降のクエリにもそのまま使われ、設定からの経過時間だけ期限を
+        # 超えてしまうため、一定時間が経ったら残り時間で設定し直す
+        # （SET LOCAL はコミットで元に戻るため、トランザクションが変わっても設定する）
+        now = time.monotonic()
+        setting = (conn.get_transaction(), _deadline.get())
+        last = conn.info.get("deadline_timeout")
+        if (
+            last is None
+            or last[:2] != setting
+            or now - last[2] >= POSTGRES_TIMEOUT_REFRESH_SECONDS
+        ):
+            # 文を実行するカーソルは yield_per などでは名前付きカーソル（サーバーサイド）で、
+            # 別の文を実行できないため、同じ接続の通常のカーソルで設定する
+            timeout = max(1, int(left * 1000))
+            with closing(conn.connection.cursor()) as setter:
+                setter.execute(f"SET LOCAL statement_timeout = {timeout}")
+            conn.info["deadline_timeout"] = (*setting, now)
+
+
+def _sqlite_progress() -> int:
+    left = remaining()
+    # 0 以外を返すと実行中のクエリが OperationalError(interrupted) で中断される
+    return int(left is not None and left <= 0)
+
+
+def _on_connect(dbapi_connection, _record) -> None:
+    dbapi_connection.set_progress_handler(_sqlite_progress, SQLITE_PROGRESS_INTERVAL)
+
+
+def instrument_deadline(engine) -> None:
+    """エンジンのクエリにリクエストの期限を適用する（複数回呼んでもよい）。"""
+    if event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    if engine.dialect.name == "sqlite":
+        event.listen(engine, "connect", _on_connect)
@@ -0,0 +1,81 @@
+"""チャットメッセージの埋め込み（ベクトル化）ユーティリティ"""
+
+import hashlib
+import os
+import re
+from functools import lru_cache
+from typing import Protocol
+
+import numpy as np
+
+EMBEDDER = os.getenv("CHAT_EMBEDDER", "hashing")  # "hashing" | "openai"
+EMBEDDING_DIM = int(os.getenv("CHAT_EMBEDDING_DIM", "256"))
+OPENAI_EMBEDDING_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
+
+_WORD_RE = re.compile(r"\w+")
+
+
+class Embedder(Protocol):
+    """テキストを L2 正規化済みの float32 ベクトルへ変換するインターフェース。"""
+
+    dim: int
+
+    def embed(self, texts: list[str]) -> np.ndarray: ...
+
+
+def _tokenize(text: str) -> list[str]:
+    """単語トークンに加え、非ASCIIの語は文字 bigram に分解する（日本語対策）。"""
+    tokens: list[str] = []
+    for word in _WORD_RE.findall(text.lower()):
+        if word.isascii() or len(word) < 2:
+            tokens.append(word)
+        else:
+            tokens.extend(word[i : i + 2] for i in range(len(word) - 1))
+    return tokens
+
+
+class HashingEmbedder:
+    """外部依存のない feature hashing による埋め込み（テスト・ローカル用）。"""
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in _tokenize(text):
+                digest = hashlib.blake2b(token.encode(), digest_size=8).digest()
+                h = int.from_bytes(digest, "little")
+                vectors[row, h % self.dim] += 1.0 if h >> 63 else -1.0
+        return _normalize(vectors)
+
+
+class OpenAIEmbedder:
+    """OpenAI Embeddings API による埋め込み。"""
+
+    def __init__(self, model: str = OPENAI_EMBEDDING_MODEL, dim: int = EMBEDDING_DIM):
+        self.model = model
+        self.dim = dim
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        from app.utils.llm import get_client
+
+        resp = get_client().embeddings.create(
+            model=self.model, input=texts, dimensions=self.dim
+        )
+        vectors = np.array([d.embedding for d in resp.data], dtype=np.float32)
+        return _normalize(vectors)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
+
+
+@lru_cache(maxsize=1)
+def get_embedder() -> Embedder:
+    """環境変数 CHAT_EMBEDDER に応じた Embedder を返す。"""
+    if EMBEDDER == "openai":
+        return OpenAIEmbedder()
+    return HashingEmbedder()
@@ -1,8 +1,13 @@
 import os
+import time
 
 import openai
+from app.utils.deadline import DeadlineExceeded, check_deadline, remaining
+from app.utils.metrics import LLM_LATENCY
 
 DEFAULT_MODEL = "gpt-5-nano"
+# リクエストの期限がない場合（ジョブなど）の HTTP タイムアウト（秒）
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
 
 
 def get_client() -> openai.OpenAI:
@@ -20,8 +25,35 @@ def generate_response(
 
     - 引数の messages は {role, content} のリスト（従来の Chat Completions と同形）
     - Responses API の input にマッピングして呼び出します
+    - 所要時間を llm_request_duration_seconds に記録します
+    - リクエストの期限までの残り時間を HTTP のタイムアウトにし、期限を過ぎた場合は
+      DeadlineExceeded を送出します
     """
+    check_deadline()
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        text = _generate(messages, model)
+        outcome = "ok"
+        return text
+    except openai.APITimeoutError as e:
+        left = remaining()
+        if left is not None and left <= 0:
+            outcome = "deadline"
+            raise DeadlineExceeded() from e
+        raise
+    finally:
+        LLM_LATENCY.observe(time.perf_counter() - started, outcome)
+
+
+def _generate(messages: list[dict[str, str]], model: str) -> str:
     client = get_client()
+    left = remaining()
+    if left is not None:
+        # 期限内に収まるよう、再試行はせず残り時間を1回の呼び出しの上限にする
+        client = client.with_options(timeout=left, max_retries=0)
+    else:
+        client = client.with_options(timeout=LLM_TIMEOUT_SECONDS)
 
     # Chat Completions 互換の messages を Responses API の input 形式へ変換
     input_items = [
@@ -0,0 +1,112 @@
+"""メール送信ユーティリティ
+
+送信先は環境変数 MAIL_BACKEND で切り替えます。
+
+- console: 本文をログへ出力する（ローカル開発用。送信はしない）
+- file: MAIL_FILE_DIR へ .eml ファイルとして書き出す（テスト・ステージング用）
+- smtp: MAIL_SMTP_HOST の SMTP サーバで送信する
+
+いずれも同期処理のため、リクエストの処理中には呼ばず、送信キュー
+（app.services.mail_outbox）のワーカーから呼び出します。
+"""
+
+import logging
+import os
+import smtplib
+import uuid
+from email.message import EmailMessage
+from functools import lru_cache
+from pathlib import Path
+from typing import Protocol
+
+MAIL_BACKEND = os.getenv("MAIL_BACKEND", "console")  # "console" | "file" | "smtp"
+MAIL_FROM = os.getenv("MAIL_FROM", "no-reply@localhost")
+MAIL_FILE_DIR = os.getenv("MAIL_FILE_DIR", "data/mail")
+MAIL_SMTP_HOST = os.getenv("MAIL_SMTP_HOST", "localhost")
+MAIL_SMTP_PORT = int(os.getenv("MAIL_SMTP_PORT", "587"))
+MAIL_SMTP_USERNAME = os.getenv("MAIL_SMTP_USERNAME")
+MAIL_SMTP_PASSWORD = os.getenv("MAIL_SMTP_PASSWORD")
+MAIL_SMTP_STARTTLS = os.getenv("MAIL_SMTP_STARTTLS", "true").lower() == "true"
+MAIL_SMTP_TIMEOUT = float(os.getenv("MAIL_SMTP_TIMEOUT", "10"))
+
+logger = logging.getLogger(__name__)
+
+
+class Mailer(Protocol):
+    """メールを1通送信するインターフェース。失敗時は例外を送出する。"""
+
+    def send(self, message: EmailMessage) -> None: ...
+
+
+def build_message(to: str, subject: str, body: str) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = MAIL_FROM
+    message["To"] = to
+    message["Subject"] = subject
+    message.set_content(body)
+    return message
+
+
+class ConsoleMailer:
+    """本文をログへ出力する。"""
+
+    def send(self, message: EmailMessage) -> None:
+        logger.info(
+            "Mail to %s: %s\n%s",
+            message["To"],
+            message["Subject"],
+            message.get_content(),
+        )
+
+
+class FileMailer:
+    """1通ごとに .eml ファイルを書き出す。"""
+
+    def __init__(self, directory: str | Path = MAIL_FILE_DIR):
+        self.directory = Path(directory)
+
+    def send(self, message: EmailMessage) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{uuid.uuid4().hex}.eml"
+        # 書き途中のファイルを読まれないよう、一時ファイルから置き換える
+        partial = path.with_suffix(".tmp")
+        partial.write_bytes(message.as_bytes())
+        partial.replace(path)
+
+
+class SmtpMailer:
+    """SMTP サーバで送信する（1通ごとに接続する）。"""
+
+    def __init__(
+        self,
+        host: str = MAIL_SMTP_HOST,
+        port: int = MAIL_SMTP_PORT,
+        username: str | None = MAIL_SMTP_USERNAME,
+        password: str | None = MAIL_SMTP_PASSWORD,
+        starttls: bool = MAIL_SMTP_STARTTLS,
+        timeout: float = MAIL_SMTP_TIMEOUT,
+    ):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+
+    def send(self, message: EmailMessage) -> None:
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password or "")
+            smtp.send_message(message)
+
+
+@lru_cache(maxsize=1)
+def get_mailer() -> Mailer:
+    """環境変数 MAIL_BACKEND に応じた Mailer を返す。"""
+    if MAIL_BACKEND == "smtp":
+        return SmtpMailer()
+    if MAIL_BACKEND == "file":
+        return FileMailer()
+    return ConsoleMailer()
@@ -0,0 +1,382 @@
+"""Prometheus 形式のメトリクス
+
+リクエスト処理中の記録はスレッドごとのシャード（threading.local）に対して
+行うため、ロックを取らずに加算できます（各シャードを書き換えるのは持ち主の
+スレッドだけです）。/metrics の出力時に全シャードを合算します。
+
+uvicorn を複数ワーカーで動かす場合は METRICS_MULTIPROC_DIR を設定します。
+各ワーカーは METRICS_FLUSH_INTERVAL 秒ごとに自分の集計値を
+``{pid}.json`` へ書き出し、/metrics を受けたワーカーが全ファイルを合算します。
+終了したワーカーの counter / histogram は残し、gauge（処理中の件数など）は
+除外します。ディレクトリはデプロイ時に空にしてください。
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager, suppress
+from pathlib import Path
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+METRICS_MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class _Shard:
+    """1スレッド分の集計値。"""
+
+    __slots__ = ("histograms", "values")
+
+    def __init__(self):
+        # (メトリクス名, ラベル値) -> 値
+        self.values: dict[tuple[str, tuple[str, ...]], float] = {}
+        # (メトリクス名, ラベル値) -> [各バケットの件数..., +Inf の件数, 合計]
+        self.histograms: dict[tuple[str, tuple[str, ...]], list[float]] = {}
+
+
+class _Metric:
+    type = ""
+
+    def __init__(
+        self,
+        registry: "MetricsRegistry",
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+    ):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        registry.metrics[name] = self
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        values = self.registry.shard().values
+        key = (self.name, labels)
+        values[key] = values.get(key, 0.0) + amount
+
+
+class Gauge(_Metric):
+    """プロセス間・シャード間で合算する gauge（処理中の件数など）。"""
+
+    type = "gauge"
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        values = self.registry.shard().values
+        key = (self.name, labels)
+        values[key] = values.get(key, 0.0) + amount
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        registry: "MetricsRegistry",
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = buckets
+
+    def observe(self, value: float, *labels: str) -> None:
+        histograms = self.registry.shard().histograms
+        key = (self.name, labels)
+        counts = histograms.get(key)
+        if counts is None:
+            counts = histograms[key] = [0.0] * (len(self.buckets) + 2)
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        """ブロックの実行時間（秒）を記録する。"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+
+Snapshot = dict[str, list[tuple[tuple[str, ...], float | list[float]]]]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: dict[str, _Metric] = {}
+        self._local = threading.local()
+        self._shards: list[_Shard] = []
+        # 出力時に値を読む gauge（DB プールの使用状況など）
+        self._collectors: list[Callable[[], Snapshot]] = []
+
+    def shard(self) -> _Shard:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            self._shards.append(shard)
+        return shard
+
+    def add_collector(self, collector: Callable[[], Snapshot]) -> None:
+        self._collectors.append(collector)
+
+    def snapshot(self) -> Snapshot:
+        """このプロセスの全シャードを合算した値を返す。"""
+        values: dict[tuple[str, tuple[str, ...]], float] = {}
+        histograms: dict[tuple[str, tuple[str, ...]], list[float]] = {}
+        for shard in list(self._shards):
+            # dict のコピーは GIL 下で一括して行われるため、書き込み中でも安全
+            for key, value in shard.values.copy().items():
+                values[key] = values.get(key, 0.0) + value
+            for key, counts in shard.histograms.copy().items():
+                merged = histograms.setdefault(key, [0.0] * len(counts))
+                for i, count in enumerate(list(counts)):
+                    merged[i] += count
+        result: Snapshot = {}
+        for (name, labels), value in [*values.items(), *histograms.items()]:
+            result.setdefault(name, []).append((labels, value))
+        for collector in self._collectors:
+            for name, samples in collector().items():
+                result.setdefault(name, []).extend(samples)
+        return result
+
+    def collect(self) -> Snapshot:
+        """全ワーカーの値を合算する（METRICS_MULTIPROC_DIR 未設定ならこのプロセスのみ）。"""
+        snapshots = [self.snapshot()]
+        if METRICS_MULTIPROC_DIR:
+            own = os.getpid()
+            for path in Path(METRICS_MULTIPROC_DIR).glob("*.json"):
+                pid = int(path.stem)
+                if pid == own:
+                    continue
+                try:
+                    data = json.loads(path.read_text())
+                except (OSError, ValueError):
+                    continue
+                alive = _is_alive(pid)
+                snapshots.append(
+                    {
+                        name: [(tuple(labels), value) for labels, value in samples]
+                        for name, samples in data.items()
+                        if name in self.metrics
+                        and (alive or self.metrics[name].type != "gauge")
+                    }
+                )
+        return _merge(snapshots)
+
+    def flush(self) -> None:
+        """このプロセスの値を METRICS_MULTIPROC_DIR へ書き出す。"""
+        if not METRICS_MULTIPROC_DIR:
+            return
+        directory = Path(METRICS_MULTIPROC_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"{os.getpid()}.json"
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(
+            json.dumps(
+                {
+                    name: [[list(labels), value] for labels, value in samples]
+                    for name, samples in self.snapshot().items()
+                }
+            )
+        )
+        os.replace(tmp, path)
+
+    def render(self) -> str:
+        """Prometheus のテキスト形式で出力する。"""
+        collected = self.collect()
+        lines: list[str] = []
+        for name, metric in self.metrics.items():
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            for labels, value in sorted(collected.get(name, [])):
+                pairs = list(zip(metric.labelnames, labels, strict=False))
+                if isinstance(metric, Histogram):
+                    cumulative = 0.0
+                    bounds = [*map(_format_value, metric.buckets), "+Inf"]
+                    for bound, count in zip(bounds, value[:-1], strict=False):
+                        cumulative += count
+                        lines.append(
+                            f"{name}_bucket{_labels([*pairs, ('le', bound)])} "
+                            f"{_format_value(cumulative)}"
+                        )
+                    lines.append(f"{name}_sum{_labels(pairs)} {value[-1]!r}")
+                    lines.append(
+                        f"{name}_count{_labels(pairs)} {_format_value(cumulative)}"
+                    )
+                else:
+                    lines.append(f"{name}{_labels(pairs)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _merge(snapshots: list[Snapshot]) -> Snapshot:
+    merged: dict[str, dict[tuple[str, ...], float | list[float]]] = {}
+    for snapshot in snapshots:
+        for name, samples in snapshot.items():
+            target = merged.setdefault(name, {})
+            for labels, value in samples:
+                current = target.get(labels)
+                if current is None:
+                    target[labels] = list(value) if isinstance(value, list) else value
+                elif isinstance(current, list):
+                    for i, count in enumerate(value):
+                        current[i] += count
+                else:
+                    target[labels] = current + value
+    return {name: list(samples.items()) for name, samples in merged.items()}
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs: list[tuple[str, str]]) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in pairs) + "}"
+
+
+registry = MetricsRegistry()
+
+HTTP_REQUESTS = Counter(
+    registry,
+    "http_requests_total",
+    "HTTP requests by route and status",
+    ("method", "route", "status"),
+)
+HTTP_LATENCY = Histogram(
+    registry,
+    "http_request_duration_seconds",
+    "HTTP request latency by route",
+    ("method", "route"),
+)
+HTTP_IN_FLIGHT = Gauge(
+    registry,
+    "http_requests_in_flight",
+    "HTTP requests currently being handled",
+    ("method", "route"),
+)
+HTTP_ADMISSION = Gauge(
+    registry,
+    "http_admission_requests",
+    "Requests admitted by the load shedder (in_flight) or waiting for a slot (queued)",
+    ("state",),
+)
+HTTP_QUEUE_WAIT = Histogram(
+    registry,
+    "http_request_queue_seconds",
+    "Time requests waited for an in-flight slot by priority",
+    ("priority",),
+)
+HTTP_SHED = Counter(
+    registry,
+    "http_requests_shed_total",
+    "Requests rejected with 503 by the load shedder by priority",
+    ("priority",),
+)
+DB_POOL_CONNECTIONS = Gauge(
+    registry,
+    "db_pool_connections",
+    "Database pool connections by state",
+    ("state",),
+)
+DB_POOL_CHECKOUTS = Counter(
+    registry, "db_pool_checkouts_total", "Database pool connection checkouts"
+)
+DB_POOL_CONNECTS = Counter(
+    registry, "db_pool_connects_total", "New database connections opened by the pool"
+)
+AUTH_LATENCY = Histogram(
+    registry,
+    "auth_duration_seconds",
+    "Time spent authenticating requests by step",
+    ("step",),
+)
+RATE_LIMITED = Counter(
+    registry,
+    "rate_limited_requests_total",
+    "Requests rejected by rate limiting",
+    ("rule",),
+)
+LLM_LATENCY = Histogram(
+    registry,
+    "llm_request_duration_seconds",
+    "generate_response latency by outcome",
+    ("outcome",),
+)
+
+
+def instrument_engine(engine) -> None:
+    """エンジンの接続プールの使用状況を記録する。"""
+    from sqlalchemy import event
+
+    event.listen(engine.pool, "checkout", lambda *_: DB_POOL_CHECKOUTS.inc())
+    event.listen(engine.pool, "connect", lambda *_: DB_POOL_CONNECTS.inc())
+
+    def collect() -> Snapshot:
+        pool = engine.pool
+        samples = []
+        for state, attr in (
+            ("checked_out", "checkedout"),
+            ("idle", "checkedin"),
+            ("overflow", "overflow"),
+        ):
+            func = getattr(pool, attr, None)
+            if func is not None:
+                samples.append(((state,), float(max(func(), 0))))
+        return {DB_POOL_CONNECTIONS.name: samples}
+
+    registry.add_collector(collect)
+
+
+_writer: asyncio.Task | None = None
+
+
+async def _flush_periodically() -> None:
+    while True:
+        await asyncio.sleep(METRICS_FLUSH_INTERVAL)
+        registry.flush()
+
+
+async def start_metrics_writer() -> None:
+    global _writer
+    if METRICS_MULTIPROC_DIR and _writer is None:
+        _writer = asyncio.create_task(_flush_periodically())
+
+
+async def stop_metrics_writer() -> None:
+    global _writer
+    if _writer is not None:
+        _writer.cancel()
+        with suppress(asyncio.CancelledError):
+            await _writer
+        _writer = None
+        registry.flush()
@@ -0,0 +1,144 @@
+"""リクエスト単位のサンプリングプロファイラ
+
+プロファイル対象のリクエストを処理している間、サンプラースレッドが
+PROFILER_INTERVAL_MS ごとに ``sys._current_frames()`` でイベントループの
+スレッドとスレッドプール（同期エンドポイント・同期依存関係を実行する
+AnyIO worker thread）のスタックを取得し、呼び出し経路ごとの件数を数えます。
+待機中（select・キュー待ち）のスタックは数えません。
+
+サンプルはプロセス単位のため、同時に処理中の他のリクエストの処理も
+含まれます（py-spy などと同じ見え方です）。結果は直近 PROFILER_MAX_PROFILES 件を
+メモリ上に保持し、collapsed stack 形式（flamegraph.pl / speedscope で読める
+``frame;frame;frame 件数``）で返します。
+"""
+
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from pathlib import Path
+
+PROFILER_SAMPLE_RATE = float(os.getenv("PROFILER_SAMPLE_RATE", "0"))
+PROFILER_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", "5"))
+PROFILER_MAX_PROFILES = int(os.getenv("PROFILER_MAX_PROFILES", "20"))
+
+_APP_ROOT = str(Path(__file__).resolve().parents[2])
+_WORKER_THREAD_PREFIX = "AnyIO worker thread"
+
+# 葉がここにあるスタックは待機中とみなす: (ファイル名, 関数名)
+_IDLE_FRAMES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+}
+
+
+@dataclass
+class Profile:
+    id: int
+    method: str
+    path: str
+    started_at: float
+    duration: float = 0.0
+    samples: Counter = field(default_factory=Counter)
+
+    def collapsed(self) -> str:
+        """collapsed stack 形式の文字列。"""
+        # 停止直後にサンプラーが最後の1回を書き込むことがあるためコピーしてから読む
+        samples = list(self.samples.items())
+        return "".join(f"{stack} {count}\n" for stack, count in samples)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    filename = code.co_filename
+    if "site-packages" in filename:
+        filename = filename.rsplit("site-packages" + os.sep, 1)[1]
+    elif filename.startswith(_APP_ROOT):
+        filename = os.path.relpath(filename, _APP_ROOT)
+    else:
+        filename = os.path.basename(filename)
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+def _stack(frame) -> str | None:
+    if (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in (
+        _IDLE_FRAMES
+    ):
+        return None
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class Sampler:
+    """プロファイル中のリクエストがある間だけ動くサンプラー。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active: dict[int, tuple[Profile, int]] = {}
+        self._ids = itertools.count(1)
+        self._thread: threading.Thread | None = None
+        self.profiles: deque[Profile] = deque(maxlen=PROFILER_MAX_PROFILES)
+
+    def start(self, method: str, path: str, loop_thread_id: int) -> Profile:
+        profile = Profile(next(self._ids), method, path, time.time())
+        with self._lock:
+            self._active[profile.id] = (profile, loop_thread_id)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="profiler-sampler", daemon=True
+                )
+                self._thread.start()
+        return profile
+
+    def stop(self, profile: Profile) -> None:
+        profile.duration = time.time() - profile.started_at
+        with self._lock:
+            del self._active[profile.id]
+            self.profiles.append(profile)
+
+    def recent(self) -> list[Profile]:
+        """保持しているプロファイル（新しい順）。"""
+        with self._lock:
+            return list(reversed(self.profiles))
+
+    def get(self, profile_id: int) -> Profile | None:
+        with self._lock:
+            return next((p for p in self.profiles if p.id == profile_id), None)
+
+    def _run(self) -> None:
+        interval = PROFILER_INTERVAL_MS / 1000
+        own = threading.get_ident()
+        while True:
+            with self._lock:
+                if not self._active:
+                    self._thread = None
+                    return
+                active = list(self._active.values())
+            loop_threads = {loop_thread for _, loop_thread in active}
+            names = {t.ident: t.name for t in threading.enumerate()}
+            stacks = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                if thread_id in loop_threads:
+                    kind = "event_loop"
+                elif names.get(thread_id, "").startswith(_WORKER_THREAD_PREFIX):
+                    kind = "threadpool"
+                else:
+                    continue
+                stack = _stack(frame)
+                if stack is not None:
+                    stacks.append(f"{kind};{stack}")
+            for profile, _ in active:
+                profile.samples.update(stacks)
+            time.sleep(interval)
+
+
+sampler = Sampler()
@@ -0,0 +1,139 @@
+"""リクエスト単位の SQL プロファイル
+
+SQLAlchemy のイベント（before/after_cursor_execute）で各クエリの実行時間を測り、
+処理中のリクエストの QueryProfile（contextvar）へ件数・合計時間・遅い順の
+上位 SQL_PROFILE_TOP_N 件を記録します。同期エンドポイントはスレッドプールで
+実行されますが、contextvar はスレッドへ引き継がれるため同じ QueryProfile に
+記録されます。
+
+SLOW_QUERY_THRESHOLD_MS 以上かかったクエリは、リクエスト外（ジョブなど）でも
+``app.sql.slow`` ロガーへ JSON 1行で出力します（リテラルを ? に置き換えた SQL と、
+クエリを発行した app 配下の呼び出し元を含む）。
+"""
+
+import json
+import logging
+import os
+import re
+import sys
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from heapq import heappush, heapreplace
+from pathlib import Path
+
+from sqlalchemy import event
+
+DEBUG = os.getenv("DEBUG", "false").lower() == "true"
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "200"))
+SQL_PROFILE_TOP_N = int(os.getenv("SQL_PROFILE_TOP_N", "3"))
+
+logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger("app.sql.slow")
+
+_APP_DIR = str(Path(__file__).resolve().parents[1])
+_THIS_FILE = str(Path(__file__).resolve())
+
+_WHITESPACE = re.compile(r"\s+")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+
+@dataclass
+class QueryProfile:
+    """1リクエスト分の SQL 実行記録。"""
+
+    count: int = 0
+    total_seconds: float = 0.0
+    # (秒, 正規化した SQL) の min-heap。上位 SQL_PROFILE_TOP_N 件だけ保持する
+    _slowest: list[tuple[float, str]] = field(default_factory=list)
+
+    def record(self, seconds: float, statement: str) -> None:
+        self.count += 1
+        self.total_seconds += seconds
+        if len(self._slowest) < SQL_PROFILE_TOP_N:
+            heappush(self._slowest, (seconds, statement))
+        elif self._slowest and seconds > self._slowest[0][0]:
+            heapreplace(self._slowest, (seconds, statement))
+
+    @property
+    def slowest(self) -> list[tuple[float, str]]:
+        """遅い順の (秒, 正規化した SQL)。"""
+        return sorted(self._slowest, reverse=True)
+
+    def server_timing(self) -> str:
+        """Server-Timing ヘッダの値。"""
+        return f'db;dur={self.total_seconds * 1000:.1f};desc="{self.count} queries"'
+
+
+_current: ContextVar[QueryProfile | None] = ContextVar("query_profile", default=None)
+
+
+@contextmanager
+def profile_queries() -> Iterator[QueryProfile]:
+    """ブロック内で実行されたクエリを記録する。"""
+    profile = QueryProfile()
+    token = _current.set(profile)
+    try:
+        yield profile
+    finally:
+        _current.reset(token)
+
+
+def normalize_sql(statement: str) -> str:
+    """リテラルを ? に置き換え、空白と IN のリストをまとめる。"""
+    statement = _STRING.sub("?", statement)
+    statement = _NUMBER.sub("?", statement)
+    statement = _WHITESPACE.sub(" ", statement).strip()
+    return _IN_LIST.sub("(?...)", statement)
+
+
+def _call_site() -> str | None:
+    """クエリを発行した app 配下の最も内側のフレーム。"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_APP_DIR) and filename != _THIS_FILE:
+            relative = os.path.relpath(filename, Path(_APP_DIR).parent)
+            return f"{relative}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return None
+
+
+def _before_cursor_execute(_conn, _cursor, _statement, _parameters, context, _many):
+    # 失敗したクエリでは after が呼ばれないため、接続ではなく実行ごとに持つ
+    context._query_started = time.perf_counter()
+
+
+def _after_cursor_execute(_conn, _cursor, statement, _parameters, context, _many):
+    elapsed = time.perf_counter() - context._query_started
+    profile = _current.get()
+    slow = elapsed * 1000 >= SLOW_QUERY_THRESHOLD_MS
+    if profile is None and not slow:
+        return
+    normalized = normalize_sql(statement)
+    if profile is not None:
+        profile.record(elapsed, normalized)
+    if slow:
+        slow_query_logger.warning(
+            json.dumps(
+                {
+                    "event": "slow_query",
+                    "duration_ms": round(elapsed * 1000, 1),
+                    "sql": normalized,
+                    "call_site": _call_site(),
+                },
+                ensure_ascii=False,
+            )
+        )
+
+
+def instrument_queries(engine) -> None:
+    """エンジンのクエリを計測対象にする（同じエンジンに複数回呼んでもよい）。"""
+    if event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
@@ -0,0 +1,256 @@
+"""レート制限のアルゴリズムと状態の保存先
+
+アルゴリズムはどちらもキーごとに固定長の状態（数値のタプル）だけを持つため、
+キーあたりのメモリは O(1) です。
+
+- sliding_window: 直前の固定窓の件数を経過割合で按分して足す近似の移動窓
+  （固定窓の境界で2倍まで通ってしまう問題を避ける）
+- token_bucket: 容量 limit、毎秒 limit / window 個ずつ補充されるバケツ
+  （短時間のまとまったリクエストを容量まで許す）
+
+状態の保存先（RateLimitBackend）:
+
+- MemoryBackend: プロセス内の辞書。RATE_LIMIT_MAX_KEYS 件を超えると最後に使われた
+  時刻が古いキーから捨てる。ただし制限中のキーは、制限中でないキーがなくなるまで
+  捨てない（大量の新しいキーで制限中の状態を押し出させない）。ワーカーごとに別々に数える
+- StoreBackend: 共有ストア（RateLimitStore）に状態を置き、compare-and-set で
+  更新する。複数のワーカー・ホストで同じ上限を共有するためのもので、
+  Redis などのストアは RateLimitStore を実装して渡す。LocalStore は同じ
+  インターフェースのプロセス内実装（テスト・単一プロセス用）
+"""
+
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Protocol
+
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")  # "memory" | "store"
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+State = tuple[float, ...]
+# (現在の状態, 現在時刻, 上限件数, 窓の秒数) -> (新しい状態, 再試行までの秒数。0 なら許可)
+Algorithm = Callable[[State | None, float, int, float], tuple[State, float]]
+
+
+def sliding_window(
+    state: State | None, now: float, limit: int, window: float
+) -> tuple[State, float]:
+    """状態は (現在の窓の開始時刻, 現在の窓の件数, 直前の窓の件数)。"""
+    start = math.floor(now / window) * window
+    if state is None or state[0] < start - window:
+        current, previous = 0.0, 0.0
+    elif state[0] < start:
+        current, previous = 0.0, state[1]
+    else:
+        current, previous = state[1], state[2]
+
+    weight = 1 - (now - start) / window
+    if previous * weight + current + 1 <= limit:
+        return (start, current + 1, previous), 0.0
+
+    if current + 1 > limit:
+        # 現在の窓だけで上限に達している: 次の窓まで待つ
+        retry_after = start + window - now
+    else:
+        # 直前の窓の按分が減って1件分の空きができるまで待つ
+        excess = previous * weight + current + 1 - limit
+        retry_after = excess / previous * window
+    return (start, current, previous), retry_after
+
+
+def token_bucket(
+    state: State | None, now: float, limit: int, window: float
+) -> tuple[State, float]:
+    """状態は (残りのトークン数, 最後に補充した時刻)。"""
+    rate = limit / window
+    if state is None:
+        tokens = float(limit)
+    else:
+        tokens = min(float(limit), state[0] + (now - state[1]) * rate)
+    if tokens >= 1:
+        return (tokens - 1, now), 0.0
+    return (tokens, now), (1 - tokens) / rate
+
+
+ALGORITHMS: dict[str, Algorithm] = {
+    "sliding_window": sliding_window,
+    "token_bucket": token_bucket,
+}
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """window 秒あたり limit 件までのレート制限。"""
+
+    name: str
+    limit: int
+    window: float
+    algorithm: str = "sliding_window"
+
+
+class RateLimitBackend(Protocol):
+    def hit(self, key: str, rule: RateLimit, now: float | None = None) -> float:
+        """1件を数え、許可なら 0、拒否なら再試行までの秒数を返す。"""
+        ...
+
+    def peek(self, key: str, rule: RateLimit, now: float | None = None) -> float:
+        """数えずに、次の1件が許可されるなら 0、拒否されるなら再試行までの秒数を返す。"""
+        ...
+
+    def clear(self) -> None: ...
+
+
+class MemoryBackend:
+    """プロセス内の辞書に状態を持つ。"""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._states: dict[str, State] = {}
+        # 制限中でないキー（最後に使われた順）
+        self._recent: OrderedDict[str, None] = OrderedDict()
+        # 制限中のキー -> 制限が解ける時刻（制限された順）
+        self._limited: OrderedDict[str, float] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def hit(self, key: str, rule: RateLimit, now: float | None = None) -> float:
+        now = time.time() if now is None else now
+        algorithm = ALGORITHMS[rule.algorithm]
+        with self._lock:
+            state, retry_after = algorithm(
+                self._states.get(key), now, rule.limit, rule.window
+            )
+            self._states[key] = state
+            if retry_after > 0:
+                self._recent.pop(key, None)
+                self._limited.pop(key, None)
+                self._limited[key] = now + retry_after
+            else:
+                self._limited.pop(key, None)
+                self._recent[key] = None
+                self._recent.move_to_end(key)
+            self._evict(now)
+        return retry_after
+
+    def peek(self, key: str, rule: RateLimit, now: float | None = None) -> float:
+        now = time.time() if now is None else now
+        algorithm = ALGORITHMS[rule.algorithm]
+        with self._lock:
+            state = self._states.get(key)
+        return algorithm(state, now, rule.limit, rule.window)[1]
+
+    def _evict(self, now: float) -> None:
+        while len(self._states) > self.max_keys:
+            if self._limited and next(iter(self._limited.values())) <= now:
+                # 制限が解けたキーは制限中でないキーと同じく捨ててよい
+                key, _ = self._limited.popitem(last=False)
+            elif self._recent:
+                key, _ = self._recent.popitem(last=False)
+            else:
+                key, _ = self._limited.popitem(last=False)
+            del self._states[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._states.clear()
+            self._recent.clear()
+            self._limited.clear()
+
+
+class RateLimitStore(Protocol):
+    """共有ストアのインターフェース。
+
+    get はキーの値と版（値を書き換えるたびに変わる値。キーがなければ None）を返し、
+    compare_and_set は版が expected のままの場合だけ値を書き込んで True を返す。
+    ttl 秒後にはキーを消してよい。
+    """
+
+    def get(self, key: str) -> tuple[State | None, object]: ...
+
+    def compare_and_set(
+        self, key: str, expected: object, value: State, ttl: float
+    ) -> bool: ...
+
+
+class LocalStore:
+    """RateLimitStore のプロセス内実装。"""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        # キー -> (値, 版, 期限)
+        self._items: OrderedDict[str, tuple[State, int, float]] = OrderedDict()
+        self._versions = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> tuple[State | None, object]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[2] <= time.monotonic():
+                return None, None
+            return item[0], item[1]
+
+    def compare_and_set(
+        self, key: str, expected: object, value: State, ttl: float
+    ) -> bool:
+        with self._lock:
+            item = self._items.get(key)
+            current = None if item is None or item[2] <= time.monotonic() else item[1]
+            if current != expected:
+                return False
+            self._versions += 1
+            self._items[key] = (value, self._versions, time.monotonic() + ttl)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_keys:
+                self._items.popitem(last=False)
+            return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+
+class StoreBackend:
+    """共有ストアに状態を持つ。他のワーカーと競合した場合は読み直して再計算する。"""
+
+    def __init__(self, store: RateLimitStore, max_retries: int = 10):
+        self.store = store
+        self.max_retries = max_retries
+
+    def hit(self, key: str, rule: RateLimit, now: float | None = None) -> float:
+        now = time.time() if now is None else now
+        algorithm = ALGORITHMS[rule.algorithm]
+        # 状態は最大で2窓分（token_bucket は満杯に戻るまで）あれば足りる
+        ttl = 2 * rule.window
+        for _ in range(self.max_retries):
+            state, version = self.store.get(key)
+            new_state, retry_after = algorithm(state, now, rule.limit, rule.window)
+            if self.store.compare_and_set(key, version, new_state, ttl):
+                return retry_after
+        # 競合が続く場合は通す（レート制限の失敗でリクエストを止めない）
+        return 0.0
+
+    def peek(self, key: str, rule: RateLimit, now: float | None = None) -> float:
+        now = time.time() if now is None else now
+        algorithm = ALGORITHMS[rule.algorithm]
+        state, _ = self.store.get(key)
+        return algorithm(state, now, rule.limit, rule.window)[1]
+
+    def clear(self) -> None:
+        clear = getattr(self.store, "clear", None)
+        if clear is not None:
+            clear()
+
+
+@lru_cache(maxsize=1)
+def get_rate_limit_backend() -> RateLimitBackend:
+    """環境変数 RATE_LIMIT_BACKEND に応じた保存先を返す。"""
+    if RATE_LIMIT_BACKEND == "store":
+        return StoreBackend(LocalStore())
+    return MemoryBackend()
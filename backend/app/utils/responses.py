@@ -0,0 +1,71 @@
+"""レスポンスクラス
+
+JSON 化には orjson を使います（出力は Starlette の JSONResponse と同じ、
+UTF-8 で空白なしの JSON です）。
+
+条件付き GET 用に、version などの安価な値から弱い ETag を作り、
+If-None-Match が一致すれば本文を組み立てずに 304 を返すヘルパーも置いています。
+"""
+
+import hashlib
+from typing import Any
+
+import orjson
+from fastapi import Request, Response, status
+from fastapi.responses import JSONResponse
+
+
+def dumps(content: Any) -> bytes:
+    """UTF-8 の JSON バイト列に変換する。"""
+    return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+class FastJSONResponse(JSONResponse):
+    """アプリ全体の既定レスポンスクラス（main.py で設定）。
+
+    エンドポイントから直接返すと response_model による出力の再検証を
+    省略できるため、サービス層で組み立てた信頼できる dict を返す
+    ホットなエンドポイントで使います。
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+# ユーザごとに内容が異なるため共有キャッシュには置かせず、毎回再検証させる
+CACHE_CONTROL = "private, no-cache"
+
+
+def weak_etag(*parts: object) -> str:
+    """parts を連結した弱い ETag を返す（例: W/"h-1-42-7"）。"""
+    return 'W/"' + "-".join(str(p) for p in parts) + '"'
+
+
+def etag_digest(*parts: object) -> str:
+    """クエリパラメータなど、ETag にそのまま入れられない値を短いハッシュにする。"""
+    return hashlib.blake2b(repr(parts).encode(), digest_size=8).hexdigest()
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match が etag と（弱い比較で）一致するか。"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    opaque = etag.removeprefix("W/")
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == opaque:
+            return True
+    return False
+
+
+def not_modified(etag: str) -> Response:
+    """本文なしの 304 レスポンスを返す。"""
+    return Response(
+        status_code=status.HTTP_304_NOT_MODIFIED,
+        headers={"ETag": etag, "Cache-Control": CACHE_CONTROL},
+    )
+
+
+def etag_headers(etag: str) -> dict[str, str]:
+    return {"ETag": etag, "Cache-Control": CACHE_CONTROL}
@@ -0,0 +1,116 @@
+"""ユーザごとのメッセージベクトルインデックス（ディスク上の memmap）"""
+
+import fcntl
+import os
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+from app.utils.embedding import EMBEDDING_DIM
+
+VECTOR_INDEX_DIR = os.getenv("CHAT_VECTOR_INDEX_DIR", "data/vector_index")
+
+
+class VectorIndex:
+    """メッセージIDと埋め込みベクトルをユーザ単位で追記保存するインデックス。
+
+    ユーザごとに 2 ファイルを持つ:
+    - ``{user_id}.vec``: float32 の (n, dim) 行列（ヘッダなしの生バイト列）
+    - ``{user_id}.ids``: int64 のメッセージID列
+
+    検索時は np.memmap で読み込むため、インデックス全体をメモリに載せずに
+    ベクトル化した内積計算で類似度を求められます。
+
+    書き込みは ``{user_id}.lock`` への flock で直列化するため、複数の
+    ワーカープロセスから同じユーザに追記してもベクトルとIDの対応はずれません。
+    """
+
+    def __init__(
+        self, directory: str | Path = VECTOR_INDEX_DIR, dim: int = EMBEDDING_DIM
+    ):
+        self.directory = Path(directory)
+        self.dim = dim
+        self._lock = threading.Lock()
+
+    def _paths(self, user_id: int) -> tuple[Path, Path]:
+        return (
+            self.directory / f"{user_id}.vec",
+            self.directory / f"{user_id}.ids",
+        )
+
+    @contextmanager
+    def _locked(self, user_id: int) -> Iterator[None]:
+        """ユーザのインデックスをプロセス間・スレッド間で排他ロックする。"""
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with open(self.directory / f"{user_id}.lock", "ab") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _count(self, user_id: int) -> int:
+        vec_path, ids_path = self._paths(user_id)
+        if not vec_path.exists() or not ids_path.exists():
+            return 0
+        # 書き込み途中で落ちた場合に備え、両ファイルで揃っている件数だけを使う
+        return min(
+            vec_path.stat().st_size // (self.dim * 4),
+            ids_path.stat().st_size // 8,
+        )
+
+    def add(self, user_id: int, message_ids: list[int], vectors: np.ndarray) -> None:
+        """メッセージのベクトルを追記する。"""
+        if len(message_ids) != len(vectors):
+            raise ValueError("message_ids and vectors must have the same length")
+        if not message_ids:
+            return
+        vec_path, ids_path = self._paths(user_id)
+        data = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        with self._locked(user_id):
+            # ベクトルを先に書き、IDを後に書く（IDが存在する行は常に完全）
+            with open(vec_path, "ab") as f:
+                f.write(data.tobytes())
+            with open(ids_path, "ab") as f:
+                f.write(np.asarray(message_ids, dtype=np.int64).tobytes())
+
+    def search(
+        self,
+        user_id: int,
+        query: np.ndarray,
+        k: int,
+        exclude_ids: list[int] | None = None,
+    ) -> list[int]:
+        """クエリベクトルとのコサイン類似度が高い順にメッセージIDを返す。"""
+        count = self._count(user_id)
+        if count == 0 or k <= 0:
+            return []
+        vec_path, ids_path = self._paths(user_id)
+        vectors = np.memmap(
+            vec_path, dtype=np.float32, mode="r", shape=(count, self.dim)
+        )
+        ids = np.memmap(ids_path, dtype=np.int64, mode="r", shape=(count,))
+
+        scores = vectors @ np.asarray(query, dtype=np.float32)
+        if exclude_ids:
+            scores[np.isin(ids, exclude_ids)] = -np.inf
+
+        k = min(k, count)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [int(ids[i]) for i in top if np.isfinite(scores[i]) and scores[i] > 0]
+
+    def drop(self, user_id: int) -> None:
+        """ユーザのインデックスを削除する。"""
+        with self._locked(user_id):
+            for path in self._paths(user_id):
+                path.unlink(missing_ok=True)
+
+
+@lru_cache(maxsize=1)
+def get_vector_index() -> VectorIndex:
+    return VectorIndex()
@@ -0,0 +1,187 @@
+"""認証まわりのマイクロベンチマーク
+
+リクエストごとに通る認証の各処理について、1回あたりの時間（ns/op、
+--repeat 回の中央値）と1回の実行中のピークメモリ確保量を出力します。
+
+- create_access_token: JWT の生成
+- get_auth_claims: JWT の検証・デコード
+- get_user_br_column / get_user_record: email でのユーザ検索（--scales の件数ごと）
+- verify_password: bcrypt の検証（--bcrypt-rounds のコストごと）
+- auth_user / auth_user_record: get_auth_claims からユーザ取得までの依存関係の連鎖
+
+ユーザは乱数シード固定で生成し、SQLite（一時ファイル）へ投入します。
+検索するユーザも同じシードで選ぶため、実行ごとの結果を比較できます。
+
+    uv run python -m benchmarks.auth [--scales 10000,1000000] [--repeat 2000]
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+import uuid
+from collections.abc import Callable, Iterator
+from pathlib import Path
+
+PASSWORD = "bench-password"
+
+
+def _configure(database_path: Path) -> None:
+    """アプリのモジュールを読み込む前に環境変数を設定する。"""
+    os.environ["DATABASE_URL"] = f"sqlite:///{database_path}?check_same_thread=false"
+    os.environ["AUTH_SYSTEM"] = "email_password"
+    os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-0123456789abcdef")
+
+
+def _run_sync(coro):
+    """await しない async 関数をイベントループなしで実行する。"""
+    try:
+        coro.send(None)
+    except StopIteration as stop:
+        return stop.value
+    raise RuntimeError("coroutine awaited something")
+
+
+def _email(i: int) -> str:
+    return f"user{i:07d}@example.com"
+
+
+def user_rows(start: int, stop: int, seed: int) -> Iterator[dict]:
+    """users テーブルへ投入する行を生成する（同じ seed なら同じ内容）。"""
+    rng = random.Random(seed + start)
+    for i in range(start, stop):
+        yield {
+            "uuid": uuid.UUID(int=rng.getrandbits(128)),
+            "created_at": 1_700_000_000.0 + i,
+            "email": _email(i),
+            "password": None,
+            "name": f"User {i}",
+            "version": 1,
+            "token_version": 0,
+        }
+
+
+def _seed(engine, start: int, stop: int, seed: int, batch: int = 50_000) -> None:
+    from app.schema import User
+
+    table = User.__table__
+    rows = user_rows(start, stop, seed)
+    with engine.begin() as conn:
+        while chunk := [row for _, row in zip(range(batch), rows, strict=False)]:
+            conn.execute(table.insert(), chunk)
+
+
+def measure(func: Callable[[], object], repeat: int) -> dict:
+    func()  # ウォームアップ（文のコンパイルキャッシュなど）
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter_ns()
+        func()
+        timings.append(time.perf_counter_ns() - started)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "ns_per_op": int(statistics.median(timings)),
+        "peak_alloc_bytes": peak,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", default="10000,1000000")
+    parser.add_argument("--bcrypt-rounds", default="4,8,10,12")
+    parser.add_argument("--repeat", type=int, default=2000)
+    parser.add_argument("--bcrypt-repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    scales = sorted(int(s) for s in args.scales.split(","))
+    rounds = [int(r) for r in args.bcrypt_rounds.split(",")]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        _configure(Path(tmp) / "bench.db")
+
+        from datetime import timedelta
+
+        from app.database import get_engine
+        from app.repositories.user import get_user_br_column, get_user_record
+        from app.schema import User
+        from app.services.auth import auth_user, auth_user_record
+        from app.utils.auth.email_password import (
+            create_access_token,
+            create_sub,
+            get_auth_claims,
+            verify_password,
+        )
+        from passlib.context import CryptContext
+        from sqlmodel import Session, SQLModel
+
+        engine = get_engine()
+        SQLModel.metadata.create_all(engine)
+        rng = random.Random(args.seed)
+        results: dict[str, object] = {}
+
+        # クレームの内容は users の先頭行（_seed で投入）と一致させる
+        claims = create_sub(User(id=1, **next(user_rows(0, 1, args.seed))))
+        results["create_access_token"] = measure(
+            lambda: create_access_token(claims, timedelta(minutes=30)), args.repeat
+        )
+        token = create_access_token(claims, timedelta(minutes=30))
+        results["get_auth_claims"] = measure(
+            lambda: _run_sync(get_auth_claims(token)), args.repeat
+        )
+
+        seeded = 0
+        lookups: dict[str, dict] = {}
+        for scale in scales:
+            _seed(engine, seeded, scale, args.seed)
+            seeded = scale
+            emails = [_email(rng.randrange(scale)) for _ in range(args.repeat + 2)]
+            with Session(engine) as session:
+
+                def by_column(session=session, emails=iter(emails)):
+                    get_user_br_column(session, next(emails), "email")
+                    # 同じセッションの identity map が大きくならないようにする
+                    session.expunge_all()
+
+                def by_record(session=session, emails=iter(emails)):
+                    get_user_record(session, next(emails), "email")
+
+                lookups[str(scale)] = {
+                    "get_user_br_column": measure(by_column, args.repeat),
+                    "get_user_record": measure(by_record, args.repeat),
+                }
+        results["user_lookup"] = lookups
+
+        verify = {}
+        for cost in rounds:
+            context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=cost)
+            hashed = context.hash(PASSWORD)
+            verify[str(cost)] = measure(
+                lambda hashed=hashed: verify_password(PASSWORD, hashed),
+                args.bcrypt_repeat,
+            )
+        results["verify_password"] = verify
+
+        # 依存関係の連鎖（トークンの検証 → ユーザ取得。DB は最大の件数）
+        results["auth_user"] = measure(
+            lambda: _run_sync(auth_user(_run_sync(get_auth_claims(token)))),
+            args.repeat,
+        )
+        results["auth_user_record"] = measure(
+            lambda: _run_sync(auth_user_record(_run_sync(get_auth_claims(token)))),
+            args.repeat,
+        )
+        engine.dispose()
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
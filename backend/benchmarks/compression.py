@@ -0,0 +1,187 @@
+"""チャット本文の圧縮ベンチマーク
+
+本文の種類・サイズごとに、保存サイズの削減率と圧縮/展開のコスト、
+SQLite（ファイル）への書き込み・読み出しのオーバーヘッドを計測します。
+
+    uv run python -m benchmarks.compression [--rows 2000] [--codec zlib]
+"""
+
+import argparse
+import base64
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from app.utils.compression import compress_text, decompress_text
+
+_WORDS = [
+    "the",
+    "model",
+    "returns",
+    "a",
+    "streamed",
+    "answer",
+    "with",
+    "code",
+    "samples",
+    "and",
+    "references",
+    "to",
+    "earlier",
+    "messages",
+    "in",
+    "the",
+    "conversation",
+    "so",
+    "the",
+    "user",
+    "can",
+    "follow",
+    "along",
+]
+
+
+def _english(size: int, rng: random.Random) -> str:
+    words: list[str] = []
+    length = 0
+    while length < size:
+        word = rng.choice(_WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)[:size]
+
+
+def _japanese(size: int, rng: random.Random) -> str:
+    sentences = [
+        "会話の履歴を参照しながら回答を生成します。",
+        "保存期間を過ぎたメッセージはアーカイブへ移動します。",
+        "大きな本文は圧縮して保存されます。",
+    ]
+    parts: list[str] = []
+    length = 0
+    while length < size:
+        sentence = rng.choice(sentences)
+        parts.append(sentence)
+        length += len(sentence.encode())
+    return "".join(parts)
+
+
+def _json(size: int, rng: random.Random) -> str:
+    items: list[str] = []
+    length = 0
+    while length < size:
+        item = json.dumps({"id": rng.randrange(10**6), "name": rng.choice(_WORDS)})
+        items.append(item)
+        length += len(item) + 2
+    return "[" + ", ".join(items) + "]"
+
+
+def _random(size: int, rng: random.Random) -> str:
+    return base64.b64encode(rng.randbytes(size))[:size].decode()
+
+
+GENERATORS = {
+    "english": _english,
+    "japanese": _japanese,
+    "json": _json,
+    "random": _random,
+}
+SIZES = [256, 2048, 16384, 65536]
+
+
+def _per_op_us(func, values, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for v in values:
+            func(v)
+        best = min(best, time.perf_counter() - started)
+    return best / len(values) * 1e6
+
+
+def bench_codec(codec: str, samples: int) -> list[dict]:
+    rng = random.Random(0)
+    results = []
+    for kind, generate in GENERATORS.items():
+        for size in SIZES:
+            texts = [generate(size, rng) for _ in range(samples)]
+            packed = [compress_text(t, codec=codec) for t in texts]
+            raw_bytes = sum(len(t.encode()) for t in texts)
+            stored_bytes = sum(len(p) for p in packed)
+            results.append(
+                {
+                    "kind": kind,
+                    "size": size,
+                    "ratio": round(stored_bytes / raw_bytes, 3),
+                    "compress_us": round(
+                        _per_op_us(lambda t: compress_text(t, codec=codec), texts), 2
+                    ),
+                    "decompress_us": round(_per_op_us(decompress_text, packed), 2),
+                }
+            )
+    return results
+
+
+def bench_sqlite(codec: str, rows: int) -> dict:
+    """同じ本文を TEXT のまま / 圧縮して保存した場合の書き込み・読み出し時間。"""
+    rng = random.Random(1)
+    texts = [
+        GENERATORS[rng.choice(["english", "japanese", "json"])](rng.choice(SIZES), rng)
+        for _ in range(rows)
+    ]
+    result: dict = {"rows": rows}
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, encode, decode in (
+            ("plain", lambda t: t, lambda v: v),
+            ("compressed", lambda t: compress_text(t, codec=codec), decompress_text),
+        ):
+            path = os.path.join(tmp, f"{label}.db")
+            conn = sqlite3.connect(path)
+            conn.execute("CREATE TABLE m (id INTEGER PRIMARY KEY, content BLOB)")
+
+            started = time.perf_counter()
+            conn.executemany(
+                "INSERT INTO m (content) VALUES (?)", ((encode(t),) for t in texts)
+            )
+            conn.commit()
+            write_s = time.perf_counter() - started
+
+            started = time.perf_counter()
+            for (value,) in conn.execute("SELECT content FROM m ORDER BY id"):
+                decode(value)
+            read_s = time.perf_counter() - started
+            conn.close()
+
+            result[label] = {
+                "file_bytes": os.path.getsize(path),
+                "write_ms": round(write_s * 1000, 1),
+                "read_ms": round(read_s * 1000, 1),
+            }
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--codec", default="zlib", choices=["zlib", "zstd"])
+    parser.add_argument("--samples", type=int, default=50)
+    parser.add_argument("--rows", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(
+        json.dumps(
+            {
+                "codec": args.codec,
+                "codec_results": bench_codec(args.codec, args.samples),
+                "sqlite": bench_sqlite(args.codec, args.rows),
+            },
+            ensure_ascii=False,
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""履歴読み出しのベンチマーク（ORM インスタンス経由 vs 列プロジェクション）
+
+GET /api/chat/history と同じ limit 件の読み出し〜JSON 化までを、次の2通りで
+比較し、1行あたりの CPU 時間とピークメモリ確保量を出力します。
+
+- orm: ChatMessage を ORM で取得 → ChatMessageModel → response_model で再検証
+- projection: 必要な列だけを Row で取得 → dict → JSON
+
+    uv run python -m benchmarks.history_read [--limit 200] [--repeat 200]
+"""
+
+import argparse
+import json
+import random
+import time
+import tracemalloc
+
+from app.models.chat import ChatHistoryResponseModel, ChatMessageModel
+from app.repositories.chat_history import get_last_messages
+from app.schema import ChatMessage, User
+from pydantic import TypeAdapter
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine, select
+
+_response_adapter = TypeAdapter(ChatHistoryResponseModel)
+
+
+def _setup(messages: int) -> tuple[Session, User]:
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    SQLModel.metadata.create_all(engine)
+    session = Session(engine)
+    user = User(email="bench@example.com", name="Bench")
+    session.add(user)
+    session.commit()
+    rng = random.Random(0)
+    session.add_all(
+        ChatMessage(
+            user_id=user.id,
+            role="user" if i % 2 == 0 else "assistant",
+            content="lorem ipsum " * rng.randrange(5, 40),
+            created_at=float(i),
+        )
+        for i in range(messages)
+    )
+    session.commit()
+    return session, user
+
+
+def orm_path(session: Session, user: User, limit: int) -> bytes:
+    stmt = (
+        select(ChatMessage)
+        .where(ChatMessage.user_id == user.id)
+        .order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc())
+        .limit(limit)
+    )
+    rows = list(reversed(session.exec(stmt).all()))
+    messages = [
+        ChatMessageModel(
+            id=m.id, role=m.role, content=m.content, created_at=m.created_at
+        )
+        for m in rows
+    ]
+    # FastAPI の response_model による再検証と JSON 化
+    validated = _response_adapter.validate_python(
+        {"total": limit, "messages": messages}, from_attributes=True
+    )
+    body = _response_adapter.dump_python(validated, mode="json")
+    session.expunge_all()
+    return json.dumps(body, ensure_ascii=False).encode()
+
+
+def projection_path(session: Session, user: User, limit: int) -> bytes:
+    rows = get_last_messages(session, user, limit)
+    body = {
+        "total": limit,
+        "messages": [row._asdict() for row in rows],
+        "next_cursor": None,
+    }
+    return json.dumps(body, ensure_ascii=False).encode()
+
+
+def measure(func, session: Session, user: User, limit: int, repeat: int) -> dict:
+    func(session, user, limit)  # ウォームアップ（文のコンパイルキャッシュ）
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(session, user, limit)
+        best = min(best, time.perf_counter() - started)
+
+    tracemalloc.start()
+    func(session, user, limit)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "us_per_row": round(best / limit * 1e6, 2),
+        "peak_bytes_per_row": peak // limit,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--limit", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    session, user = _setup(args.limit * 5)
+    assert orm_path(session, user, args.limit) == projection_path(
+        session, user, args.limit
+    )
+    print(
+        json.dumps(
+            {
+                "limit": args.limit,
+                "orm": measure(orm_path, session, user, args.limit, args.repeat),
+                "projection": measure(
+                    projection_path, session, user, args.limit, args.repeat
+                ),
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+"""API ルートの負荷ベンチマーク（プロセス内）
+
+main.py の ASGI アプリを httpx の ASGITransport でプロセス内から呼び出し、
+SQLite（一時ファイル）と固定応答の LLM を使って各シナリオを計測します。
+ネットワークや uvicorn は含まないため、アプリ側（ルーティング・認証・DB・
+直列化・ミドルウェア）の性能の変化を見るためのものです。
+
+シナリオ: signin / users_me / chat / history / clear_history
+
+- closed: --concurrency 個の仮想ユーザが応答を待ってから次を送る（最大スループット）
+- open: --rate req/s（既定はシナリオごと）の一定間隔で送る。レイテンシは予定送信時刻から測るため、
+  詰まったときの待ち時間も含む（coordinated omission を避ける）
+
+結果（p50/p95/p99 と req/s）は --output へ JSON で保存します。--baseline を
+指定すると比較し、p95 が --tolerance を超えて悪化、またはスループットが
+--tolerance を超えて低下したシナリオがあれば終了コード 1 で終わります。
+基準値はマシンに依存するためリポジトリには置いていません。--baseline のファイルが
+ない・読めない場合は計測せずに終了コード 2、基準値と共通のシナリオがない場合は
+終了コード 1 で終わります。
+
+    uv run python -m benchmarks.http_load [--scenario history] [--mode closed]
+    uv run python -m benchmarks.http_load --output results.json --update-baseline base.json
+    uv run python -m benchmarks.http_load --baseline base.json --tolerance 0.2
+
+--llm-latency-ms で LLM の応答待ちを模擬できます（send_chat は generate_response を
+スレッドプールで呼ぶため、待ち時間はスレッドプールの枠を占有します）。
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+SCENARIOS = ("signin", "users_me", "chat", "history", "clear_history")
+MODES = ("closed", "open")
+# open の既定の到着レート（req/s）。signin は bcrypt の検証で 1 件数百 ms かかる
+OPEN_RATES = {"signin": 2, "chat": 20}
+DEFAULT_OPEN_RATE = 50
+PASSWORD = "bench-password"
+
+
+def _load_app(database_path: Path, llm_latency: float):
+    """環境変数を設定してからアプリを読み込み、テーブルを作る。"""
+    os.environ["DATABASE_URL"] = f"sqlite:///{database_path}?check_same_thread=false"
+    os.environ["AUTH_SYSTEM"] = "email_password"
+    os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-0123456789abcdef")
+    # 少数の仮想ユーザ・単一の IP から送るため、レート制限は外す
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+    from app.database import get_engine
+    from app.services import chat
+    from main import app
+    from sqlmodel import SQLModel
+
+    def fake_generate_response(messages: list[dict[str, str]]) -> str:
+        if llm_latency:
+            time.sleep(llm_latency)
+        return f"echo: {messages[-1]['content'][:40]}"
+
+    chat.generate_response = fake_generate_response
+    SQLModel.metadata.create_all(get_engine())
+    return app
+
+
+def _seed_users(count: int, history: int) -> list[tuple[str, str]]:
+    """仮想ユーザを作り、(email, アクセストークン) を返す。"""
+    from datetime import timedelta
+
+    from app.database import get_engine
+    from app.repositories.chat_history import add_message
+    from app.repositories.conversation import create_conversation
+    from app.schema import User
+    from app.utils.auth.email_password import (
+        create_access_token,
+        create_sub,
+        get_password_hash,
+    )
+    from sqlmodel import Session
+
+    # bcrypt は遅いため、全員同じパスワードのハッシュを使い回す
+    password_hash = get_password_hash(PASSWORD)
+    users = []
+    with Session(get_engine()) as session:
+        for i in range(count):
+            user = User(
+                email=f"bench{i}@example.com",
+                name=f"Bench {i}",
+                password=password_hash,
+            )
+            session.add(user)
+            session.commit()
+            session.refresh(user)
+            conversation = create_conversation(session, user)
+            for j in range(history):
+                role = "user" if j % 2 == 0 else "assistant"
+                add_message(session, user, role, f"message {j}", conversation)
+            token = create_access_token(create_sub(user), timedelta(hours=1))
+            users.append((user.email, token))
+    return users
+
+
+def _request(scenario: str, email: str, token: str) -> tuple[str, str, dict]:
+    auth = {"headers": {"Authorization": f"Bearer {token}"}}
+    if scenario == "signin":
+        return (
+            "POST",
+            "/api/auth/signin",
+            {"data": {"email": email, "password": PASSWORD}},
+        )
+    if scenario == "users_me":
+        return "GET", "/api/users/me", auth
+    if scenario == "chat":
+        return "POST", "/api/chat", {**auth, "json": {"prompt": "hello"}}
+    if scenario == "history":
+        return "GET", "/api/chat/history", auth
+    if scenario == "clear_history":
+        return "DELETE", "/api/chat/history", auth
+    raise ValueError(scenario)
+
+
+def _percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, round(q * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+def _summary(latencies: list[float], errors: int, elapsed: float) -> dict:
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "req_per_s": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(_percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+async def _send(client, scenario: str, user: tuple[str, str]) -> bool:
+    method, url, kwargs = _request(scenario, *user)
+    response = await client.request(method, url, **kwargs)
+    return response.status_code < 400
+
+
+async def run_closed(
+    client, scenario: str, users: list, concurrency: int, duration: float
+) -> dict:
+    latencies: list[float] = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker(user: tuple[str, str]) -> None:
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            ok = await _send(client, scenario, user)
+            latencies.append(time.perf_counter() - started)
+            errors += not ok
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(users[i % len(users)]) for i in range(concurrency)))
+    return _summary(latencies, errors, time.perf_counter() - started)
+
+
+async def run_open(
+    client, scenario: str, users: list, rate: float, duration: float
+) -> dict:
+    latencies: list[float] = []
+    errors = 0
+    interval = 1 / rate
+
+    async def one(user: tuple[str, str], scheduled: float) -> None:
+        nonlocal errors
+        ok = await _send(client, scenario, user)
+        # 予定時刻から測る（送信が遅れた分も待ち時間に含める）
+        latencies.append(time.perf_counter() - scheduled)
+        errors += not ok
+
+    tasks = []
+    started = time.perf_counter()
+    for i in range(int(rate * duration)):
+        scheduled = started + i * interval
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(one(users[i % len(users)], scheduled)))
+    await asyncio.gather(*tasks)
+    return _summary(latencies, errors, time.perf_counter() - started)
+
+
+async def run(args, app, users: list) -> dict:
+    results: dict[str, dict] = {}
+    transport = httpx.ASGITransport(app=app)
+    async with (
+        app.router.lifespan_context(app),
+        httpx.AsyncClient(transport=transport, base_url="http://bench") as client,
+    ):
+        for scenario in args.scenario:
+            # ウォームアップ（初回のルート解決・接続プールの作成などを除く）
+            for user in users[: args.concurrency]:
+                await _send(client, scenario, user)
+            for mode in args.mode:
+                if mode == "closed":
+                    result = await run_closed(
+                        client, scenario, users, args.concurrency, args.duration
+                    )
+                else:
+                    rate = args.rate or OPEN_RATES.get(scenario, DEFAULT_OPEN_RATE)
+                    result = await run_open(
+                        client, scenario, users, rate, args.duration
+                    )
+                results[f"{scenario}/{mode}"] = result
+                print(f"{scenario}/{mode}: {json.dumps(result)}", file=sys.stderr)
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """基準値より悪化したシナリオの説明を返す。"""
+    if not results.keys() & baseline.keys():
+        # 比較できるシナリオがなければ、悪化なしとして通さない
+        return ["no scenario in common with the baseline"]
+    regressions = []
+    for key, base in baseline.items():
+        current = results.get(key)
+        if current is None:
+            continue
+        if current["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(
+                f"{key}: p95 {current['p95_ms']}ms > baseline {base['p95_ms']}ms"
+            )
+        if current["req_per_s"] < base["req_per_s"] * (1 - tolerance):
+            regressions.append(
+                f"{key}: {current['req_per_s']} req/s < baseline {base['req_per_s']} req/s"
+            )
+        if current["errors"] > base["errors"]:
+            regressions.append(
+                f"{key}: {current['errors']} errors > baseline {base['errors']}"
+            )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", choices=SCENARIOS, action="append")
+    parser.add_argument("--mode", choices=MODES, action="append")
+    parser.add_argument("--duration", type=float, default=5, help="秒/シナリオ")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rate", type=float, help="open の req/s (全シナリオ共通)")
+    parser.add_argument("--users", type=int, default=32)
+    parser.add_argument(
+        "--history", type=int, default=50, help="ユーザごとの初期履歴件数"
+    )
+    parser.add_argument("--llm-latency-ms", type=float, default=0)
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--baseline", type=Path)
+    parser.add_argument("--update-baseline", type=Path)
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+    args.scenario = args.scenario or list(SCENARIOS)
+    args.mode = args.mode or list(MODES)
+    baseline = None
+    if args.baseline:
+        # 計測の前に読み込み、基準値がなければ比較できないとして終わる
+        try:
+            baseline = json.loads(args.baseline.read_text())
+        except (OSError, ValueError) as e:
+            parser.error(
+                f"cannot read baseline {args.baseline}: {e} "
+                "(record one on this machine with --update-baseline)"
+            )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = _load_app(Path(tmp) / "bench.db", args.llm_latency_ms / 1000)
+        users = _seed_users(args.users, args.history)
+        results = asyncio.run(run(args, app, users))
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        args.output.write_text(output)
+    if args.update_baseline:
+        args.update_baseline.write_text(output)
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""レスポンスの JSON 化ベンチマーク
+
+エンドポイントごとの代表的なレスポンスについて、次の3通りの1リクエストあたりの
+直列化コストを比較します（DB アクセスは含みません）。
+
+- default: response_model で検証 → Starlette の JSONResponse（標準 json）
+- validated_fast: response_model で検証 → FastJSONResponse
+- trusted_fast: 検証を省略して FastJSONResponse を直接返す
+
+    uv run python -m benchmarks.serialization [--repeat 2000]
+"""
+
+import argparse
+import json
+import time
+import uuid
+
+from app.models.chat import (
+    ChatHistoryResponseModel,
+    ChatSearchResponseModel,
+    ConversationListResponseModel,
+)
+from app.models.user import UserModel
+from app.utils.responses import FastJSONResponse
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+
+def _payloads() -> dict[str, tuple[type, dict]]:
+    history = {
+        "total": 1000,
+        "messages": [
+            {
+                "id": i,
+                "role": "user" if i % 2 == 0 else "assistant",
+                "content": "会話の本文 lorem ipsum " * 10,
+                "created_at": 1_700_000_000.0 + i,
+            }
+            for i in range(200)
+        ],
+        "next_cursor": "WzE3MDAwMDAwMDAuMCwgMF0=",
+    }
+    search = {
+        "hits": [
+            {
+                "id": i,
+                "role": "assistant",
+                "snippet": "… <mark>keyword</mark> in context …",
+                "created_at": 1_700_000_000.0 + i,
+                "rank": 1.0 / (i + 1),
+            }
+            for i in range(20)
+        ],
+        "next_cursor": "WzAuMDUsIDE5XQ==",
+    }
+    conversations = {
+        "conversations": [
+            {
+                "id": i,
+                "title": f"Conversation {i}",
+                "created_at": 1_700_000_000.0,
+                "last_message_at": 1_700_000_000.0 + i,
+                "message_count": i * 2,
+            }
+            for i in range(50)
+        ]
+    }
+    me = {"uuid": str(uuid.uuid4()), "email": "bench@example.com", "name": "Bench"}
+    return {
+        "GET /api/chat/history?limit=200": (ChatHistoryResponseModel, history),
+        "GET /api/chat/search": (ChatSearchResponseModel, search),
+        "GET /api/chat/conversations": (ConversationListResponseModel, conversations),
+        "GET /api/users/me": (UserModel, me),
+    }
+
+
+def _per_call_us(func, repeat: int) -> float:
+    func()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return round((time.perf_counter() - started) / repeat * 1e6, 2)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    results = {"endpoints": {}}
+    for endpoint, (model, payload) in _payloads().items():
+        adapter = TypeAdapter(model)
+
+        def validated(adapter=adapter, payload=payload):
+            # FastAPI の serialize_response と同じく検証してから JSON 互換へ変換
+            value = adapter.validate_python(payload, from_attributes=True)
+            return adapter.dump_python(value, mode="json")
+
+        results["endpoints"][endpoint] = {
+            "bytes": len(FastJSONResponse(payload).body),
+            "default_us": _per_call_us(
+                lambda v=validated: JSONResponse(v()), args.repeat
+            ),
+            "validated_fast_us": _per_call_us(
+                lambda v=validated: FastJSONResponse(v()), args.repeat
+            ),
+            "trusted_fast_us": _per_call_us(
+                lambda p=payload: FastJSONResponse(p), args.repeat
+            ),
+        }
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
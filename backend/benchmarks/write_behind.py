@@ -0,0 +1,120 @@
+"""write-behind（グループコミット）のベンチマーク
+
+同時に届いた requests 件のチャット保存（1リクエスト = user/assistant の2行）を、
+次の2通りで SQLite（ファイル）へ書き込み、スループットとコミット回数を比較します。
+
+- direct: リクエストごとに add_message で保存・コミット
+- buffered: ChatWriteBuffer で複数リクエストをまとめてコミット
+
+    uv run python -m benchmarks.write_behind [--requests 200] [--max-rows 50]
+"""
+
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+from pathlib import Path
+
+from app.repositories.chat_history import add_message
+from app.repositories.conversation import create_conversation
+from app.schema import User
+from app.services.chat_write_buffer import ChatWriteBuffer
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import event
+from sqlmodel import Session, SQLModel, create_engine
+
+
+def _setup(path: Path):
+    engine = create_engine(
+        f"sqlite:///{path}",
+        connect_args={"check_same_thread": False, "timeout": 30},
+    )
+    SQLModel.metadata.create_all(engine)
+    with Session(engine, expire_on_commit=False) as session:
+        user = User(email="bench@example.com", name="Bench")
+        session.add(user)
+        session.commit()
+        conversation = create_conversation(session, user)
+    commits: list[int] = []
+    event.listen(engine, "commit", lambda _conn: commits.append(1))
+    return engine, user, conversation, commits
+
+
+def run_direct(path: Path, requests: int) -> dict:
+    engine, user, conversation, commits = _setup(path)
+
+    def save(i: int) -> None:
+        with Session(engine) as session:
+            add_message(session, user, "user", f"p{i}", conversation)
+            add_message(session, user, "assistant", f"r{i}", conversation)
+
+    async def run() -> None:
+        await asyncio.gather(*(run_in_threadpool(save, i) for i in range(requests)))
+
+    started = time.perf_counter()
+    asyncio.run(run())
+    elapsed = time.perf_counter() - started
+    engine.dispose()
+    return {"req_per_s": round(requests / elapsed), "commits": len(commits)}
+
+
+def run_buffered(path: Path, requests: int, max_delay: float, max_rows: int) -> dict:
+    engine, user, conversation, commits = _setup(path)
+
+    async def run() -> None:
+        buffer = ChatWriteBuffer(
+            max_delay=max_delay,
+            max_rows=max_rows,
+            session_factory=lambda: Session(engine),
+        )
+        buffer.start()
+        await asyncio.gather(
+            *(
+                buffer.submit(
+                    [
+                        {
+                            "user_id": user.id,
+                            "conversation_id": conversation.id,
+                            "role": role,
+                            "content": f"{role}{i}",
+                            "created_at": time.time(),
+                        }
+                        for role in ("user", "assistant")
+                    ]
+                )
+                for i in range(requests)
+            )
+        )
+        await buffer.stop()
+
+    started = time.perf_counter()
+    asyncio.run(run())
+    elapsed = time.perf_counter() - started
+    engine.dispose()
+    return {"req_per_s": round(requests / elapsed), "commits": len(commits)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--max-delay-ms", type=float, default=5)
+    parser.add_argument("--max-rows", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        result = {
+            "requests": args.requests,
+            "direct": run_direct(Path(tmp) / "direct.db", args.requests),
+            "buffered": run_buffered(
+                Path(tmp) / "buffered.db",
+                args.requests,
+                args.max_delay_ms / 1000,
+                args.max_rows,
+            ),
+        }
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,24 @@
+from contextlib import asynccontextmanager
+
+from app.middleware.compression import CompressionMiddleware
+from app.middleware.deadline import DeadlineMiddleware
+from app.middleware.load_shedding import LoadSheddingMiddleware
+from app.middleware.metrics import MetricsMiddleware
+from app.middleware.profiler import ProfilerMiddleware
+from app.middleware.query_profiler import QueryProfilerMiddleware
 from app.routers.routers import api_router
+from app.services.chat_write_buffer import (
+    start_chat_write_buffer,
+    stop_chat_write_buffer,
+)
+from app.services.mail_outbox import start_mail_outbox, stop_mail_outbox
+from app.services.password_reset import (
+    start_reset_token_sweeper,
+    stop_reset_token_sweeper,
+)
+from app.services.token_revocation import start_denylist_sync, stop_denylist_sync
+from app.utils.metrics import start_metrics_writer, stop_metrics_writer
+from app.utils.responses import FastJSONResponse
 from dotenv import load_dotenv
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
@@ -6,12 +26,47 @@ from fastapi.middleware.cors import CORSMiddleware
 # 環境変数の読み込み
 load_dotenv()
 
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    await start_chat_write_buffer()
+    await start_metrics_writer()
+    await start_denylist_sync()
+    await start_reset_token_sweeper()
+    await start_mail_outbox()
+    yield
+    await stop_mail_outbox()
+    await stop_reset_token_sweeper()
+    await stop_denylist_sync()
+    await stop_metrics_writer()
+    await stop_chat_write_buffer()
+
+
 # アプリケーションとログの設定
 app = FastAPI(
     redirect_slashes=False,
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse,
 )
 
-# CORSの設定
+# オンデマンドのサンプリングプロファイラ（X-Profile ヘッダまたは抽出率で有効）
+app.add_middleware(ProfilerMiddleware)
+
+# リクエストごとの SQL プロファイル（DEBUG 時は Server-Timing ヘッダを付ける）
+app.add_middleware(QueryProfilerMiddleware)
+
+# レスポンス圧縮（アプリが返した最終的なレスポンスを圧縮する）
+app.add_middleware(CompressionMiddleware)
+
+# リクエストの期限（同時処理数の上限の内側で、処理を始めてから数える。
+# 期限切れ・切断で処理をキャンセル）
+app.add_middleware(DeadlineMiddleware)
+
+# 同時処理数の上限（超えた分は処理を始める前に 503 で断る）
+app.add_middleware(LoadSheddingMiddleware)
+
+# CORSの設定（期限切れの 504・負荷遮断の 503 にも CORS のヘッダを付けるため、
+# それらより外側に置く）
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -20,5 +75,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# メトリクス記録（最も外側で、圧縮を含めたレイテンシを記録する）
+app.add_middleware(MetricsMiddleware)
+
 # ルーターの登録
 app.include_router(api_router)
@@ -5,7 +5,12 @@ from pathlib import Path
 
 import pytest
 from app.database import get_session
-from app.utils.auth.email_password import create_access_token, create_sub
+from app.utils.auth.email_password import (
+    clear_user_versions,
+    create_access_token,
+    create_sub,
+)
+from app.utils.rate_limit import get_rate_limit_backend
 from app.utils.test_database import clear_test_config, set_test_engine, set_test_session
 from fastapi.testclient import TestClient
 from main import app
@@ -16,6 +21,7 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 # Import all fixtures from the fixtures directory
 from tests.fixtures.database import *  # noqa: F403
 from tests.fixtures.users import *  # noqa: F403
+from tests.mocks.llm import *  # noqa: F403
 
 
 @pytest.fixture
@@ -36,6 +42,11 @@ def test_client(test_session, test_engine):
     # 依存性をオーバーライド
     app.dependency_overrides[get_session] = get_test_session
 
+    # 他のテストのリクエストをレート制限で数えない
+    get_rate_limit_backend().clear()
+    # 同じユーザIDで別のテストが確認した version を使わない
+    clear_user_versions()
+
     try:
         with TestClient(app) as client:
             yield client
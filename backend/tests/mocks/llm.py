@@ -0,0 +1,27 @@
+"""LLM 呼び出しのモック"""
+
+import pytest
+
+
+class FakeLLM:
+    """generate_response の代わりに固定の応答を返し、受け取った messages を記録する"""
+
+    def __init__(self, reply: str = "fake response"):
+        self.reply = reply
+        self.calls: list[list[dict[str, str]]] = []
+
+    def __call__(self, messages: list[dict[str, str]]) -> str:
+        self.calls.append(messages)
+        return self.reply
+
+    @property
+    def last_messages(self) -> list[dict[str, str]]:
+        return self.calls[-1]
+
+
+@pytest.fixture
+def mock_llm(monkeypatch):
+    """チャットサービスの LLM 呼び出しを FakeLLM に差し替える fixture"""
+    fake = FakeLLM()
+    monkeypatch.setattr("app.services.chat.generate_response", fake)
+    return fake
@@ -1,5 +1,18 @@
 """Auth API endpoint tests."""
 
+import asyncio
+import time
+from datetime import timedelta
+from uuid import uuid4
+
+import pytest
+from app.repositories.revoked_token import add_revoked_token
+from app.services.token_revocation import sync_denylist
+from app.utils.auth import email_password
+from app.utils.auth.denylist import TokenDenylist, denylist
+from app.utils.auth.email_password import create_access_token, create_sub
+from sqlalchemy import event
+
 from tests.fixtures.test_data import TestConstants
 
 
@@ -219,3 +232,191 @@ class TestPasswordReset:
         )
 
         assert response.status_code == 401
+
+
+class TestTokenClaims:
+    """アクセストークンのクレームによる認証のテスト"""
+
+    ME_URL = f"{TestConstants.USERS_BASE}/me"
+
+    @staticmethod
+    def _token(user, **overrides) -> dict:
+        claims = {**create_sub(user), **overrides}
+        token = create_access_token(claims, timedelta(minutes=30))
+        return {"Authorization": f"Bearer {token}"}
+
+    def test_claims_identify_user(self, authenticated_user):
+        """トークンがユーザID・uuid・名前・token_version を持つことをテスト"""
+        claims = create_sub(authenticated_user)
+        assert claims["uid"] == authenticated_user.id
+        assert claims["uuid"] == str(authenticated_user.uuid)
+        assert claims["name"] == authenticated_user.name
+        assert claims["tv"] == authenticated_user.token_version
+
+    def test_read_paths_skip_user_lookup(
+        self, test_client, test_engine, authenticated_user
+    ):
+        """読み取り系は users を email で検索せずに応答することをテスト"""
+        statements: list[str] = []
+
+        def record(_conn, _cursor, statement, *_args):
+            statements.append(statement)
+
+        event.listen(test_engine, "before_cursor_execute", record)
+        try:
+            headers = self._token(authenticated_user)
+            me = test_client.get(self.ME_URL, headers=headers)
+            history = test_client.get(
+                f"{TestConstants.CHAT_BASE}/history", headers=headers
+            )
+        finally:
+            event.remove(test_engine, "before_cursor_execute", record)
+
+        assert me.status_code == 200
+        assert me.json()["name"] == authenticated_user.name
+        assert history.status_code == 200
+        assert not [s for s in statements if "users.email =" in s]
+
+    def test_profile_update_is_visible_with_old_token(
+        self, test_client, authenticated_user
+    ):
+        """発行後に名前を変えても、古いトークンで最新の値が返ることをテスト"""
+        headers = self._token(authenticated_user)
+        response = test_client.put(
+            self.ME_URL, json={"name": "Renamed"}, headers=headers
+        )
+        assert response.status_code == 200
+
+        response = test_client.get(self.ME_URL, headers=headers)
+        assert response.status_code == 200
+        assert response.json()["name"] == "Renamed"
+
+    def test_password_change_revokes_old_tokens(self, test_client, authenticated_user):
+        """パスワード変更で古いトークンが失効し、新しいトークンが返ることをテスト"""
+        old = self._token(authenticated_user)
+        response = test_client.post(
+            f"{TestConstants.AUTH_BASE}/change-password",
+            json={
+                "current_password": "test_password_123",
+                "new_password": "new_password_456",
+            },
+            headers=old,
+        )
+        assert response.status_code == 200
+        new = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        assert test_client.get(self.ME_URL, headers=old).status_code == 401
+        history = f"{TestConstants.CHAT_BASE}/history"
+        assert test_client.get(history, headers=old).status_code == 401
+        assert test_client.get(self.ME_URL, headers=new).status_code == 200
+
+    def test_cached_version_check_is_cleared_on_change(
+        self, test_client, authenticated_user, monkeypatch
+    ):
+        """確認結果を保持していても、同じプロセスでの変更は即座に反映されることをテスト"""
+        monkeypatch.setattr(email_password, "AUTH_VERSION_CACHE_SECONDS", 60)
+        headers = self._token(authenticated_user)
+        assert test_client.get(self.ME_URL, headers=headers).status_code == 200
+
+        test_client.put(self.ME_URL, json={"name": "Cached"}, headers=headers)
+        assert test_client.get(self.ME_URL, headers=headers).json()["name"] == "Cached"
+
+    def test_legacy_token_without_identity_is_rejected(
+        self, test_client, authenticated_user
+    ):
+        """token_version を持たない旧形式のトークンは失効を確認できないため拒否することをテスト"""
+        token = create_access_token(
+            {"sub": authenticated_user.email}, timedelta(minutes=30)
+        )
+        response = test_client.get(
+            self.ME_URL, headers={"Authorization": f"Bearer {token}"}
+        )
+        assert response.status_code == 401
+
+    def test_version_check_is_cached_by_default(
+        self, test_client, test_engine, authenticated_user
+    ):
+        """既定の設定では、続くリクエストで version を DB に問い合わせないことをテスト"""
+        headers = self._token(authenticated_user)
+        assert test_client.get(self.ME_URL, headers=headers).status_code == 200
+        statements: list[str] = []
+
+        def record(_conn, _cursor, statement, *_args):
+            statements.append(statement)
+
+        event.listen(test_engine, "before_cursor_execute", record)
+        try:
+            assert test_client.get(self.ME_URL, headers=headers).status_code == 200
+        finally:
+            event.remove(test_engine, "before_cursor_execute", record)
+        assert not [s for s in statements if "FROM users" in s]
+
+
+class TestLogout:
+    """ログアウト（jti の失効）のテスト"""
+
+    ME_URL = f"{TestConstants.USERS_BASE}/me"
+
+    @staticmethod
+    def _headers(user) -> dict:
+        token = create_access_token(create_sub(user), timedelta(minutes=30))
+        return {"Authorization": f"Bearer {token}"}
+
+    def test_logout_revokes_only_that_token(self, test_client, authenticated_user):
+        """ログアウトしたトークンだけが使えなくなることをテスト"""
+        logged_out = self._headers(authenticated_user)
+        other = self._headers(authenticated_user)
+
+        response = test_client.post(
+            f"{TestConstants.AUTH_BASE}/logout", headers=logged_out
+        )
+        assert response.status_code == 200
+
+        assert test_client.get(self.ME_URL, headers=logged_out).status_code == 401
+        history = f"{TestConstants.CHAT_BASE}/history"
+        assert test_client.get(history, headers=logged_out).status_code == 401
+        assert test_client.get(self.ME_URL, headers=other).status_code == 200
+
+    def test_logout_requires_token(self, test_client):
+        """トークンなしのログアウトは 401 になることをテスト"""
+        response = test_client.post(f"{TestConstants.AUTH_BASE}/logout")
+        assert response.status_code == 401
+
+    @pytest.mark.usefixtures("test_client")
+    def test_sync_loads_revocations_from_database(
+        self, test_session, authenticated_user
+    ):
+        """他のプロセスで失効したトークンを同期で読み込むことをテスト"""
+        jti = uuid4().hex
+        add_revoked_token(test_session, jti, authenticated_user.id, time.time() + 60)
+        assert not denylist.contains(jti)
+
+        asyncio.run(sync_denylist())
+        assert denylist.contains(jti)
+
+
+class TestTokenDenylist:
+    """拒否リストのテスト"""
+
+    def test_no_false_negatives(self):
+        """追加した jti は必ず含まれると判定されることをテスト"""
+        entries = TokenDenylist(capacity=100)
+        jtis = [uuid4().hex for _ in range(500)]
+        expires_at = time.time() + 60
+        for jti in jtis:
+            entries.add(jti, expires_at)
+
+        assert all(entries.contains(jti) for jti in jtis)
+        assert not any(entries.contains(uuid4().hex) for _ in range(1000))
+
+    def test_expired_entries_are_pruned(self):
+        """期限切れのエントリは判定されず、prune で除かれることをテスト"""
+        entries = TokenDenylist(capacity=10)
+        now = time.time()
+        entries.add("expired", now - 1)
+        entries.add("live", now + 60)
+
+        assert not entries.contains("expired")
+        assert entries.prune(now) == 1
+        assert len(entries) == 1
+        assert entries.contains("live")
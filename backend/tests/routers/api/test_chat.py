@@ -0,0 +1,1104 @@
+"""Chat API endpoint tests."""
+
+import asyncio
+import gzip
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+from app.jobs.archive_chat_messages import archive_old_messages
+from app.repositories.chat_stats import reconcile_message_counts
+from app.repositories.conversation import create_conversation
+from app.schema import (
+    ChatImportJob,
+    ChatMessage,
+    ChatMessageStats,
+    Conversation,
+    User,
+)
+from app.services import chat as chat_service
+from app.services import chat_import as chat_import_service
+from app.services.chat_write_buffer import (
+    ChatWriteBuffer,
+    get_chat_write_buffer,
+    start_chat_write_buffer,
+    stop_chat_write_buffer,
+)
+from app.utils import deadline as deadline_module
+from app.utils.compression import compress_text, decompress_text
+from app.utils.deadline import DeadlineExceeded
+from app.utils.vector_index import VectorIndex
+from fastapi.responses import JSONResponse
+from sqlalchemy import event, text
+from sqlmodel import Session, SQLModel, create_engine, func, select
+
+from tests.fixtures.test_data import TestConstants
+
+
+class TestChatEndpoints:
+    """チャットAPI エンドポイントのテスト"""
+
+    BASE_URL = TestConstants.CHAT_BASE
+
+    def test_chat_unauthenticated(self, test_client):
+        """認証されていない場合のテスト"""
+        response = test_client.post(self.BASE_URL, json={"prompt": "hello"})
+        assert response.status_code == 401
+
+    def test_chat_saves_history(self, authenticated_client, mock_llm):
+        """チャットの入力と応答が履歴に保存されることをテスト"""
+        response = authenticated_client.post(self.BASE_URL, json={"prompt": "hello"})
+        assert response.status_code == 200
+        assert response.json()["response"] == mock_llm.reply
+
+        response = authenticated_client.get(f"{self.BASE_URL}/history")
+        assert response.status_code == 200
+        messages = response.json()["messages"]
+        assert [(m["role"], m["content"]) for m in messages] == [
+            ("user", "hello"),
+            ("assistant", mock_llm.reply),
+        ]
+
+    def test_chat_sends_recent_history(self, authenticated_client, mock_llm):
+        """直近の履歴が LLM に渡されることをテスト"""
+        authenticated_client.post(self.BASE_URL, json={"prompt": "first"})
+        authenticated_client.post(self.BASE_URL, json={"prompt": "second"})
+
+        contents = [m["content"] for m in mock_llm.last_messages]
+        assert contents == ["first", mock_llm.reply, "second"]
+
+    @pytest.mark.usefixtures("mock_llm")
+    def test_history_response_shape(self, authenticated_client):
+        """履歴の各メッセージが ChatMessageModel と同じ項目で返ることをテスト"""
+        authenticated_client.post(self.BASE_URL, json={"prompt": "hello"})
+
+        body = authenticated_client.get(f"{self.BASE_URL}/history").json()
+        assert body["total"] == 2
+        message = body["messages"][0]
+        assert set(message) == {"id", "role", "content", "created_at"}
+        assert isinstance(message["id"], int)
+        assert isinstance(message["created_at"], float)
+
+    @pytest.mark.usefixtures("mock_llm")
+    def test_history_same_as_standard_json(self, authenticated_client):
+        """orjson の出力が標準の JSONResponse と同じバイト列になることをテスト"""
+        authenticated_client.post(self.BASE_URL, json={"prompt": "こんにちは"})
+        response = authenticated_client.get(f"{self.BASE_URL}/history")
+        assert response.headers["content-type"] == "application/json"
+        assert response.content == JSONResponse(response.json()).body
+
+    @pytest.mark.usefixtures("mock_llm")
+    def test_history_conditional_get(self, authenticated_client):
+        """履歴が変わらなければ 304、追加・削除後は新しい ETag で 200 になることをテスト"""
+        url = f"{self.BASE_URL}/history"
+        authenticated_client.post(self.BASE_URL, json={"prompt": "hello"})
+        etag = authenticated_client.get(url).headers["etag"]
+
+        cached = authenticated_client.get(url, headers={"If-None-Match": etag})
+        assert cached.status_code == 304
+        assert cached.content == b""
+
+        authenticated_client.post(self.BASE_URL, json={"prompt": "again"})
+        added = authenticated_client.get(url, headers={"If-None-Match": etag})
+        assert added.status_code == 200
+        assert added.json()["total"] == 4
+
+        etag = added.headers["etag"]
+        authenticated_client.delete(url)
+        cleared = authenticated_client.get(url, headers={"If-None-Match": etag})
+        assert cleared.status_code == 200
+        assert cleared.json()["messages"] == []
+
+    @pytest.mark.usefixtures("mock_llm")
+    def test_history_etag_depends_on_page(self, authenticated_client):
+        """ページ（クエリパラメータ）ごとに別の ETag になることをテスト"""
+        url = f"{self.BASE_URL}/history"
+        authenticated_client.post(self.BASE_URL, json={"prompt": "hello"})
+        first = authenticated_client.get(url, params={"limit": 1})
+        params = {"limit": 1, "before": first.json()["next_cursor"]}
+        etags = {
+            authenticated_client.get(url).headers["etag"],
+            first.headers["etag"],
+            authenticated_client.get(url, params=params).headers["etag"],
+        }
+        assert len(etags) == 3
+
+        cached = authenticated_client.get(
+            url, params={"limit": 1}, headers={"If-None-Match": first.headers["etag"]}
+        )
+        assert cached.status_code == 304
+
+    @pytest.mark.usefixtures("mock_llm")
+    def test_clear_history(self, authenticated_client):
+        """履歴の削除をテスト"""
+        authenticated_client.post(self.BASE_URL, json={"prompt": "hello"})
+
+        response = authenticated_client.delete(f"{self.BASE_URL}/history")
+        assert response.status_code == 204
+
+        response = authenticated_client.get(f"{self.BASE_URL}/history")
+        assert response.json()["messages"] == []
+
+
+class TestChatHistoryTotal:
+    """履歴件数（total）のテスト"""
+
+    BASE_URL = TestConstants.CHAT_BASE
+
+    @pytest.mark.usefixtures("mock_llm")
+    def test_total_counts_all_messages(self, authenticated_client):
+        """total が limit に関係なく全件数を返すことをテスト"""
+        for prompt in ["one", "two", "three"]:
+            authenticated_client.post(self.BASE_URL, json={"prompt": prompt})
+
+        body = authenticated_client.get(
+            f"{self.BASE_URL}/history", params={"limit": 2}
+        ).json()
+        assert len(body["messages"]) == 2
+        assert body["total"] == 6
+
+        authenticated_client.delete(f"{self.BASE_URL}/history")
+        body = authenticated_client.get(f"{self.BASE_URL}/history").json()
+        assert body["total"] == 0
+
+    @pytest.mark.usefixtures("mock_llm")
+    def test_reconcile_repairs_drift(
+        self, authenticated_client, authenticated_user, test_session
+    ):
+        """修復ジョブで件数のずれが直ることをテスト"""
+        authenticated_client.post(self.BASE_URL, json={"prompt": "hello"})
+
+        stats = test_session.get(ChatMessageStats, authenticated_user.id)
+        stats.message_count = 42
+        test_session.add(stats)
+        test_session.commit()
+
+        assert reconcile_message_counts(test_session) == 1
+        body = authenticated_client.get(f"{self.BASE_URL}/history").json()
+        assert body["total"] == 2
+        assert reconcile_message_counts(test_session) == 0
+
+    def test_reconcile_in_batches(self, test_session, test_user, authenticated_user):
+        """ユーザを分割して処理しても、全ユーザ・会話スレッドのずれが直ることをテスト"""
+        conversation = create_conversation(test_session, test_user)
+        test_session.add(
+            ChatMessage(
+                user_id=test_user.id,
+                role="user",
+                content="hello",
+                conversation_id=conversation.id,
+            )
+        )
+        test_session.add(
+            ChatMessageStats(user_id=authenticated_user.id, message_count=5)
+        )
+        test_session.commit()
+
+        # test_user の集計行・会話スレッドの件数、authenticated_user の集計行
+        assert reconcile_message_counts(test_session, batch_size=1) == 3
+        assert test_session.get(ChatMessageStats, test_user.id).message_count == 1
+        assert (
+            test_session.get(ChatMessageStats, authenticated_user.id).message_count == 0
+        )
+        test_session.refresh(conversation)
+        assert conversation.message_count == 1
+        assert reconcile_message_counts(test_session, batch_size=1) == 0
+
+
+class TestChatArchive:
+    """古いメッセージのアーカイブと履歴の遡りのテスト"""
+
+    BASE_URL = TestConstants.CHAT_BASE
+
+    def _age_messages(self, session, days):
+        old = (datetime.now() - timedelta(days=days)).timestamp()
+        for message in session.exec(select(ChatMessage)).all():
+            message.created_at = old
+            session.add(message)
+        session.commit()
+
+    @pytest.mark.usefixtures("mock_llm")
+    def test_history_continues_into_archive(self, authenticated_client, test_session):
+        """アーカイブ済みの履歴もページングで遡れることをテスト"""
+        authenticated_client.post(self.BASE_URL, json={"prompt": "old message"})
+        self._age_messages(test_session, days=400)
+        authenticated_client.post(self.BASE_URL, json={"prompt": "new message"})
+
+        assert archive_old_messages(test_session, retention_days=365) == 2
+
+        first = authenticated_client.get(
+            f"{self.BASE_URL}/history", params={"limit": 2}
+        ).json()
+        assert first["messages"][0]["content"] == "new message"
+        assert first["total"] == 4
+
+        older = authenticated_client.get(
+            f"{self.BASE_URL}/history",
+            params={"limit": 2, "before_id": first["messages"][0]["id"]},
+        ).json()
+        assert older["messages"][0]["content"] == "old message"
+
+        # 先頭ページが limit を満たさない場合も続きとしてアーカイブを含める
+        everything = authenticated_client.get(f"{self.BASE_URL}/history").json()
+        assert len(everything["messages"]) == 4
+
+    @pytest.mark.usefixtures("mock_llm")
+    def test_short_history_skips_archive(self, authenticated_client, test_engine):
+        """アーカイブ済みのメッセージがなければ、短い履歴でもアーカイブを読まないことをテスト"""
+        authenticated_client.post(self.BASE_URL, json={"prompt": "hello"})
+        statements = []
+
+        def record(_conn, _cursor, statement, *_args):
+            statements.append(statement)
+
+        event.listen(test_engine, "before_cursor_execute", record)
+        try:
+            body = authenticated_client.get(f"{self.BASE_URL}/history").json()
+        finally:
+            event.remove(test_engine, "before_cursor_execute", record)
+        assert len(body["messages"]) == 2
+        assert statements
+        assert not any("chat_messages_archive" in s for s in statements)
+
+    @pytest.mark.usefixtures("mock_llm")
+    def test_archived_ids_are_not_reused(self, authenticated_client, test_session):
+        """最大の ID をアーカイブへ移しても、新しいメッセージに同じ ID を使わないことをテスト"""
+        authenticated_client.post(self.BASE_URL, json={"prompt": "old message"})
+        self._age_messages(test_session, days=400)
+        archived = set(test_session.exec(select(ChatMessage.id)).all())
+        assert archive_old_messages(test_session, retention_days=365) == 2
+
+        authenticated_client.post(self.BASE_URL, json={"prompt": "new message"})
+        new = set(test_session.exec(select(ChatMessage.id)).all())
+        assert min(new) > max(archived)
+
+    @pytest.mark.usefixtures("mock_llm")
+    def test_archive_keeps_counts_and_clear_removes_archive(
+        self, authenticated_client, test_session
+    ):
+        """アーカイブ後も件数が維持され、履歴削除でアーカイブも消えることをテスト"""
+        authenticated_client.post(self.BASE_URL, json={"prompt": "old message"})
+        self._age_messages(test_session, days=30)
+        archive_old_messages(test_session, retention_days=7, batch_size=1)
+
+        assert reconcile_message_counts(test_session) == 0
+
+        authenticated_client.delete(f"{self.BASE_URL}/history")
+        body = authenticated_client.get(f"{self.BASE_URL}/history").json()
+        assert body == {"total": 0, "messages": [], "next_cursor": None}
+
+
+class TestChatExport:
+    """履歴の NDJSON エクスポートのテスト"""
+
+    BASE_URL = TestConstants.CHAT_BASE
+
+    def test_export_unauthenticated(self, test_client):
+        """認証されていない場合のテスト"""
+        response = test_client.get(f"{self.BASE_URL}/export")
+        assert response.status_code == 401
+
+    @pytest.mark.usefixtures("mock_llm")
+    def test_export_streams_all_messages(self, authenticated_client, monkeypatch):
+        """fetch size を超える履歴が全件 NDJSON で出力されることをテスト"""
+        monkeypatch.setattr("app.services.chat.EXPORT_FETCH_SIZE", 3)
+        for i in range(4):
+            authenticated_client.post(self.BASE_URL, json={"prompt": f"p{i}"})
+
+        response = authenticated_client.get(f"{self.BASE_URL}/export")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert len(lines) == 8
+        assert [line["content"] for line in lines[::2]] == ["p0", "p1", "p2", "p3"]
+        assert [line["id"] for line in lines] == sorted(line["id"] for line in lines)
+
+    @pytest.mark.parametrize("compress", [False, True])
+    def test_export_starts_before_first_fetch(self, monkeypatch, compress):
+        """最初のチャンクは DB からの取得を待たずに返すことをテスト"""
+
+        def unavailable():
+            raise AssertionError("the first chunk must not wait for the database")
+
+        monkeypatch.setattr("app.services.chat.get_db_session", unavailable)
+        chunks = chat_service.export_history(1, compress=compress)
+        first = next(chunks)
+        assert first == b"" or first.startswith(b"\x1f\x8b")
+
+    @pytest.mark.usefixtures("mock_llm")
+    def test_export_plain_starts_with_compression(
+        self, authenticated_client, monkeypatch
+    ):
+        """Accept-Encoding 付きの NDJSON でも、取得の前に応答を始めることをテスト"""
+        iter_all_messages = chat_service.iter_all_messages
+        started = []
+
+        def checked_iter_all_messages(*args):
+            # 取得を始める時点で、既にステータス・ヘッダを送出している
+            started.append(deadline_module.remaining() is None)
+            yield from iter_all_messages(*args)
+
+        monkeypatch.setattr(
+            "app.services.chat.iter_all_messages", checked_iter_all_messages
+        )
+        authenticated_client.post(self.BASE_URL, json={"prompt": "hello"})
+        response = authenticated_client.get(
+            f"{self.BASE_URL}/export", headers={"Accept-Encoding": "gzip"}
+        )
+        assert response.status_code == 200
+        assert response.headers["content-encoding"] == "gzip"
+        assert len(response.text.splitlines()) == 2
+        assert started == [True]
+
+    @pytest.mark.usefixtures("mock_llm")
+    def test_export_gzip_includes_archive(self, authenticated_client, test_session):
+        """gzip 形式でアーカイブ済みの履歴も含めて出力されることをテスト"""
+        authenticated_client.post(self.BASE_URL, json={"prompt": "archived"})
+        for message in test_session.exec(select(ChatMessage)).all():
+            message.created_at = 0.0
+            test_session.add(message)
+        test_session.commit()
+        archive_old_messages(test_session, retention_days=1)
+        authenticated_client.post(self.BASE_URL, json={"prompt": "hot"})
+
+        response = authenticated_client.get(
+            f"{self.BASE_URL}/export", params={"gzip": "true"}
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/gzip"
+        lines = gzip.decompress(response.content).decode().splitlines()
+        contents = [json.loads(line)["content"] for line in lines]
+        assert contents[0] == "archived"
+        assert contents[2] == "hot"
+
+    def test_export_orders_imported_messages_by_time(
+        self, authenticated_client, test_session, mock_llm, monkeypatch
+    ):
+        """ID が新しく created_at が古いインポート行も、アーカイブを含めて古い順に出力されることをテスト"""
+        monkeypatch.setattr("app.services.chat.EXPORT_FETCH_SIZE", 2)
+        authenticated_client.post(self.BASE_URL, json={"prompt": "archived"})
+        for message in test_session.exec(select(ChatMessage)).all():
+            message.created_at = 10.0
+            test_session.add(message)
+        test_session.commit()
+        archive_old_messages(test_session, retention_days=1)
+
+        job = authenticated_client.post(f"{self.BASE_URL}/imports", json={}).json()
+        items = [
+            {"role": "user", "content": "imported old", "created_at": 1.0},
+            {"role": "user", "content": "imported later", "created_at": 20.0},
+        ]
+        authenticated_client.post(
+            f"{self.BASE_URL}/imports/{job['id']}",
+            content="".join(json.dumps(i) + "\n" for i in items).encode(),
+        )
+
+        response = authenticated_client.get(f"{self.BASE_URL}/export")
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert [line["content"] for line in lines] == [
+            "imported old",
+            "archived",
+            mock_llm.reply,
+            "imported later",
+        ]
+        assert [line["created_at"] for line in lines] == [1.0, 10.0, 10.0, 20.0]
+
+
+class TestConversations:
+    """会話スレッドのテスト"""
+
+    BASE_URL = TestConstants.CHAT_BASE
+
+    @pytest.mark.usefixtures("mock_llm")
+    def test_chat_continues_latest_conversation(self, authenticated_client):
+        """conversation_id 省略時は最新の会話スレッドが継続されることをテスト"""
+        first = authenticated_client.post(self.BASE_URL, json={"prompt": "hello"})
+        second = authenticated_client.post(self.BASE_URL, json={"prompt": "again"})
+        assert first.json()["conversation_id"] is not None
+        assert first.json()["conversation_id"] == second.json()["conversation_id"]
+
+        response = authenticated_client.get(f"{self.BASE_URL}/conversations")
+        assert response.status_code == 200
+        conversations = response.json()["conversations"]
+        assert len(conversations) == 1
+        assert conversations[0]["title"] == "hello"
+        assert conversations[0]["message_count"] == 4
+
+    def test_history_and_context_scoped_per_conversation(
+        self, authenticated_client, mock_llm
+    ):
+        """履歴とコンテキストが会話スレッド単位になることをテスト"""
+        authenticated_client.post(self.BASE_URL, json={"prompt": "in first thread"})
+        created = authenticated_client.post(
+            f"{self.BASE_URL}/conversations", json={"title": "second"}
+        )
+        assert created.status_code == 200
+        second_id = created.json()["id"]
+        assert created.json()["message_count"] == 0
+
+        authenticated_client.post(
+            self.BASE_URL,
+            json={"prompt": "in second thread", "conversation_id": second_id},
+        )
+        assert [m["content"] for m in mock_llm.last_messages] == ["in second thread"]
+
+        response = authenticated_client.get(
+            f"{self.BASE_URL}/history", params={"conversation_id": second_id}
+        )
+        contents = [m["content"] for m in response.json()["messages"]]
+        assert contents == ["in second thread", mock_llm.reply]
+        assert response.json()["total"] == 2
+
+        conversations = authenticated_client.get(
+            f"{self.BASE_URL}/conversations"
+        ).json()["conversations"]
+        assert conversations[0]["id"] == second_id
+        assert conversations[0]["title"] == "second"
+
+    def test_unknown_conversation(self, authenticated_client):
+        """存在しない会話スレッドで 404 が返ることをテスト"""
+        response = authenticated_client.get(
+            f"{self.BASE_URL}/history", params={"conversation_id": 9999}
+        )
+        assert response.status_code == 404
+
+        response = authenticated_client.post(
+            self.BASE_URL, json={"prompt": "hello", "conversation_id": 9999}
+        )
+        assert response.status_code == 404
+
+
+def _append_to_index(directory, worker: int) -> None:
+    """worker 番目の軸だけが 1 のベクトルを worker*1000 台のIDで追記する。"""
+    index = VectorIndex(directory, dim=4)
+    vector = np.zeros((1, 4), dtype=np.float32)
+    vector[0, worker] = 1.0
+    for i in range(50):
+        index.add(1, [worker * 1000 + i], vector)
+
+
+class TestChatRetrievalMode:
+    """関連履歴検索（retrieval モード）のテスト"""
+
+    BASE_URL = TestConstants.CHAT_BASE
+
+    def test_retrieval_includes_relevant_old_message(
+        self, authenticated_client, mock_llm, monkeypatch, tmp_path
+    ):
+        """直近の範囲外でも関連する過去メッセージがコンテキストに含まれることをテスト"""
+        index = VectorIndex(tmp_path)
+        monkeypatch.setattr("app.services.chat.CONTEXT_MODE", "retrieval")
+        monkeypatch.setattr("app.services.chat.RETRIEVAL_RECENT_LIMIT", 2)
+        monkeypatch.setattr("app.services.chat.get_vector_index", lambda: index)
+
+        authenticated_client.post(
+            self.BASE_URL, json={"prompt": "my cat is called Tama"}
+        )
+        for prompt in ["weather report", "train schedule", "lunch menu"]:
+            authenticated_client.post(self.BASE_URL, json={"prompt": prompt})
+
+        authenticated_client.post(
+            self.BASE_URL, json={"prompt": "what is my cat called?"}
+        )
+
+        contents = [m["content"] for m in mock_llm.last_messages]
+        assert "my cat is called Tama" in contents
+        assert "weather report" not in contents
+        assert contents[-1] == "what is my cat called?"
+
+    def test_retrieval_reads_through_to_archive(
+        self, authenticated_client, mock_llm, monkeypatch, tmp_path, test_session
+    ):
+        """アーカイブ済みの関連メッセージもコンテキストに含まれることをテスト"""
+        index = VectorIndex(tmp_path)
+        monkeypatch.setattr("app.services.chat.CONTEXT_MODE", "retrieval")
+        monkeypatch.setattr("app.services.chat.RETRIEVAL_RECENT_LIMIT", 2)
+        monkeypatch.setattr("app.services.chat.get_vector_index", lambda: index)
+
+        authenticated_client.post(
+            self.BASE_URL, json={"prompt": "my cat is called Tama"}
+        )
+        old = (datetime.now() - timedelta(days=400)).timestamp()
+        for message in test_session.exec(select(ChatMessage)).all():
+            message.created_at = old
+            test_session.add(message)
+        test_session.commit()
+        assert archive_old_messages(test_session, retention_days=365) == 2
+
+        authenticated_client.post(
+            self.BASE_URL, json={"prompt": "what is my cat called?"}
+        )
+        contents = [m["content"] for m in mock_llm.last_messages]
+        assert "my cat is called Tama" in contents
+
+    def test_retrieval_refills_within_conversation(
+        self, authenticated_client, mock_llm, monkeypatch, tmp_path
+    ):
+        """他の会話スレッドのほうが関連度が高くても、スレッド内から k 件集めることをテスト"""
+        index = VectorIndex(tmp_path)
+        monkeypatch.setattr("app.services.chat.CONTEXT_MODE", "retrieval")
+        monkeypatch.setattr("app.services.chat.RETRIEVAL_RECENT_LIMIT", 2)
+        monkeypatch.setattr("app.services.chat.RETRIEVAL_TOP_K", 1)
+        monkeypatch.setattr("app.services.chat.get_vector_index", lambda: index)
+
+        first = authenticated_client.post(
+            self.BASE_URL, json={"prompt": "my cat is called Tama"}
+        ).json()["conversation_id"]
+        for prompt in ["weather report", "train schedule"]:
+            authenticated_client.post(
+                self.BASE_URL, json={"prompt": prompt, "conversation_id": first}
+            )
+        second = authenticated_client.post(
+            f"{self.BASE_URL}/conversations", json={"title": "cats"}
+        ).json()["id"]
+        for _ in range(6):
+            authenticated_client.post(
+                self.BASE_URL,
+                json={"prompt": "what is my cat called?", "conversation_id": second},
+            )
+
+        authenticated_client.post(
+            self.BASE_URL,
+            json={"prompt": "what is my cat called?", "conversation_id": first},
+        )
+        contents = [m["content"] for m in mock_llm.last_messages]
+        assert contents[0] == "my cat is called Tama"
+        assert contents.count("what is my cat called?") == 1
+
+    @pytest.mark.usefixtures("mock_llm")
+    def test_slow_embedding_does_not_block_deadline(
+        self, authenticated_client, monkeypatch, tmp_path
+    ):
+        """埋め込みをスレッドで行い、応答の遅い埋め込みでも期限で 504 を返すことをテスト"""
+        index = VectorIndex(tmp_path)
+        monkeypatch.setattr("app.services.chat.CONTEXT_MODE", "retrieval")
+        monkeypatch.setattr("app.services.chat.get_vector_index", lambda: index)
+        authenticated_client.post(self.BASE_URL, json={"prompt": "hello"})
+
+        class SlowEmbedder:
+            def embed(self, texts):
+                time.sleep(1)
+                return np.ones((len(texts), index.dim), dtype=np.float32)
+
+        monkeypatch.setattr("app.services.chat.get_embedder", SlowEmbedder)
+        started = time.perf_counter()
+        response = authenticated_client.post(
+            self.BASE_URL,
+            json={"prompt": "again"},
+            headers={"X-Request-Timeout": "0.1"},
+        )
+        assert response.status_code == 504
+        assert time.perf_counter() - started < 1
+
+    def test_index_appends_keep_ids_paired_across_processes(self, tmp_path):
+        """別プロセスからの同時追記でもベクトルとIDの対応が崩れないことをテスト"""
+        index = VectorIndex(tmp_path, dim=4)
+        with ProcessPoolExecutor(max_workers=4) as pool:
+            list(pool.map(_append_to_index, [tmp_path] * 4, range(4)))
+
+        for worker in range(4):
+            query = np.zeros(4, dtype=np.float32)
+            query[worker] = 1.0
+            ids = index.search(1, query, k=50)
+            assert ids
+            assert all(i // 1000 == worker for i in ids)
+
+    @pytest.mark.usefixtures("mock_llm")
+    def test_clear_history_drops_index(
+        self, authenticated_client, authenticated_user, monkeypatch, tmp_path
+    ):
+        """履歴削除でベクトルインデックスも削除されることをテスト"""
+        index = VectorIndex(tmp_path)
+        monkeypatch.setattr("app.services.chat.CONTEXT_MODE", "retrieval")
+        monkeypatch.setattr("app.services.chat.get_vector_index", lambda: index)
+
+        authenticated_client.post(self.BASE_URL, json={"prompt": "hello"})
+        assert list(tmp_path.iterdir())
+
+        authenticated_client.delete(f"{self.BASE_URL}/history")
+        assert index.search(authenticated_user.id, [1.0] * index.dim, k=5) == []
+        # ロックファイル以外（ベクトル・ID）は残らない
+        assert not list(tmp_path.glob("*.vec"))
+        assert not list(tmp_path.glob("*.ids"))
+
+
+class TestChatSearch:
+    """履歴の全文検索のテスト"""
+
+    BASE_URL = TestConstants.CHAT_BASE
+
+    def _post_prompts(self, client, prompts):
+        for prompt in prompts:
+            client.post(self.BASE_URL, json={"prompt": prompt})
+
+    @pytest.mark.usefixtures("mock_llm")
+    def test_search_returns_ranked_hits_with_snippets(self, authenticated_client):
+        """関連度順のヒットとスニペットが返ることをテスト"""
+        self._post_prompts(
+            authenticated_client,
+            ["python tips", "python python decorators", "rust ownership"],
+        )
+
+        response = authenticated_client.get(
+            f"{self.BASE_URL}/search", params={"q": "python"}
+        )
+        assert response.status_code == 200
+        hits = response.json()["hits"]
+        assert [h["snippet"] for h in hits] == [
+            "<mark>python</mark> <mark>python</mark> decorators",
+            "<mark>python</mark> tips",
+        ]
+        assert response.json()["next_cursor"] is None
+
+    @pytest.mark.usefixtures("mock_llm")
+    def test_search_keyset_pagination(self, authenticated_client):
+        """next_cursor で続きのページを取得できることをテスト"""
+        self._post_prompts(authenticated_client, [f"note {i}" for i in range(5)])
+
+        seen = []
+        cursor = None
+        while True:
+            params = {"q": "note", "limit": 2}
+            if cursor:
+                params["cursor"] = cursor
+            body = authenticated_client.get(
+                f"{self.BASE_URL}/search", params=params
+            ).json()
+            seen.extend(h["id"] for h in body["hits"])
+            cursor = body["next_cursor"]
+            if cursor is None:
+                break
+
+        assert len(seen) == 5
+        assert len(set(seen)) == 5
+
+    @pytest.mark.usefixtures("mock_llm")
+    def test_search_is_scoped_and_cleared(self, authenticated_client):
+        """履歴削除後は検索にヒットしないことをテスト"""
+        self._post_prompts(authenticated_client, ["secret plan"])
+        authenticated_client.delete(f"{self.BASE_URL}/history")
+
+        response = authenticated_client.get(
+            f"{self.BASE_URL}/search", params={"q": "secret"}
+        )
+        assert response.json()["hits"] == []
+
+    def test_search_invalid_cursor(self, authenticated_client):
+        """不正なカーソルで 400 が返ることをテスト"""
+        response = authenticated_client.get(
+            f"{self.BASE_URL}/search", params={"q": "x", "cursor": "not-a-cursor"}
+        )
+        assert response.status_code == 400
+
+
+class TestChatImport:
+    """NDJSON 一括インポートのテスト"""
+
+    BASE_URL = TestConstants.CHAT_BASE
+
+    @staticmethod
+    def _ndjson(items: list[dict]) -> bytes:
+        return "".join(json.dumps(i) + "\n" for i in items).encode()
+
+    def test_import_unauthenticated(self, test_client):
+        """認証されていない場合のテスト"""
+        response = test_client.post(f"{self.BASE_URL}/imports", json={})
+        assert response.status_code == 401
+
+    def test_import_in_batches(self, authenticated_client, monkeypatch):
+        """バッチサイズを超える行が全件保存され、件数・検索に反映されることをテスト"""
+        monkeypatch.setattr("app.services.chat_import.IMPORT_BATCH_SIZE", 2)
+        job = authenticated_client.post(f"{self.BASE_URL}/imports", json={}).json()
+        assert job["status"] == "pending"
+
+        items = [
+            {"role": "user" if i % 2 == 0 else "assistant", "content": f"imported {i}"}
+            for i in range(5)
+        ]
+        response = authenticated_client.post(
+            f"{self.BASE_URL}/imports/{job['id']}", content=self._ndjson(items)
+        )
+        assert response.status_code == 200
+        body = response.json()
+        assert body["status"] == "completed"
+        assert body["lines_committed"] == 5
+        assert body["messages_imported"] == 5
+
+        history = authenticated_client.get(
+            f"{self.BASE_URL}/history",
+            params={"conversation_id": job["conversation_id"]},
+        ).json()
+        assert history["total"] == 5
+        assert [m["content"] for m in history["messages"]] == [
+            i["content"] for i in items
+        ]
+        hits = authenticated_client.get(
+            f"{self.BASE_URL}/search", params={"q": "imported"}
+        ).json()["hits"]
+        assert len(hits) == 5
+
+    def test_import_resume_after_invalid_line(self, authenticated_client):
+        """不正な行で失敗した後、同じ本文を修正して送り直すと続きから再開することをテスト"""
+        job = authenticated_client.post(f"{self.BASE_URL}/imports", json={}).json()
+        url = f"{self.BASE_URL}/imports/{job['id']}"
+        first = {"role": "user", "content": "one", "created_at": 1.0}
+        second = {"role": "assistant", "content": "two", "created_at": 2.0}
+
+        response = authenticated_client.post(
+            url, content=self._ndjson([first]) + b"{broken\n"
+        )
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Invalid line 2"
+
+        progress = authenticated_client.get(url).json()
+        assert progress["status"] == "failed"
+        assert progress["lines_committed"] == 1
+
+        response = authenticated_client.post(url, content=self._ndjson([first, second]))
+        assert response.json()["messages_imported"] == 2
+
+        history = authenticated_client.get(f"{self.BASE_URL}/history").json()
+        assert [m["content"] for m in history["messages"]] == ["one", "two"]
+
+        # 完了済みのジョブには追記できない
+        assert authenticated_client.post(url, content=b"").status_code == 409
+
+    @pytest.mark.usefixtures("mock_llm")
+    def test_history_pages_reach_imported_messages(self, authenticated_client):
+        """ID が新しく created_at が古いインポート行もページングで遡れることをテスト"""
+        for i in range(2):
+            authenticated_client.post(self.BASE_URL, json={"prompt": f"live{i}"})
+        job = authenticated_client.post(f"{self.BASE_URL}/imports", json={}).json()
+        items = [
+            {"role": "user", "content": f"imported{i}", "created_at": float(i + 1)}
+            for i in range(4)
+        ]
+        authenticated_client.post(
+            f"{self.BASE_URL}/imports/{job['id']}", content=self._ndjson(items)
+        )
+
+        contents: list[str] = []
+        params = {"limit": 2}
+        while True:
+            page = authenticated_client.get(
+                f"{self.BASE_URL}/history", params=params
+            ).json()
+            contents = [m["content"] for m in page["messages"]] + contents
+            if page["next_cursor"] is None:
+                break
+            params = {"limit": 2, "before": page["next_cursor"]}
+        assert contents[:4] == [i["content"] for i in items]
+        assert len(contents) == 8
+
+    def test_concurrent_upload_is_rejected(self, authenticated_client, test_session):
+        """処理中のジョブへの2つ目のアップロードが 409 になり、重複しないことをテスト"""
+        job = authenticated_client.post(f"{self.BASE_URL}/imports", json={}).json()
+        url = f"{self.BASE_URL}/imports/{job['id']}"
+        items = [{"role": "user", "content": "once"}]
+
+        # 別のリクエストが受信中の状態を再現する
+        running = test_session.get(ChatImportJob, job["id"])
+        running.status = "running"
+        running.updated_at = time.time()
+        test_session.add(running)
+        test_session.commit()
+
+        response = authenticated_client.post(url, content=self._ndjson(items))
+        assert response.status_code == 409
+        assert response.json()["detail"] == "Import is running in another request"
+
+        # 更新が途絶えた running ジョブは引き継いで再開できる
+        running.updated_at = time.time() - 3600
+        test_session.add(running)
+        test_session.commit()
+        response = authenticated_client.post(url, content=self._ndjson(items))
+        assert response.json()["messages_imported"] == 1
+
+        history = authenticated_client.get(f"{self.BASE_URL}/history").json()
+        assert [m["content"] for m in history["messages"]] == ["once"]
+
+    def test_import_is_not_cut_by_deadline(self, authenticated_client, monkeypatch):
+        """インポートのアップロードにはリクエストの期限を適用しないことをテスト"""
+        bulk_add_messages = chat_import_service.bulk_add_messages
+
+        def slow_bulk_add_messages(*args):
+            time.sleep(0.3)
+            return bulk_add_messages(*args)
+
+        monkeypatch.setattr(
+            chat_import_service, "bulk_add_messages", slow_bulk_add_messages
+        )
+        job = authenticated_client.post(f"{self.BASE_URL}/imports", json={}).json()
+        response = authenticated_client.post(
+            f"{self.BASE_URL}/imports/{job['id']}",
+            content=self._ndjson([{"role": "user", "content": "slow"}]),
+            headers={"X-Request-Timeout": "0.1"},
+        )
+        assert response.status_code == 200
+        assert response.json()["status"] == "completed"
+
+    @staticmethod
+    def _file_job(tmp_path):
+        # 中断時のロールバックがテスト用の外側のトランザクションを巻き戻さないよう、
+        # ファイルの DB を使う
+        engine = create_engine(
+            f"sqlite:///{tmp_path / 'import.db'}",
+            connect_args={"check_same_thread": False},
+        )
+        SQLModel.metadata.create_all(engine)
+        session = Session(engine, expire_on_commit=False)
+        user = User(email="import@example.com", name="Import")
+        session.add(user)
+        session.commit()
+        return session, chat_import_service.start_import(session, user)
+
+    @staticmethod
+    async def _upload(session, job, body: bytes):
+        async def chunks():
+            yield body
+
+        return await chat_import_service.import_history(session, job, chunks())
+
+    def test_import_resume_after_deadline(self, tmp_path, monkeypatch):
+        """期限切れで中断したジョブは failed になり、送り直すと続きから再開することをテスト"""
+        monkeypatch.setattr(chat_import_service, "IMPORT_BATCH_SIZE", 1)
+        bulk_add_messages = chat_import_service.bulk_add_messages
+        calls = []
+
+        def expiring_bulk_add_messages(*args):
+            calls.append(args)
+            if len(calls) == 2:
+                raise DeadlineExceeded()
+            return bulk_add_messages(*args)
+
+        monkeypatch.setattr(
+            chat_import_service, "bulk_add_messages", expiring_bulk_add_messages
+        )
+        session, job = self._file_job(tmp_path)
+        body = self._ndjson(
+            [{"role": "user", "content": c} for c in ("one", "two", "three")]
+        )
+
+        with pytest.raises(DeadlineExceeded):
+            asyncio.run(self._upload(session, job, body))
+        assert job.status == "failed"
+        assert job.lines_committed == 1
+
+        job = asyncio.run(self._upload(session, job, body))
+        assert job.status == "completed"
+        assert job.messages_imported == 3
+
+    def test_import_resume_after_cancel(self, tmp_path, monkeypatch):
+        """キャンセルで中断したジョブは claim を残さず、送り直すと再開できることをテスト"""
+        monkeypatch.setattr(chat_import_service, "IMPORT_BATCH_SIZE", 1)
+        session, job = self._file_job(tmp_path)
+        items = [{"role": "user", "content": c} for c in ("one", "two")]
+
+        async def stalled_chunks():
+            yield self._ndjson(items[:1])
+            await asyncio.sleep(10)
+
+        async def cancel_after_first_batch():
+            task = asyncio.create_task(
+                chat_import_service.import_history(session, job, stalled_chunks())
+            )
+            while job.lines_committed < 1:
+                await asyncio.sleep(0.01)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(asyncio.wait_for(cancel_after_first_batch(), 5))
+        assert job.status == "failed"
+        assert job.lines_committed == 1
+
+        job = asyncio.run(self._upload(session, job, self._ndjson(items)))
+        assert job.status == "completed"
+        assert job.messages_imported == 2
+
+    def test_import_unknown_job(self, authenticated_client):
+        """存在しないジョブで 404 が返ることをテスト"""
+        response = authenticated_client.get(f"{self.BASE_URL}/imports/999999")
+        assert response.status_code == 404
+
+
+class TestChatWriteBehind:
+    """write-behind（グループコミット）モードのテスト"""
+
+    BASE_URL = TestConstants.CHAT_BASE
+
+    @pytest.fixture
+    def write_buffer(self, authenticated_client, monkeypatch):
+        monkeypatch.setattr("app.services.chat_write_buffer.WRITE_BEHIND_ENABLED", True)
+        authenticated_client.portal.call(start_chat_write_buffer)
+        yield get_chat_write_buffer()
+        authenticated_client.portal.call(stop_chat_write_buffer)
+
+    def test_chat_saves_through_buffer(
+        self, authenticated_client, write_buffer, mock_llm
+    ):
+        """バッファ経由でも応答前に保存され、集計列・検索に反映されることをテスト"""
+        response = authenticated_client.post(self.BASE_URL, json={"prompt": "hello"})
+        assert response.status_code == 200
+        assert write_buffer.flush_count == 1
+
+        history = authenticated_client.get(f"{self.BASE_URL}/history").json()
+        assert history["total"] == 2
+        assert [m["content"] for m in history["messages"]] == [
+            "hello",
+            mock_llm.reply,
+        ]
+        conversation = authenticated_client.get(
+            f"{self.BASE_URL}/conversations"
+        ).json()["conversations"][0]
+        assert conversation["title"] == "hello"
+        assert conversation["message_count"] == 2
+        hits = authenticated_client.get(
+            f"{self.BASE_URL}/search", params={"q": "hello"}
+        ).json()["hits"]
+        assert len(hits) == 1
+
+    @staticmethod
+    def _file_engine(tmp_path):
+        engine = create_engine(
+            f"sqlite:///{tmp_path / 'chat.db'}",
+            connect_args={"check_same_thread": False, "timeout": 30},
+        )
+        SQLModel.metadata.create_all(engine)
+        with Session(engine, expire_on_commit=False) as session:
+            user = User(email="bench@example.com", name="Bench")
+            session.add(user)
+            session.commit()
+            conversation = create_conversation(session, user)
+        return engine, user, conversation
+
+    @staticmethod
+    def _rows(user, conversation, i: int, broken: bool = False) -> list[dict]:
+        return [
+            {
+                "user_id": user.id,
+                "conversation_id": conversation.id,
+                "role": role,
+                "content": None if broken else f"{role}{i}",
+                "created_at": time.time(),
+            }
+            for role in ("user", "assistant")
+        ]
+
+    def test_group_commit_reduces_commits(self, tmp_path):
+        """同時リクエストの保存が少ないコミットにまとまることをテスト"""
+        engine, user, conversation = self._file_engine(tmp_path)
+        commits = []
+        event.listen(engine, "commit", lambda _conn: commits.append(1))
+        requests = 100
+
+        async def run_buffered(buffer: ChatWriteBuffer) -> None:
+            buffer.start()
+            await asyncio.gather(
+                *(
+                    buffer.submit(self._rows(user, conversation, i))
+                    for i in range(requests)
+                )
+            )
+            await buffer.stop()
+
+        buffer = ChatWriteBuffer(
+            max_delay=0.005, max_rows=50, session_factory=lambda: Session(engine)
+        )
+        asyncio.run(run_buffered(buffer))
+        assert len(commits) <= requests * 2 / 50 + 1
+
+        with Session(engine) as session:
+            total = session.exec(select(func.count()).select_from(ChatMessage)).one()
+            assert total == requests * 2
+            assert session.get(Conversation, conversation.id).message_count == total
+        engine.dispose()
+
+    def test_failed_batch_only_fails_offending_request(self, tmp_path):
+        """まとめた保存が失敗しても、原因となったリクエストだけが失敗することをテスト"""
+        engine, user, conversation = self._file_engine(tmp_path)
+
+        async def run_buffered(buffer: ChatWriteBuffer) -> list:
+            buffer.start()
+            results = await asyncio.gather(
+                buffer.submit(self._rows(user, conversation, 0)),
+                # content は NOT NULL のため、この行を含むバッチは失敗する
+                buffer.submit(self._rows(user, conversation, 1, broken=True)),
+                buffer.submit(self._rows(user, conversation, 2)),
+                return_exceptions=True,
+            )
+            await buffer.stop()
+            return results
+
+        buffer = ChatWriteBuffer(
+            max_delay=0.05, max_rows=50, session_factory=lambda: Session(engine)
+        )
+        first, failed, last = asyncio.run(run_buffered(buffer))
+        assert isinstance(failed, Exception)
+        assert len(first) == 2
+        assert len(last) == 2
+
+        with Session(engine) as session:
+            contents = session.exec(
+                select(ChatMessage.content).order_by(ChatMessage.id)
+            ).all()
+            assert contents == ["user0", "assistant0", "user2", "assistant2"]
+        engine.dispose()
+
+
+class TestChatCompression:
+    """大きな本文の透過圧縮のテスト"""
+
+    BASE_URL = TestConstants.CHAT_BASE
+
+    def test_large_content_is_compressed_transparently(
+        self, authenticated_client, test_session, mock_llm
+    ):
+        """閾値以上の本文は圧縮して保存され、履歴・エクスポート・検索では元の本文が返ることをテスト"""
+        mock_llm.reply = "compressible answer " * 1000
+        authenticated_client.post(self.BASE_URL, json={"prompt": "short"})
+
+        stored = dict(
+            test_session.execute(text("SELECT role, content FROM chat_messages")).all()
+        )
+        assert stored["user"] == b"\x00short"
+        assert stored["assistant"][:1] == b"\x01"
+        assert len(stored["assistant"]) < len(mock_llm.reply) // 10
+
+        history = authenticated_client.get(f"{self.BASE_URL}/history").json()
+        assert history["messages"][1]["content"] == mock_llm.reply
+        exported = authenticated_client.get(f"{self.BASE_URL}/export").text
+        assert json.loads(exported.splitlines()[1])["content"] == mock_llm.reply
+        hits = authenticated_client.get(
+            f"{self.BASE_URL}/search", params={"q": "compressible"}
+        ).json()["hits"]
+        assert len(hits) == 1
+
+    def test_archive_keeps_compressed_content(
+        self, authenticated_client, test_session, mock_llm
+    ):
+        """アーカイブへ移した圧縮済み本文も元の本文として読めることをテスト"""
+        mock_llm.reply = "archived answer " * 1000
+        authenticated_client.post(self.BASE_URL, json={"prompt": "old"})
+        for message in test_session.exec(select(ChatMessage)).all():
+            message.created_at = 0.0
+            test_session.add(message)
+        test_session.commit()
+        archive_old_messages(test_session, retention_days=1)
+
+        history = authenticated_client.get(f"{self.BASE_URL}/history").json()
+        assert [m["content"] for m in history["messages"]] == ["old", mock_llm.reply]
+
+    def test_zstd_is_safe_across_threads(self):
+        """zstd の圧縮・展開を複数スレッドから同時に行えることをテスト"""
+        pytest.importorskip("zstandard")
+        texts = [f"message {i} " * 500 for i in range(200)]
+
+        def roundtrip(text: str) -> str:
+            return decompress_text(compress_text(text, codec="zstd"))
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            assert list(pool.map(roundtrip, texts)) == texts
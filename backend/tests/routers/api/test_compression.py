@@ -0,0 +1,131 @@
+"""Response compression middleware tests."""
+
+import asyncio
+import zlib
+
+import pytest
+from app.middleware.compression import CompressionMiddleware
+from starlette.applications import Starlette
+from starlette.responses import StreamingResponse
+from starlette.routing import Route
+
+from tests.fixtures.test_data import TestConstants
+
+
+def _streaming_app(media_type: str) -> Starlette:
+    async def chunks():
+        for i in range(3):
+            yield f"data: {i}\n\n".encode()
+
+    async def endpoint(_request):
+        return StreamingResponse(chunks(), media_type=media_type)
+
+    return Starlette(routes=[Route("/", endpoint)])
+
+
+async def _collect(app, accept_encoding: str = "gzip") -> list[dict]:
+    """ミドルウェアを直接呼び出し、送出された ASGI メッセージを返す。"""
+    messages: list[dict] = []
+
+    requested = asyncio.Event()
+
+    async def receive():
+        if requested.is_set():
+            # 切断されないクライアントとして、以降は待ち続ける
+            await asyncio.Event().wait()
+        requested.set()
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "raw_path": b"/",
+        "query_string": b"",
+        "headers": [(b"accept-encoding", accept_encoding.encode())],
+    }
+    await CompressionMiddleware(app, minimum_size=1)(scope, receive, send)
+    return messages
+
+
+class TestResponseCompression:
+    """レスポンス圧縮のテスト"""
+
+    BASE_URL = TestConstants.CHAT_BASE
+
+    @pytest.fixture
+    def history(self, authenticated_client, mock_llm):
+        mock_llm.reply = "a long assistant answer " * 100
+        authenticated_client.post(self.BASE_URL, json={"prompt": "hello"})
+
+    @pytest.mark.usefixtures("history")
+    def test_large_json_is_gzipped(self, authenticated_client):
+        """閾値以上の JSON が gzip で返ることをテスト"""
+        response = authenticated_client.get(
+            f"{self.BASE_URL}/history", headers={"Accept-Encoding": "gzip"}
+        )
+        assert response.status_code == 200
+        assert response.headers["content-encoding"] == "gzip"
+        vary = [v.strip() for v in response.headers["vary"].split(",")]
+        assert "Accept-Encoding" in vary
+        assert response.json()["total"] == 2
+
+    @pytest.mark.usefixtures("history")
+    def test_brotli_preferred(self, authenticated_client):
+        """br と gzip を受け付けるクライアントには br が優先されることをテスト"""
+        response = authenticated_client.get(
+            f"{self.BASE_URL}/history", headers={"Accept-Encoding": "gzip, br"}
+        )
+        assert response.headers["content-encoding"] == "br"
+        assert response.json()["total"] == 2
+
+    def test_small_and_unaccepted_responses_are_not_compressed(
+        self, authenticated_client
+    ):
+        """閾値未満や Accept-Encoding が無い場合は圧縮しないことをテスト"""
+        response = authenticated_client.get(
+            f"{TestConstants.USERS_BASE}/me", headers={"Accept-Encoding": "gzip"}
+        )
+        assert "content-encoding" not in response.headers
+
+        response = authenticated_client.get(
+            f"{self.BASE_URL}/history", headers={"Accept-Encoding": "identity"}
+        )
+        assert "content-encoding" not in response.headers
+
+    @pytest.mark.usefixtures("history")
+    def test_export_streams_compressed(self, authenticated_client):
+        """NDJSON のストリーミングは逐次圧縮され、gzip 指定時は二重に圧縮しないことをテスト"""
+        response = authenticated_client.get(
+            f"{self.BASE_URL}/export", headers={"Accept-Encoding": "gzip"}
+        )
+        assert response.headers["content-encoding"] == "gzip"
+        assert "content-length" not in response.headers
+        assert len(response.text.splitlines()) == 2
+
+        response = authenticated_client.get(
+            f"{self.BASE_URL}/export",
+            params={"gzip": "true"},
+            headers={"Accept-Encoding": "gzip"},
+        )
+        assert "content-encoding" not in response.headers
+        assert response.headers["content-type"] == "application/gzip"
+
+    def test_streaming_chunks_are_flushed_immediately(self):
+        """ストリーミングの各チャンクが受信時点で展開できることをテスト"""
+        messages = asyncio.run(_collect(_streaming_app("text/plain")))
+        bodies = [m for m in messages if m["type"] == "http.response.body"]
+        decompressor = zlib.decompressobj(wbits=31)
+        decoded = [decompressor.decompress(m["body"]) for m in bodies]
+        assert decoded[:3] == [f"data: {i}\n\n".encode() for i in range(3)]
+
+    def test_event_stream_is_never_compressed(self):
+        """SSE（text/event-stream）はそのまま送出されることをテスト"""
+        messages = asyncio.run(_collect(_streaming_app("text/event-stream")))
+        start = messages[0]
+        assert b"content-encoding" not in dict(start["headers"])
+        bodies = [m["body"] for m in messages if m["type"] == "http.response.body"]
+        assert bodies[:3] == [f"data: {i}\n\n".encode() for i in range(3)]
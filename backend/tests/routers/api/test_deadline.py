@@ -0,0 +1,303 @@
+"""Request deadline tests."""
+
+import asyncio
+import time
+
+import pytest
+from app.middleware.deadline import DeadlineMiddleware
+from app.middleware.load_shedding import LoadSheddingMiddleware
+from app.schema import ChatMessage
+from app.services import chat as chat_service
+from app.utils import deadline as deadline_module
+from app.utils import llm
+from app.utils.deadline import (
+    DeadlineExceeded,
+    check_deadline,
+    deadline_after,
+    instrument_deadline,
+    parse_timeout,
+    remaining,
+)
+from fastapi.middleware.cors import CORSMiddleware
+from main import app
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlmodel import create_engine, select
+
+from tests.fixtures.test_data import TestConstants
+
+# 中断されるまで終わらないクエリ
+ENDLESS_QUERY = text(
+    "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) "
+    "SELECT count(*) FROM n"
+)
+
+
+class TestDeadlineMiddleware:
+    """ミドルウェアのテスト"""
+
+    def test_slow_llm_returns_504(
+        self, authenticated_client, test_session, monkeypatch
+    ):
+        """期限までに LLM が応答しなければ、応答を待たずに 504 を返すことをテスト"""
+
+        def slow_llm(_messages):
+            time.sleep(1)
+            return "too late"
+
+        monkeypatch.setattr("app.services.chat.generate_response", slow_llm)
+        started = time.perf_counter()
+        response = authenticated_client.post(
+            TestConstants.CHAT_BASE,
+            json={"prompt": "hello"},
+            headers={"X-Request-Timeout": "0.1", "Origin": "http://localhost:3000"},
+        )
+        assert response.status_code == 504
+        assert response.json() == {"detail": "Deadline exceeded"}
+        assert "access-control-allow-origin" in response.headers
+        assert time.perf_counter() - started < 1
+        assert test_session.exec(select(ChatMessage)).all() == []
+
+    def test_request_within_deadline_succeeds(self, authenticated_client, mock_llm):
+        """期限内に終わるリクエストはそのまま応答することをテスト"""
+        response = authenticated_client.post(
+            TestConstants.CHAT_BASE,
+            json={"prompt": "hello"},
+            headers={"X-Request-Timeout": "5"},
+        )
+        assert response.status_code == 200
+        assert len(mock_llm.calls) == 1
+
+    @pytest.mark.usefixtures("mock_llm")
+    def test_streaming_response_is_not_cut(self, authenticated_client, monkeypatch):
+        """送信を始めた後の StreamingResponse（エクスポート）は期限で止めないことをテスト"""
+        monkeypatch.setattr("app.services.chat.EXPORT_FETCH_SIZE", 1)
+        authenticated_client.post(TestConstants.CHAT_BASE, json={"prompt": "hello"})
+        iter_all_messages = chat_service.iter_all_messages
+
+        def slow_iter_all_messages(*args):
+            batches = iter_all_messages(*args)
+            yield next(batches)
+            # 送信を始めた後、期限を過ぎてから続きを読み込む
+            # （期限が残っていれば DB のクエリと同じく中断される）
+            time.sleep(0.3)
+            check_deadline()
+            yield from batches
+
+        monkeypatch.setattr(
+            "app.services.chat.iter_all_messages", slow_iter_all_messages
+        )
+        response = authenticated_client.get(
+            f"{TestConstants.CHAT_BASE}/export",
+            headers={"X-Request-Timeout": "0.1"},
+        )
+        assert response.status_code == 200
+        assert len(response.text.splitlines()) == 2
+
+    def test_client_disconnect_cancels_processing(self):
+        """応答前にクライアントが切断すると処理をキャンセルすることをテスト"""
+        cancelled = asyncio.Event()
+
+        async def app(_scope, _receive, _send):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        async def receive():
+            return {"type": "http.disconnect"}
+
+        async def send(_message):
+            raise AssertionError("no response should be sent")
+
+        async def run():
+            scope = {"type": "http", "headers": []}
+            await asyncio.wait_for(DeadlineMiddleware(app)(scope, receive, send), 1)
+            return cancelled.is_set()
+
+        assert asyncio.run(run())
+
+    @pytest.mark.parametrize(
+        ("error", "expected"),
+        [
+            (OperationalError("SELECT 1", {}, Exception("interrupted")), 504),
+            (TimeoutError(), 504),
+            (ValueError("bug"), ValueError),
+            (
+                OperationalError("SELECT 1", {}, Exception("disk I/O error")),
+                OperationalError,
+            ),
+        ],
+    )
+    def test_only_deadline_errors_become_504(self, error, expected):
+        """期限後のエラーのうち、期限切れによる中断だけを 504 にすることをテスト"""
+        messages = []
+
+        async def app(_scope, _receive, _send):
+            # 期限を過ぎるまでイベントループを止め、キャンセルより先にエラーで終える
+            time.sleep(0.05)
+            raise error
+
+        async def receive():
+            await asyncio.sleep(10)
+
+        async def send(message):
+            messages.append(message)
+
+        async def run():
+            scope = {"type": "http", "headers": [(b"x-request-timeout", b"0.01")]}
+            await DeadlineMiddleware(app)(scope, receive, send)
+
+        if expected == 504:
+            asyncio.run(run())
+            assert messages[0]["status"] == 504
+        else:
+            with pytest.raises(expected):
+                asyncio.run(run())
+            assert messages == []
+
+    def test_deadline_excludes_queue_wait(self):
+        """期限は同時処理数の上限の内側で、空きを待った後から数えることをテスト"""
+        # user_middleware は外側から順に並ぶ
+        classes = [middleware.cls for middleware in app.user_middleware]
+        assert classes.index(LoadSheddingMiddleware) < classes.index(DeadlineMiddleware)
+        # 504・503 にも CORS のヘッダを付ける
+        assert classes.index(CORSMiddleware) < classes.index(LoadSheddingMiddleware)
+
+    def test_parse_timeout(self, monkeypatch):
+        """ヘッダの秒数を上限で丸め、不正な値は既定値にすることをテスト"""
+        monkeypatch.setattr(deadline_module, "REQUEST_TIMEOUT_SECONDS", 60.0)
+        monkeypatch.setattr(deadline_module, "REQUEST_TIMEOUT_MAX_SECONDS", 120.0)
+        assert parse_timeout("2.5") == 2.5
+        assert parse_timeout("600") == 120.0
+        for value in (None, "", "abc", "0", "-1", "nan", "inf"):
+            assert parse_timeout(value) == 60.0
+
+
+class TestDeadlinePropagation:
+    """DB・LLM への期限の伝播のテスト"""
+
+    def test_nested_deadline_keeps_earlier_one(self):
+        """内側の期限は外側より延びないことをテスト"""
+        assert remaining() is None
+        with deadline_after(1), deadline_after(60):
+            assert remaining() <= 1
+        assert remaining() is None
+
+    def test_sqlite_query_is_interrupted(self, tmp_path):
+        """期限を過ぎると実行中のクエリを中断し、以降のクエリは発行しないことをテスト"""
+        engine = create_engine(f"sqlite:///{tmp_path / 'deadline.db'}")
+        instrument_deadline(engine)
+        instrument_deadline(engine)
+        with engine.connect() as conn:
+            with (
+                deadline_after(0.05),
+                pytest.raises(OperationalError, match="interrupt"),
+            ):
+                conn.execute(ENDLESS_QUERY)
+            with deadline_after(0), pytest.raises(DeadlineExceeded):
+                conn.execute(text("SELECT 1"))
+            assert conn.execute(text("SELECT 1")).scalar() == 1
+
+    @staticmethod
+    def _fake_postgres(executed: list[str]):
+        class FakeCursor:
+            def execute(self, statement):
+                executed.append(statement)
+
+            def close(self):
+                pass
+
+        class NamedCursor:
+            """名前付きカーソル（文を実行するカーソル）。別の文は実行できない。"""
+
+            def execute(self, _statement):
+                raise AssertionError("can't call .execute() on named cursors")
+
+        class FakeConnection:
+            dialect = type("Dialect", (), {"name": "postgresql"})
+
+            def __init__(self):
+                self.info = {}
+                self.transaction = object()
+                # DBAPI の接続（通常のカーソルを作る）
+                self.connection = type("DBAPIConnection", (), {"cursor": FakeCursor})()
+
+            def get_transaction(self):
+                return self.transaction
+
+        conn = FakeConnection()
+
+        def execute():
+            deadline_module._before_cursor_execute(
+                conn, NamedCursor(), "SELECT 1", {}, None, False
+            )
+
+        return conn, execute
+
+    def test_postgres_statement_timeout_follows_time_left(self, monkeypatch):
+        """PostgreSQL の statement_timeout を残り時間に合わせて設定し直すことをテスト"""
+        clock = [100.0]
+        monkeypatch.setattr(deadline_module.time, "monotonic", lambda: clock[0])
+        executed: list[str] = []
+        conn, execute = self._fake_postgres(executed)
+
+        with deadline_after(5):
+            execute()
+            execute()
+            clock[0] += 1
+            execute()
+            conn.transaction = object()
+            execute()
+
+        assert executed == [
+            "SET LOCAL statement_timeout = 5000",
+            "SET LOCAL statement_timeout = 4000",
+            "SET LOCAL statement_timeout = 4000",
+        ]
+
+    def test_streamed_query_within_deadline(self, tmp_path):
+        """サーバーサイドカーソルで逐次取得するクエリも期限内に実行できることをテスト"""
+        # PostgreSQL: 文の名前付きカーソルではなく、別のカーソルで statement_timeout を設定する
+        executed: list[str] = []
+        _conn, execute = self._fake_postgres(executed)
+        with deadline_after(5):
+            execute()
+        assert len(executed) == 1
+
+        engine = create_engine(f"sqlite:///{tmp_path / 'deadline.db'}")
+        instrument_deadline(engine)
+        with engine.connect() as conn, deadline_after(5):
+            result = conn.execute(
+                text(
+                    "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 5) SELECT i FROM n"
+                ),
+                execution_options={"yield_per": 2},
+            )
+            assert [row.i for row in result] == [1, 2, 3, 4, 5]
+
+    def test_llm_timeout_is_time_left(self, monkeypatch):
+        """LLM の HTTP タイムアウトを期限までの残り時間にすることをテスト"""
+        options = []
+
+        class FakeClient:
+            def with_options(self, **kwargs):
+                options.append(kwargs)
+                return self
+
+        monkeypatch.setattr(llm, "get_client", FakeClient)
+        # FakeClient には API がないため、タイムアウトを設定した後の呼び出しで失敗する
+        with deadline_after(5), pytest.raises(AttributeError):
+            llm._generate([], "model")
+        with pytest.raises(AttributeError):
+            llm._generate([], "model")
+        assert 0 < options[0]["timeout"] <= 5
+        assert options[0]["max_retries"] == 0
+        assert options[1] == {"timeout": llm.LLM_TIMEOUT_SECONDS}
+
+    def test_llm_is_not_called_past_deadline(self, monkeypatch):
+        """期限を過ぎていれば LLM を呼ばずに DeadlineExceeded を送出することをテスト"""
+        monkeypatch.setattr(llm, "get_client", pytest.fail)
+        with deadline_after(0), pytest.raises(DeadlineExceeded):
+            llm.generate_response([{"role": "user", "content": "hello"}])
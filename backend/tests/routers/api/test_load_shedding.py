@@ -0,0 +1,124 @@
+"""Load shedding tests."""
+
+import asyncio
+
+import pytest
+from app.middleware import load_shedding
+from app.middleware.load_shedding import HIGH, LOW, NORMAL, LoadShedder
+
+from tests.fixtures.test_data import TestConstants
+
+
+@pytest.fixture
+def saturated(monkeypatch):
+    """全ての枠が使用中のワーカーを模擬する。"""
+    shedder = LoadShedder(max_in_flight=4)
+    shedder.in_flight = 4
+    monkeypatch.setattr(load_shedding, "shedder", shedder)
+    monkeypatch.setitem(load_shedding.QUEUE_TIMEOUTS, NORMAL, 0.01)
+    return shedder
+
+
+class TestLoadSheddingMiddleware:
+    """ミドルウェアのテスト"""
+
+    def test_excess_requests_are_shed(self, authenticated_client, saturated):
+        """枠がなければ 503 と Retry-After で断ることをテスト"""
+        response = authenticated_client.get(
+            f"{TestConstants.CHAT_BASE}/history",
+            headers={"Origin": "http://localhost:3000"},
+        )
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "2"
+        # ブラウザから状態と Retry-After を読めるよう CORS のヘッダを付ける
+        assert "access-control-allow-origin" in response.headers
+        assert saturated.in_flight == 4
+
+        metrics = authenticated_client.get("/metrics").text
+        assert 'http_requests_shed_total{priority="normal"}' in metrics
+        assert 'http_admission_requests{state="in_flight"} 4' in metrics
+
+    @pytest.mark.usefixtures("saturated")
+    def test_health_check_is_never_shed(self, test_client):
+        """ヘルスチェックは上限の対象外であることをテスト"""
+        response = test_client.get(f"{TestConstants.API_BASE}/health")
+        assert response.status_code == 200
+
+    def test_admitted_requests_release_their_slot(self, authenticated_client):
+        """処理が終わると枠を返すことをテスト"""
+        before = load_shedding.shedder.in_flight
+        response = authenticated_client.get(f"{TestConstants.CHAT_BASE}/history")
+        assert response.status_code == 200
+        assert load_shedding.shedder.in_flight == before
+
+    def test_priorities(self):
+        """パスから優先度を決めることをテスト"""
+
+        def priority(method, path):
+            return load_shedding.priority_of({"method": method, "path": path})
+
+        assert priority("GET", "/api/health") == "critical"
+        assert priority("POST", "/api/auth/signin") == HIGH
+        assert priority("GET", "/api/chat/history") == NORMAL
+        assert priority("POST", "/api/chat") == LOW
+        assert priority("GET", "/api/chat/export") == LOW
+
+
+class TestLoadShedder:
+    """優先度付きの上限のテスト"""
+
+    def test_low_priority_is_shed_first(self):
+        """low は上限の半分までしか使えず、待たずに断られることをテスト"""
+
+        async def run():
+            shedder = LoadShedder(max_in_flight=4)
+            assert await shedder.acquire(LOW, 0)
+            assert await shedder.acquire(LOW, 0)
+            assert not await shedder.acquire(LOW, 0)
+            assert await shedder.acquire(HIGH, 0)
+            return shedder.in_flight
+
+        assert asyncio.run(run()) == 3
+
+    def test_released_slot_goes_to_highest_priority(self):
+        """空いた枠は優先度の高い待ちへ、優先度ごとの上限の範囲で渡されることをテスト"""
+
+        async def run():
+            shedder = LoadShedder(max_in_flight=10)
+            for _ in range(10):
+                assert await shedder.acquire(HIGH, 0)
+            normal = asyncio.create_task(shedder.acquire(NORMAL, 1))
+            high = asyncio.create_task(shedder.acquire(HIGH, 1))
+            await asyncio.sleep(0)
+
+            shedder.release()
+            assert await high
+            # normal は上限の 80%（8件）を下回るまで待つ
+            shedder.release()
+            shedder.release()
+            await asyncio.sleep(0)
+            assert not normal.done()
+            shedder.release()
+            assert await normal
+            return shedder.in_flight
+
+        assert asyncio.run(run()) == 8
+
+    def test_queue_timeout_and_cancellation_do_not_leak_slots(self):
+        """待ちの時間切れ・キャンセルで枠や待ち行列が残らないことをテスト"""
+
+        async def run():
+            shedder = LoadShedder(max_in_flight=1)
+            assert await shedder.acquire(HIGH, 0)
+            assert not await shedder.acquire(HIGH, 0.01)
+
+            waiting = asyncio.create_task(shedder.acquire(HIGH, 1))
+            await asyncio.sleep(0)
+            waiting.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiting
+
+            shedder.release()
+            return shedder.in_flight, shedder.queued
+
+        assert asyncio.run(run()) == (0, 0)
@@ -0,0 +1,118 @@
+"""Metrics endpoint tests."""
+
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from app.middleware.metrics import route_label
+from app.utils import metrics
+from app.utils.metrics import Counter, Gauge, Histogram, MetricsRegistry
+from starlette.routing import Route
+
+from tests.fixtures.test_data import TestConstants
+
+
+def _sample(body: str, prefix: str) -> float:
+    for line in body.splitlines():
+        if line.startswith(prefix + " "):
+            return float(line.rsplit(" ", 1)[1])
+    raise AssertionError(f"{prefix} not found")
+
+
+class TestMetricsEndpoint:
+    """/metrics のテスト"""
+
+    def test_records_requests_per_route(self, authenticated_client):
+        """ルート単位のリクエスト数・レイテンシ・処理中件数が出力されることをテスト"""
+        history = f"{TestConstants.CHAT_BASE}/history"
+        labels = 'method="GET",route="/api/chat/history"'
+        before = authenticated_client.get("/metrics").text
+        count = f'http_requests_total{{{labels},status="200"}}'
+        try:
+            initial = _sample(before, count)
+        except AssertionError:
+            initial = 0
+
+        for _ in range(3):
+            authenticated_client.get(history)
+        authenticated_client.get("/api/no-such-route")
+
+        response = authenticated_client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        body = response.text
+        assert _sample(body, count) == initial + 3
+        assert _sample(
+            body, f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}}'
+        )
+        # /metrics 自身は処理中として数えられる
+        in_flight = 'http_requests_in_flight{method="GET",route="/metrics"}'
+        assert _sample(body, in_flight) == 1
+        assert f"http_requests_in_flight{{{labels}}}" not in body
+        assert 'route="<unmatched>",status="404"' in body
+        assert "# TYPE auth_duration_seconds histogram" in body
+        assert 'auth_duration_seconds_count{step="decode_token"}' in body
+
+    def test_path_parameters_are_masked(self, authenticated_client):
+        """パスパラメータを含むルートはパス定義でまとめられることをテスト"""
+        authenticated_client.get(f"{TestConstants.CHAT_BASE}/imports/424242")
+        body = authenticated_client.get("/metrics").text
+        assert 'route="/api/chat/imports/{job_id}",status="404"' in body
+        assert "424242" not in body
+
+    def test_route_label_uses_route_template(self):
+        """パラメータの値と同じ固定のセグメントや path 変換があってもパス定義を返すことをテスト"""
+
+        def label(url, template, **params):
+            route = Route(template, endpoint=lambda _request: None)
+            scope = {"path": url, "path_params": params, "route": route}
+            return route_label(scope)
+
+        assert (
+            label("/users/me/me", "/users/{name}/me", name="me") == "/users/{name}/me"
+        )
+        assert label("/files/a/b.txt", "/files/{path:path}", path="a/b.txt") == (
+            "/files/{path}"
+        )
+        assert route_label({"path": "/nope"}) == "<unmatched>"
+
+
+class TestMetricsRegistry:
+    """集計（スレッドごとのシャード・複数ワーカーの合算）のテスト"""
+
+    def test_thread_shards_are_summed(self):
+        """複数スレッドからの加算がロックなしでも失われないことをテスト"""
+        registry = MetricsRegistry()
+        counter = Counter(registry, "jobs_total", "Jobs", ("kind",))
+        histogram = Histogram(registry, "job_seconds", "Job time", buckets=(0.1, 1))
+
+        def work(_):
+            for _ in range(1000):
+                counter.inc("a")
+                histogram.observe(0.5)
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(work, range(8)))
+
+        body = registry.render()
+        assert 'jobs_total{kind="a"} 8000' in body
+        assert 'job_seconds_bucket{le="0.1"} 0' in body
+        assert 'job_seconds_bucket{le="1"} 8000' in body
+        assert "job_seconds_count 8000" in body
+
+    def test_merges_worker_files(self, tmp_path, monkeypatch):
+        """他ワーカーの値を合算し、終了したワーカーの gauge は除外することをテスト"""
+        monkeypatch.setattr(metrics, "METRICS_MULTIPROC_DIR", str(tmp_path))
+        registry = MetricsRegistry()
+        counter = Counter(registry, "requests_total", "Requests")
+        gauge = Gauge(registry, "in_flight", "In flight")
+        counter.inc(amount=2)
+        gauge.inc()
+        registry.flush()
+
+        # 存在しない PID（終了したワーカー）のファイル
+        dead = {"requests_total": [[[], 5.0]], "in_flight": [[[], 4.0]]}
+        (tmp_path / "999999999.json").write_text(json.dumps(dead))
+
+        body = registry.render()
+        assert "requests_total 7" in body
+        assert "in_flight 1" in body
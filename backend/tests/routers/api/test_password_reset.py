@@ -0,0 +1,231 @@
+"""Password reset token tests."""
+
+import asyncio
+import hashlib
+import re
+import secrets
+from datetime import datetime, timedelta
+from email import message_from_bytes, policy
+
+import pytest
+from app.repositories.password_reset import create_token
+from app.schema import PasswordResetToken
+from app.services import mail_outbox, password_reset
+from app.services.mail_outbox import MailOutbox
+from app.utils.mailer import FileMailer, build_message
+from sqlalchemy import event
+from sqlmodel import select
+
+from tests.fixtures.test_data import TestConstants
+
+RESET_URL = f"{TestConstants.AUTH_BASE}/reset-password"
+FORGOT_URL = f"{TestConstants.AUTH_BASE}/forgot-password"
+
+
+def _issue(session, user, expires_in: timedelta, *, known: bool = True) -> str:
+    """トークンを発行する（known=False なら他のワーカーでの発行として集合へ入れない）。"""
+    token = secrets.token_urlsafe(32)
+    token_hash = hashlib.sha256(token.encode()).hexdigest()
+    entry = create_token(session, user.id, token_hash, datetime.now() + expires_in)
+    if known:
+        password_reset._live_hashes[token_hash] = entry.expires_at
+    return token
+
+
+@pytest.fixture(autouse=True)
+def live_hashes(monkeypatch):
+    hashes: dict[str, float] = {}
+    monkeypatch.setattr(password_reset, "_live_hashes", hashes)
+    monkeypatch.setattr(password_reset, "_last_sync", None)
+    return hashes
+
+
+def _reset_statements(test_engine, test_client, data) -> tuple[int, list[str]]:
+    """リセットを送信し、ステータスと password_reset_tokens への SQL を返す。"""
+    statements: list[str] = []
+
+    def record(_conn, _cursor, statement, *_args):
+        statements.append(statement)
+
+    event.listen(test_engine, "before_cursor_execute", record)
+    try:
+        response = test_client.post(RESET_URL, json=data)
+    finally:
+        event.remove(test_engine, "before_cursor_execute", record)
+    return response.status_code, [s for s in statements if "password_reset_tokens" in s]
+
+
+class TestResetTokenLookup:
+    """リセット用トークンの検索のテスト"""
+
+    def test_reset_with_valid_token(self, test_client, test_session, test_user):
+        """有効なトークンでパスワードを変更でき、再利用はできないことをテスト"""
+        token = _issue(test_session, test_user, timedelta(hours=1))
+        data = {"token": token, "new_password": "new_password_456"}
+
+        assert test_client.post(RESET_URL, json=data).status_code == 200
+        response = test_client.post(RESET_URL, json=data)
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Invalid token"
+
+    def test_expired_token_is_rejected(self, test_client, test_session, test_user):
+        """期限切れのトークンは拒否されることをテスト"""
+        token = _issue(test_session, test_user, timedelta(hours=-1))
+        data = {"token": token, "new_password": "new_password_456"}
+        assert test_client.post(RESET_URL, json=data).status_code == 400
+
+    def test_unknown_tokens_skip_database(self, test_client, test_engine):
+        """推測されたトークンは毎回異なっていても DB を引かずに拒否することをテスト"""
+        for i in range(3):
+            data = {"token": f"guessed-token-{i}", "new_password": "new_password_456"}
+            status_code, statements = _reset_statements(test_engine, test_client, data)
+            assert status_code == 400
+            assert statements == []
+
+    def test_used_token_is_forgotten(
+        self, test_client, test_engine, test_session, test_user, live_hashes
+    ):
+        """使用済みのトークンは集合から除き、再送では DB を引かないことをテスト"""
+        token = _issue(test_session, test_user, timedelta(hours=1))
+        data = {"token": token, "new_password": "new_password_456"}
+        assert test_client.post(RESET_URL, json=data).status_code == 200
+
+        assert live_hashes == {}
+        assert _reset_statements(test_engine, test_client, data) == (400, [])
+
+    def test_tokens_from_other_workers_are_synced(
+        self, test_client, test_session, test_user, live_hashes
+    ):
+        """他のワーカーで発行されたトークンは読み込み後に使えることをテスト"""
+        token = _issue(test_session, test_user, timedelta(days=1), known=False)
+        data = {"token": token, "new_password": "new_password_456"}
+        assert test_client.post(RESET_URL, json=data).status_code == 400
+
+        test_client.portal.call(password_reset.sync_live_hashes)
+        assert len(live_hashes) == 1
+        assert test_client.post(RESET_URL, json=data).status_code == 200
+
+    def test_sync_disabled_checks_database(
+        self, test_client, test_session, test_user, monkeypatch
+    ):
+        """読み込みを止めた設定では、他のワーカーのトークンを DB で確認することをテスト"""
+        monkeypatch.setattr(password_reset, "SYNC_SECONDS", 0.0)
+        token = _issue(test_session, test_user, timedelta(days=1), known=False)
+        data = {"token": token, "new_password": "new_password_456"}
+        assert test_client.post(RESET_URL, json=data).status_code == 200
+
+
+class TestExpiredTokenSweeper:
+    """期限切れトークンの削除のテスト"""
+
+    @pytest.mark.usefixtures("test_client")
+    def test_sweeps_only_expired_tokens_in_batches(
+        self, monkeypatch, test_session, test_user
+    ):
+        """期限切れのトークンだけを一定件数ずつ削除することをテスト"""
+        monkeypatch.setattr(password_reset, "SWEEP_BATCH_SIZE", 2)
+        for _ in range(5):
+            _issue(test_session, test_user, timedelta(hours=-1))
+        live = _issue(test_session, test_user, timedelta(hours=1))
+
+        assert len(password_reset._live_hashes) == 6
+        assert password_reset.sweep_expired_tokens() == 5
+        assert list(password_reset._live_hashes) == [
+            hashlib.sha256(live.encode()).hexdigest()
+        ]
+
+        remaining = test_session.exec(select(PasswordResetToken)).all()
+        assert [t.token_hash for t in remaining] == [
+            hashlib.sha256(live.encode()).hexdigest()
+        ]
+
+
+class TestForgotPassword:
+    """リセット用メールの送信のテスト"""
+
+    @pytest.fixture
+    def delivered(self, test_client, tmp_path, monkeypatch):
+        """送信キューの処理を待ち、書き出されたメールを返す関数。"""
+        outbox = mail_outbox.get_mail_outbox()
+        monkeypatch.setattr(outbox, "mailer", FileMailer(tmp_path))
+
+        def wait():
+            test_client.portal.call(outbox.join)
+            return [
+                message_from_bytes(path.read_bytes(), policy=policy.default)
+                for path in tmp_path.glob("*.eml")
+            ]
+
+        return wait
+
+    def test_reset_link_is_mailed(self, test_client, test_user, delivered):
+        """送信されたリンクのトークンでパスワードを変更できることをテスト"""
+        response = test_client.post(FORGOT_URL, json={"email": test_user.email})
+        assert response.status_code == 200
+
+        [mail] = delivered()
+        assert mail["To"] == test_user.email
+        token = re.search(r"token=(\S+)", mail.get_content()).group(1)
+
+        data = {"token": token, "new_password": "new_password_456"}
+        assert test_client.post(RESET_URL, json=data).status_code == 200
+
+    def test_unknown_email_sends_nothing(self, test_client, delivered):
+        """登録されていないメールアドレスには送信しないことをテスト"""
+        response = test_client.post(FORGOT_URL, json={"email": "nobody@example.com"})
+        assert response.status_code == 200
+        assert delivered() == []
+
+
+class FlakyMailer:
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.attempts = 0
+        self.sent: list = []
+
+    def send(self, message) -> None:
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            raise ConnectionError("SMTP unavailable")
+        self.sent.append(message)
+
+
+def _deliver(outbox: MailOutbox, count: int = 1) -> list[bool]:
+    async def run() -> list[bool]:
+        outbox.start()
+        message = build_message("user@example.com", "Subject", "Body")
+        accepted = [outbox.submit(lambda: message) for _ in range(count)]
+        await outbox.join()
+        await outbox.stop()
+        return accepted
+
+    return asyncio.run(run())
+
+
+class TestMailOutbox:
+    """送信キューのテスト"""
+
+    def test_retries_until_sent(self):
+        """失敗した送信を間隔を空けて送り直すことをテスト"""
+        mailer = FlakyMailer(failures=2)
+        outbox = MailOutbox(mailer, retry_base=0.001)
+        _deliver(outbox)
+
+        assert mailer.attempts == 3
+        assert len(mailer.sent) == 1
+        assert (outbox.sent, outbox.failed) == (1, 0)
+
+    def test_gives_up_after_max_attempts(self):
+        """最大回数まで失敗したメールは諦めることをテスト"""
+        mailer = FlakyMailer(failures=10)
+        outbox = MailOutbox(mailer, max_attempts=3, retry_base=0.001)
+        _deliver(outbox)
+
+        assert mailer.attempts == 3
+        assert (outbox.sent, outbox.failed) == (0, 1)
+
+    def test_full_queue_drops_messages(self):
+        """キューが満杯なら予約を捨てて False を返すことをテスト"""
+        outbox = MailOutbox(FlakyMailer(failures=0), max_size=1)
+        assert _deliver(outbox, count=2) == [True, False]
+        assert outbox.dropped == 1
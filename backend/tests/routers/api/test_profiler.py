@@ -0,0 +1,93 @@
+"""Sampling profiler tests."""
+
+import threading
+import time
+
+import pytest
+from app.services import auth
+from app.utils.profiler import Sampler
+
+from tests.fixtures.test_data import TestConstants
+
+ADMIN_TOKEN = "test-admin-token"
+ADMIN_BASE = f"{TestConstants.API_BASE}/admin"
+
+
+@pytest.fixture
+def admin_token(monkeypatch):
+    monkeypatch.setattr(auth, "ADMIN_TOKEN", ADMIN_TOKEN)
+    return ADMIN_TOKEN
+
+
+def _busy_handler(seconds: float) -> None:
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        sum(range(1000))
+
+
+class TestProfilerEndpoints:
+    """X-Profile によるプロファイルと /api/admin/profiles のテスト"""
+
+    def test_profiled_request_is_stored(self, authenticated_client, admin_token):
+        """X-Profile を付けたリクエストのプロファイルを取得できることをテスト"""
+        response = authenticated_client.get(
+            f"{TestConstants.CHAT_BASE}/history", headers={"X-Profile": admin_token}
+        )
+        assert response.status_code == 200
+        profile_id = response.headers["x-profile-id"]
+
+        admin = {"X-Admin-Token": admin_token}
+        listing = authenticated_client.get(f"{ADMIN_BASE}/profiles", headers=admin)
+        assert listing.status_code == 200
+        stored = listing.json()["profiles"][0]
+        assert str(stored["id"]) == profile_id
+        assert stored["path"] == f"{TestConstants.CHAT_BASE}/history"
+
+        profile = authenticated_client.get(
+            f"{ADMIN_BASE}/profiles/{profile_id}", headers=admin
+        )
+        assert profile.status_code == 200
+        assert profile.headers["content-type"].startswith("text/plain")
+
+    def test_requests_are_not_profiled_by_default(self, authenticated_client):
+        """ADMIN_TOKEN 未設定・抽出率 0 ではプロファイルしないことをテスト"""
+        response = authenticated_client.get(
+            f"{TestConstants.CHAT_BASE}/history", headers={"X-Profile": "anything"}
+        )
+        assert "x-profile-id" not in response.headers
+
+    def test_admin_token_required(self, test_client, admin_token):
+        """管理用トークンがないと拒否されることをテスト"""
+        assert test_client.get(f"{ADMIN_BASE}/profiles").status_code == 403
+        wrong = {"X-Admin-Token": admin_token + "x"}
+        response = test_client.get(f"{ADMIN_BASE}/profiles", headers=wrong)
+        assert response.status_code == 403
+
+    def test_admin_disabled_without_token(self, test_client):
+        """ADMIN_TOKEN 未設定時は管理用エンドポイントが見えないことをテスト"""
+        response = test_client.get(
+            f"{ADMIN_BASE}/profiles", headers={"X-Admin-Token": ""}
+        )
+        assert response.status_code == 404
+
+
+class TestSampler:
+    """サンプラーのテスト"""
+
+    def test_samples_threadpool_work(self):
+        """スレッドプールで実行中の処理が collapsed stack に現れることをテスト"""
+        sampler = Sampler()
+        profile = sampler.start("GET", "/sync", threading.get_ident())
+        worker = threading.Thread(
+            target=_busy_handler, args=(0.2,), name="AnyIO worker thread"
+        )
+        worker.start()
+        worker.join()
+        sampler.stop(profile)
+
+        stacks = profile.collapsed().splitlines()
+        assert stacks
+        busy = [line for line in stacks if "_busy_handler" in line]
+        assert busy
+        assert all(line.startswith("threadpool;") for line in busy)
+        assert sampler.get(profile.id) is profile
@@ -0,0 +1,53 @@
+"""SQL profiling tests."""
+
+import json
+import logging
+
+import pytest
+from app.utils import query_profiler
+from app.utils.query_profiler import instrument_queries, normalize_sql
+
+from tests.fixtures.test_data import TestConstants
+
+
+@pytest.fixture(autouse=True)
+def _instrumented(test_engine):
+    instrument_queries(test_engine)
+
+
+class TestQueryProfiler:
+    """リクエストごとの SQL プロファイルのテスト"""
+
+    def test_server_timing_when_debug(self, authenticated_client, monkeypatch):
+        """DEBUG 時はクエリ件数と合計時間が Server-Timing に出ることをテスト"""
+        monkeypatch.setattr(query_profiler, "DEBUG", True)
+        response = authenticated_client.get(f"{TestConstants.USERS_BASE}/me")
+        assert response.status_code == 200
+        timing = response.headers["server-timing"]
+        assert timing.startswith("db;dur=")
+        count = int(timing.split('desc="')[1].split(" ")[0])
+        assert count >= 1
+
+    def test_no_header_without_debug(self, authenticated_client, monkeypatch):
+        """DEBUG でなければ Server-Timing を付けないことをテスト"""
+        monkeypatch.setattr(query_profiler, "DEBUG", False)
+        response = authenticated_client.get(f"{TestConstants.USERS_BASE}/me")
+        assert "server-timing" not in response.headers
+
+    def test_slow_query_log(self, authenticated_client, monkeypatch, caplog):
+        """閾値を超えたクエリが正規化した SQL と呼び出し元付きで記録されることをテスト"""
+        monkeypatch.setattr(query_profiler, "SLOW_QUERY_THRESHOLD_MS", 0)
+        with caplog.at_level(logging.WARNING, logger="app.sql.slow"):
+            authenticated_client.get(f"{TestConstants.CHAT_BASE}/history")
+
+        records = [json.loads(r.getMessage()) for r in caplog.records]
+        assert records
+        assert all(r["event"] == "slow_query" for r in records)
+        assert any(r["call_site"].startswith("app/repositories/") for r in records)
+
+    def test_normalize_sql(self):
+        """リテラルと IN のリストがまとめられることをテスト"""
+        sql = "SELECT *\n  FROM t WHERE a = 'x''y' AND b IN (1, 2, 3) LIMIT 10"
+        assert (
+            normalize_sql(sql) == "SELECT * FROM t WHERE a = ? AND b IN (?...) LIMIT ?"
+        )
@@ -0,0 +1,214 @@
+"""Rate limiting tests."""
+
+import pytest
+from app.services import rate_limit
+from app.utils.rate_limit import (
+    LocalStore,
+    MemoryBackend,
+    RateLimit,
+    StoreBackend,
+    sliding_window,
+    token_bucket,
+)
+
+from tests.fixtures.test_data import DEFAULT_TEST_PASSWORD, TestConstants
+
+FORGOT_URL = f"{TestConstants.AUTH_BASE}/forgot-password"
+SIGNIN_URL = f"{TestConstants.AUTH_BASE}/signin"
+
+
+class TestRateLimitedEndpoints:
+    """エンドポイントのレート制限のテスト"""
+
+    def test_forgot_password_is_limited_per_email(self, test_client):
+        """同じメールアドレスへの要求が上限を超えると 429 になることをテスト"""
+        data = {"email": "victim@example.com"}
+        for _ in range(3):
+            assert test_client.post(FORGOT_URL, json=data).status_code == 200
+
+        response = test_client.post(FORGOT_URL, json=data)
+        assert response.status_code == 429
+        assert int(response.headers["retry-after"]) >= 1
+
+        other = test_client.post(FORGOT_URL, json={"email": "other@example.com"})
+        assert other.status_code == 200
+
+    def test_signin_is_limited_per_email_and_ip(
+        self, test_client, test_user, monkeypatch
+    ):
+        """同じ IP からのサインインの失敗は制限し、他の IP からは通すことをテスト"""
+        monkeypatch.setattr(rate_limit, "RATE_LIMIT_TRUST_FORWARDED", True)
+        monkeypatch.setitem(
+            rate_limit.RULES, "signin_email", RateLimit("signin_email", 2, 300)
+        )
+
+        def sign_in(password: str, ip: str) -> int:
+            response = test_client.post(
+                SIGNIN_URL,
+                data={"username": test_user.email, "password": password},
+                headers={"X-Forwarded-For": ip},
+            )
+            return response.status_code
+
+        for _ in range(2):
+            assert sign_in("wrong_password", "203.0.113.1") == 401
+        assert sign_in("wrong_password", "203.0.113.1") == 429
+
+        # 攻撃者の失敗で本人（別の IP）がサインインできなくなることはない
+        assert sign_in(DEFAULT_TEST_PASSWORD, "198.51.100.7") == 200
+
+    def test_signin_counts_only_failures(self, test_client, test_user, monkeypatch):
+        """成功したサインインは（メールアドレス, IP）の上限に数えないことをテスト"""
+        monkeypatch.setitem(
+            rate_limit.RULES, "signin_email", RateLimit("signin_email", 2, 300)
+        )
+
+        def sign_in(password: str) -> int:
+            response = test_client.post(
+                SIGNIN_URL, data={"username": test_user.email, "password": password}
+            )
+            return response.status_code
+
+        for _ in range(3):
+            assert sign_in(DEFAULT_TEST_PASSWORD) == 200
+        assert sign_in("wrong_password") == 401
+        assert sign_in(DEFAULT_TEST_PASSWORD) == 200
+        assert sign_in("wrong_password") == 401
+        # 上限に達した後は正しいパスワードでも検証せずに断る
+        assert sign_in(DEFAULT_TEST_PASSWORD) == 429
+
+    @pytest.mark.usefixtures("mock_llm")
+    def test_chat_is_limited_per_user(self, authenticated_client, monkeypatch):
+        """ユーザごとのトークンバケツを使い切ると 429 になることをテスト"""
+        monkeypatch.setitem(
+            rate_limit.RULES,
+            "chat_user",
+            RateLimit("chat_user", 2, 60, "token_bucket"),
+        )
+        for _ in range(2):
+            response = authenticated_client.post(
+                TestConstants.CHAT_BASE, json={"prompt": "hello"}
+            )
+            assert response.status_code == 200
+
+        response = authenticated_client.post(
+            TestConstants.CHAT_BASE, json={"prompt": "hello"}
+        )
+        assert response.status_code == 429
+        assert response.headers["retry-after"] == "30"
+
+    def test_disabled_rule(self, test_client, monkeypatch):
+        """上限 0 のルールは制限しないことをテスト"""
+        monkeypatch.setitem(
+            rate_limit.RULES,
+            "forgot_password_email",
+            RateLimit("forgot_password_email", 0, 60),
+        )
+        for _ in range(5):
+            response = test_client.post(FORGOT_URL, json={"email": "a@example.com"})
+            assert response.status_code == 200
+
+
+class TestAlgorithms:
+    """アルゴリズムのテスト"""
+
+    def test_sliding_window_weighs_previous_window(self):
+        """直前の窓の件数を経過割合で按分して数えることをテスト"""
+        state = None
+        for _ in range(10):
+            state, retry_after = sliding_window(state, 5.0, 10, 10)
+            assert retry_after == 0
+        state, retry_after = sliding_window(state, 9.0, 10, 10)
+        assert retry_after == pytest.approx(1.0)
+
+        # 次の窓の半分の時点では、直前の窓の 10 件を 5 件と数える
+        for _ in range(5):
+            state, retry_after = sliding_window(state, 15.0, 10, 10)
+            assert retry_after == 0
+        state, retry_after = sliding_window(state, 15.0, 10, 10)
+        assert retry_after == pytest.approx(1.0)
+
+        # 2窓以上空くと数え直す
+        state, retry_after = sliding_window(state, 40.0, 10, 10)
+        assert retry_after == 0
+        assert state == (40.0, 1.0, 0.0)
+
+    def test_token_bucket_refills(self):
+        """容量まで許し、補充の速さで回復することをテスト"""
+        state = None
+        for _ in range(3):
+            state, retry_after = token_bucket(state, 0.0, 3, 30)
+            assert retry_after == 0
+        state, retry_after = token_bucket(state, 0.0, 3, 30)
+        assert retry_after == pytest.approx(10.0)
+
+        state, retry_after = token_bucket(state, 10.0, 3, 30)
+        assert retry_after == 0
+
+
+class TestBackends:
+    """状態の保存先のテスト"""
+
+    RULE = RateLimit("test", 2, 60)
+
+    def test_memory_backend_evicts_least_recent_keys(self):
+        """キーの数が上限を超えると古いものから捨てることをテスト"""
+        backend = MemoryBackend(max_keys=2)
+        for key in ("a", "b", "a", "c"):
+            backend.hit(key, self.RULE, now=0.0)
+
+        assert len(backend) == 2
+        assert backend.hit("a", self.RULE, now=0.0) > 0
+        assert backend.hit("b", self.RULE, now=0.0) == 0
+
+    def test_memory_backend_keeps_limited_keys(self):
+        """制限中のキーは新しいキーが増えても捨てないことをテスト"""
+        backend = MemoryBackend(max_keys=2)
+        for _ in range(3):
+            backend.hit("attacker", self.RULE, now=0.0)
+        for key in ("a", "b", "c"):
+            backend.hit(key, self.RULE, now=1.0)
+
+        assert len(backend) == 2
+        assert backend.hit("attacker", self.RULE, now=1.0) > 0
+
+        # 制限が解けたキーは制限中でないキーより先に捨てる
+        backend.hit("d", self.RULE, now=61.0)
+        assert set(backend._states) == {"c", "d"}
+
+    def test_peek_does_not_count(self):
+        """peek は数えずに次の1件の判定だけを返すことをテスト"""
+        for backend in (MemoryBackend(), StoreBackend(LocalStore())):
+            for _ in range(3):
+                assert backend.peek("k", self.RULE, now=0.0) == 0
+            backend.hit("k", self.RULE, now=0.0)
+            backend.hit("k", self.RULE, now=0.0)
+            assert backend.peek("k", self.RULE, now=0.0) > 0
+
+    def test_store_backend_matches_memory_backend(self):
+        """共有ストア経由でも同じ判定になることをテスト"""
+        memory = MemoryBackend()
+        store = StoreBackend(LocalStore())
+        for now in (0.0, 1.0, 2.0, 61.0, 62.0, 63.0):
+            assert store.hit("k", self.RULE, now) == memory.hit("k", self.RULE, now)
+
+    def test_store_backend_retries_on_conflict(self):
+        """他のワーカーが先に更新した場合は読み直すことをテスト"""
+        local = LocalStore()
+
+        class RacingStore:
+            raced = False
+
+            def get(self, key):
+                return local.get(key)
+
+            def compare_and_set(self, key, expected, value, ttl):
+                if not self.raced:
+                    # 読み取り後に別のワーカーが1件数えた
+                    self.raced = True
+                    StoreBackend(local).hit(key, TestBackends.RULE, 0.0)
+                return local.compare_and_set(key, expected, value, ttl)
+
+        backend = StoreBackend(RacingStore())
+        assert backend.hit("k", self.RULE, 0.0) == 0
+        assert backend.hit("k", self.RULE, 0.0) > 0
@@ -27,6 +27,31 @@ class TestUsersEndpoints:
         assert user_data["name"] == authenticated_user.name
         assert user_data["uuid"] == str(authenticated_user.uuid)
 
+    def test_me_schema_allows_missing_email(self, test_client):
+        """メールアドレスの無いユーザに合わせて email が null 可と公開されることをテスト"""
+        schema = test_client.get("/openapi.json").json()
+        email = schema["components"]["schemas"]["UserModel"]["properties"]["email"]
+        assert {"type": "null"} in email["anyOf"]
+
+    def test_me_conditional_get(self, authenticated_client):
+        """If-None-Match が一致すれば 304、プロフィール更新後は 200 になることをテスト"""
+        url = f"{self.BASE_URL}/me"
+        first = authenticated_client.get(url)
+        etag = first.headers["etag"]
+        assert etag.startswith('W/"')
+        assert first.headers["cache-control"] == "private, no-cache"
+
+        cached = authenticated_client.get(url, headers={"If-None-Match": etag})
+        assert cached.status_code == 304
+        assert cached.content == b""
+        assert cached.headers["etag"] == etag
+
+        authenticated_client.put(url, json={"name": "Renamed"})
+        fresh = authenticated_client.get(url, headers={"If-None-Match": etag})
+        assert fresh.status_code == 200
+        assert fresh.json()["name"] == "Renamed"
+        assert fresh.headers["etag"] != etag
+
     def test_update_current_user_authenticated(
         self, authenticated_client, authenticated_user
     ):
@@ -1,8 +1,15 @@
 "use server";
 
 import { apiPost } from "@/utils/api";
+import { cookies } from "next/headers";
 import { NextRequest, NextResponse } from "next/server";
 
+interface PasswordChangeResponse {
+  message: string;
+  access_token: string;
+  expires_in: number;
+}
+
 export async function POST(req: NextRequest) {
   try {
     const { current_password, new_password } = await req.json();
@@ -38,6 +45,17 @@ export async function POST(req: NextRequest) {
       );
     }
 
+    // Tokens issued before the change are revoked, so keep the session on the new one
+    const { access_token, expires_in } = apiRes.data as PasswordChangeResponse;
+    const store = await cookies();
+    store.set("access_token", access_token, {
+      httpOnly: true,
+      secure: process.env.NODE_ENV === "production",
+      sameSite: "lax",
+      maxAge: expires_in,
+      path: "/",
+    });
+
     return NextResponse.json(
       { success: true, message: "Password has been successfully changed" },
       { status: 200 }
@@ -1,3 +1,4 @@
+import { apiPost } from "@/utils/api";
 import { cookies } from "next/headers";
 import { NextResponse } from "next/server";
 
@@ -5,6 +6,12 @@ export async function GET() {
   const authSystem = process.env.NEXT_PUBLIC_AUTH_SYSTEM;
 
   if (authSystem === "email_password") {
+    // Revoke the access token on the backend; the cookies are cleared either way
+    try {
+      await apiPost("/auth/logout");
+    } catch (error) {
+      console.error("Error revoking token on signout:", error);
+    }
     const store = await cookies();
     store.delete({ name: "access_token", path: "/" });
     store.delete({ name: "refresh_token", path: "/" });
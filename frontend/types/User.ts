@@ -1,5 +1,5 @@
 export type User = {
   uuid: string;
-  email: string;
+  email: string | null;
   name: string;
 }